@@ -0,0 +1 @@
+"""Gas and storage benchmarks for the typed.art contracts."""
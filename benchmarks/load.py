@@ -0,0 +1,353 @@
+"""Simulate marketplace traffic over many accounts and report its costs.
+
+Usage::
+
+    python -m benchmarks.load --accounts 1000 --ops 2000 --output load_report.json
+    python -m benchmarks.load --accounts 5000 --ops 100000 --model-only
+    python -m benchmarks.load --mix mint=10,swap=12,collect=20 --fee 25 --royalties 150
+
+FA2, TypedMinter, TypedMarket and TypedRegister are originated together in
+an ``octez-client`` mockup, wired as deployed, and driven by random calls
+drawn from ``--mix``. The reference model of :mod:`model` picks plausible
+calls (owned tokens, open swaps, exact prices) and predicts their outcome;
+calls the mockup and the model disagree on are reported as divergences.
+
+The report gives, per entry point, the number of calls, the failures by
+message and the gas percentiles of the applied calls, and every
+``--sample-every`` operations the storage size of each contract and the
+number of entries of its big maps. ``--model-only`` skips the mockup: no
+gas nor storage sizes, but big map growth and failures at model speed.
+
+The model follows the ``lean_storage``, ``live_royalties`` and ``escrow``
+switches of ``--env``; with other switches, expect divergences where they
+change the behaviour.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+from model import fuzz
+from model.chain import Failed
+from model.contracts import PAYOUT
+from model.fuzz import Call, World
+
+from .octez import Mockup, OperationFailed, Receipt, failure_message
+from .smartpy import DEFAULT_CLI, compile_targets
+from .workloads import Bench, parse_switches
+
+# Generator methods drawing the calls of --mix. ``mint`` calls mint_TYPED,
+# ``manage`` the pause, fee and royalties entry points.
+TRAFFIC = ("transfer", "burn", "update_operators", "mint", "mint_batch",
+           "swap", "collect", "collect_editions", "collect_batch",
+           "cancel_swap", "cancel_swaps", "update_price", "register",
+           "manage", "payout")
+
+DEFAULT_MIX = {
+    "mint": 10,
+    "swap": 12,
+    "collect": 15,
+    "cancel_swap": 4,
+    "transfer": 20,
+    "update_operators": 8,
+    "register": 4,
+}
+
+CONTRACTS = {"fa2": "FA2", "minter": "minter", "market": "typedmarket",
+             "register": "typedregister"}
+
+PERCENTILES = (50, 90, 99)
+
+
+class Traffic(fuzz.Generator):
+    """:class:`model.fuzz.Generator` over many accounts.
+
+    With thousands of accounts, random (account, token) pairs almost never
+    hold anything, so holders are drawn from the recent minters and
+    transfer recipients instead.
+    """
+
+    def __init__(self, world: World, rng: random.Random, mix: Dict[str, int]):
+        fuzz.Generator.__init__(self, world, rng)
+        self.ops = [(weight, getattr(self, name))
+                    for name, weight in mix.items() if weight > 0]
+        self.cumulative = list(itertools.accumulate(w for w, _ in self.ops))
+        self.recent: deque = deque(maxlen=512)
+
+    def holding(self):
+        ledger = self.world.fa2.ledger
+        for _ in range(8):
+            if not self.recent:
+                break
+            owner, token_id = self.recent[self.below(len(self.recent))]
+            balance = ledger.get((owner, token_id), 0)
+            if balance:
+                return owner, token_id, balance
+        return fuzz.Generator.holding(self)
+
+    def register(self) -> Call:
+        return Call(self.user(), "register", "register", dict(
+            name=b"user%d" % self.below(2 * len(self.world.users))))
+
+    def observe(self, call: Call, outcome: Optional[str]):
+        """Remember who received tokens from an applied ``call``."""
+        if outcome != fuzz.OK:
+            return
+        if call.entrypoint == "mint_TYPED":
+            self.recent.append((call.sender, self.world.minter.objkt_id - 1))
+        elif call.entrypoint == "transfer":
+            for _, txs in call.params:
+                self.recent.extend((to_, token_id) for to_, token_id, _ in txs)
+
+
+class MockupChain:
+    """The contracts of a :class:`~model.fuzz.World`, originated in a
+    mockup, with the world's accounts."""
+
+    def __init__(self, bench: Bench, world: World, funding: int):
+        self.bench = bench
+        names = {fuzz.ADMIN: bench.admin, PAYOUT: bench.admin}
+        names.update(bench.mockup.add_accounts(world.users, funding))
+        bench.accounts.update(names)
+        fa2 = bench.originate("load_fa2", "FA2")
+        names["fa2"] = fa2
+        names["minter"] = bench.originate("load_minter", "minter", fa2=fa2)
+        names["market"] = bench.originate("load_market", "typedmarket", fa2=fa2)
+        names["register"] = bench.originate("load_register", "typedregister")
+        self.names = names
+
+    def storage_sizes(self) -> Dict[str, int]:
+        return {name: self.bench.storage_sizes.get(self.names[name], 0)
+                for name in CONTRACTS}
+
+    def value(self, call: Call) -> Any:
+        """``call.params`` as :meth:`Bench.call` encodes them."""
+        a = self.names.get
+        p = call.params
+        ep = call.entrypoint
+        if ep == "transfer":
+            return [dict(from_=a(from_), txs=[
+                dict(to_=a(to_), token_id=token_id, amount=amount)
+                for to_, token_id, amount in txs]) for from_, txs in p]
+        if ep == "update_operators":
+            return [(kind, dict(owner=a(owner), operator=a(operator),
+                                token_id=token_id))
+                    for kind, owner, operator, token_id in p]
+        if ep == "burn":
+            return dict(p, address=a(p["address"]))
+        if ep == "swap":
+            return dict(p, fa2=a(p["fa2"]), creator=a(p["creator"]))
+        if ep == "set_administrator":
+            return a(p)
+        return p
+
+    def apply(self, call: Call) -> Receipt:
+        """Raises :class:`OperationFailed` if the call fails."""
+        return self.bench.call(call.sender, self.names[call.destination],
+                               call.entrypoint, self.value(call),
+                               amount=call.amount)
+
+
+def model_entries(world: World) -> Dict[str, int]:
+    return {
+        "fa2.ledger": len(world.fa2.ledger),
+        "fa2.operators": len(world.fa2.operators),
+        "fa2.token_metadata": len(world.fa2.token_metadata),
+        "minter.royalties": len(world.minter.royalties),
+        "market.swaps": len(world.market.swaps),
+        "register.userlist": len(world.register.userlist),
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted ``values``."""
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in TRAFFIC:
+            raise argparse.ArgumentTypeError("unknown traffic %r" % name)
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Stats:
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.failures: Dict[str, Counter] = defaultdict(Counter)
+        self.gas: Dict[str, List[float]] = defaultdict(list)
+        self.growth: List[Dict[str, Any]] = []
+        self.divergences: List[str] = []
+
+    def record(self, call: Call, outcome: Optional[str],
+               receipt: Optional[Receipt]):
+        key = "%s.%s" % (call.destination, call.entrypoint)
+        self.calls[key] += 1
+        if outcome != fuzz.OK:
+            self.failures[key][str(outcome)] += 1
+        elif receipt is not None:
+            self.gas[key].append(receipt.gas)
+
+    def entrypoints(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for key in sorted(self.calls):
+            failed = sum(self.failures[key].values())
+            entry: Dict[str, Any] = dict(calls=self.calls[key], failed=failed,
+                                         failures=dict(self.failures[key]))
+            gas = sorted(self.gas.get(key, []))
+            if gas:
+                entry["gas"] = dict(("p%d" % p, percentile(gas, p))
+                                    for p in PERCENTILES)
+                entry["gas"]["max"] = gas[-1]
+            result[key] = entry
+        return result
+
+
+def simulate(world: World, traffic: Traffic, ops: int,
+             chain: Optional[MockupChain], setup: List[Call],
+             sample_every: int) -> Stats:
+    stats = Stats()
+    calls = iter(traffic)
+
+    def sample(i):
+        point: Dict[str, Any] = dict(op=i, entries=model_entries(world))
+        if chain is not None:
+            point["storage"] = chain.storage_sizes()
+        stats.growth.append(point)
+
+    for i in range(len(setup) + ops):
+        call = setup[i] if i < len(setup) else next(calls)
+        try:
+            world.apply(call)
+            predicted = fuzz.OK
+        except Failed as e:
+            predicted = e.message
+        outcome, receipt = predicted, None
+        if chain is not None:
+            try:
+                receipt = chain.apply(call)
+                outcome = fuzz.OK
+            except OperationFailed as e:
+                outcome = failure_message(str(e))
+            if (outcome == fuzz.OK) != (predicted == fuzz.OK):
+                stats.divergences.append("op %d %s.%s by %s: model %s, mockup %s" % (
+                    i, call.destination, call.entrypoint, call.sender,
+                    predicted, outcome))
+        stats.record(call, outcome, receipt)
+        traffic.observe(call, predicted)
+        if sample_every and (i + 1) % sample_every == 0:
+            sample(i + 1)
+    sample(len(setup) + ops)
+    return stats
+
+
+def format_entrypoints(entrypoints: Dict[str, Dict[str, Any]]) -> str:
+    rows = [("entrypoint", "calls", "failed") +
+            tuple("p%d" % p for p in PERCENTILES) + ("max",)]
+    for key, entry in entrypoints.items():
+        gas = entry.get("gas", {})
+        rows.append((key, str(entry["calls"]), str(entry["failed"])) + tuple(
+            "%.0f" % gas[name] if name in gas else "-"
+            for name in ["p%d" % p for p in PERCENTILES] + ["max"]))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(row, widths))
+                     for row in rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="comma separated name=weight, names among %s "
+                             "(default: %s)" % (", ".join(TRAFFIC), ",".join(
+                                 "%s=%d" % item for item in DEFAULT_MIX.items())))
+    parser.add_argument("--fee", type=int, default=None,
+                        help="market fee set before the traffic, in per mille")
+    parser.add_argument("--royalties", type=int, default=None,
+                        help="market royalties set before the traffic")
+    parser.add_argument("--sample-every", type=int, default=100,
+                        help="operations between two storage samples")
+    parser.add_argument("--funding", type=int, default=100000000,
+                        help="mutez given to each account (default: %(default)s)")
+    parser.add_argument("--model-only", action="store_true",
+                        help="only run the reference model")
+    parser.add_argument("--smartpy", default=DEFAULT_CLI)
+    parser.add_argument("--octez-client", default="octez-client")
+    parser.add_argument("--protocol", default=None)
+    parser.add_argument("--env", action="append", default=[],
+                        metavar="NAME=VALUE",
+                        help="environment variable for the SmartPy "
+                             "compilation, e.g. lean_storage=true")
+    parser.add_argument("--output", default="load_report.json")
+    return parser.parse_args(argv)
+
+
+def run(args) -> Dict[str, Any]:
+    env = dict(item.split("=", 1) for item in args.env)
+    switches = parse_switches(env)
+    world = World(lean_storage=switches.get("lean_storage", False),
+                  escrow=switches.get("escrow", True),
+                  live_royalties=switches.get("live_royalties", False),
+                  users=["user%d" % i for i in range(args.accounts)])
+    traffic = Traffic(world, random.Random(args.seed), args.mix)
+    setup = world.setup()
+    if args.fee is not None:
+        setup.append(Call(fuzz.ADMIN, "market", "update_fee", args.fee))
+    if args.royalties is not None:
+        setup.append(Call(fuzz.ADMIN, "market", "update_royalties", args.royalties))
+    start = time.perf_counter()
+    if args.model_only:
+        stats = simulate(world, traffic, args.ops, None, setup, args.sample_every)
+    else:
+        with tempfile.TemporaryDirectory(prefix="typed-load-") as tmp:
+            contracts = compile_targets(os.path.join(tmp, "build"),
+                                        cli=args.smartpy, env=env)
+            mockup = Mockup(os.path.join(tmp, "mockup"),
+                            client=args.octez_client, protocol=args.protocol)
+            bench = Bench(mockup, contracts, switches=switches)
+            chain = MockupChain(bench, world, args.funding)
+            stats = simulate(world, traffic, args.ops, chain, setup,
+                             args.sample_every)
+    return dict(accounts=args.accounts, ops=args.ops, seed=args.seed,
+                mix=args.mix, env=env, model_only=args.model_only,
+                seconds=round(time.perf_counter() - start, 1),
+                entrypoints=stats.entrypoints(), growth=stats.growth,
+                divergences=stats.divergences)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(format_entrypoints(report["entrypoints"]))
+    last = report["growth"][-1]
+    print("after %d operations: %s" % (last["op"], ", ".join(
+        "%s %d" % item for item in sorted(last["entries"].items()))))
+    if "storage" in last:
+        print("storage bytes: %s" % ", ".join(
+            "%s %d" % item for item in sorted(last["storage"].items())))
+    for divergence in report["divergences"][:20]:
+        print("DIVERGENCE " + divergence, file=sys.stderr)
+    sys.exit(1 if report["divergences"] else 0)
+
+
+if __name__ == "__main__":
+    main()
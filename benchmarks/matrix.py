@@ -0,0 +1,207 @@
+"""Compile every valid FA2_config variant and compare their costs.
+
+Usage::
+
+    python -m benchmarks.matrix --jobs 8 --output fa2_matrix.json
+    python -m benchmarks.matrix --switches lean_storage,nft_ledger,non_fungible --gas
+
+For each combination of the :data:`MATRIX_SWITCHES` (or ``--switches``),
+the others keeping their ``environment_config()`` default or their
+``--fix`` value, the FA2 target is compiled with the SmartPy CLI and the report gives:
+
+* ``code_size`` and ``storage_type_size``: bytes of the binary encoding;
+* ``origination_bytes`` and ``origination_burn``: estimated from the code
+  and initial storage sizes, or measured in a mockup with ``--gas``;
+* with ``--gas``, the gas of every entry point for the fixed FA2 workload
+  of :mod:`benchmarks.workloads` at ``--size`` items.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from .octez import Mockup, OperationFailed
+from .smartpy import (DEFAULT_CLI, ROOT, CompilationFailed, compile_script,
+                      load_target)
+from .workloads import Bench, fa2_workload
+
+FA2_SCRIPT = "contracts/fa2_v1.py"
+
+# Bytes burnt for allocating a new contract, on top of its storage.
+ORIGINATION_SIZE = 257
+
+# Switches that change the storage or the code paths of the entry points.
+# debug_mode, readable, force_layouts and the optional entry points keep
+# their default unless given to --switches or --fix.
+MATRIX_SWITCHES = ("non_fungible", "assume_consecutive_token_ids",
+                   "lazy_entry_points", "lazy_entry_points_multiple",
+                   "lean_storage", "compact_metadata", "operator_for_all",
+                   "nft_ledger", "track_total_supply")
+
+# Combinations FA2_config rejects or that cannot hold more than one token.
+CONSTRAINTS = [
+    lambda s: not (s["lazy_entry_points"] and s["lazy_entry_points_multiple"]),
+    lambda s: not (s["single_asset"] and s["non_fungible"]),
+    lambda s: not (s["operator_for_all"] and not s["support_operator"]),
+    lambda s: not (s["nft_ledger"] and not s["non_fungible"]),
+]
+
+
+def switches(script: str = FA2_SCRIPT) -> List[Tuple[str, bool]]:
+    """The (name, default) switches read by ``environment_config()``."""
+    with open(os.path.join(ROOT, script)) as f:
+        source = f.read()
+    body = source[source.index("def environment_config"):]
+    return [(name, default == "True") for name, default in re.findall(
+        r'global_parameter\("(\w+)", (True|False)\)', body)]
+
+
+def variants(fixed: Dict[str, bool],
+             varied: Sequence[str] = MATRIX_SWITCHES) -> Iterator[Dict[str, bool]]:
+    defaults = dict(switches())
+    names = list(defaults)
+    free = [name for name in varied if name not in fixed]
+    pinned = dict(defaults, **fixed)
+    for values in itertools.product((False, True), repeat=len(free)):
+        variant = dict(pinned, **dict(zip(free, values)))
+        if all(check(variant) for check in CONSTRAINTS):
+            yield {name: variant[name] for name in names}
+
+
+def variant_name(variant: Dict[str, bool]) -> str:
+    defaults = dict(switches())
+    changed = ["%s%s" % ("+" if value else "-", name)
+               for name, value in variant.items() if value != defaults[name]]
+    return " ".join(changed) or "default"
+
+
+def env_of(variant: Dict[str, bool]) -> Dict[str, str]:
+    return {name: "true" if value else "false"
+            for name, value in variant.items()}
+
+
+def measure_sizes(variant, output_dir, cli, cost_per_byte):
+    compile_script(FA2_SCRIPT, output_dir, cli=cli, env=env_of(variant))
+    contract = load_target(output_dir, "FA2")
+    origination = contract.code_size() + contract.initial_storage_size()
+    return contract, dict(
+        name=variant_name(variant),
+        switches=variant,
+        entrypoints=contract.entrypoints(),
+        code_size=contract.code_size(),
+        storage_type_size=contract.storage_type_size(),
+        origination_bytes=origination,
+        origination_burn=(origination + ORIGINATION_SIZE) * cost_per_byte)
+
+
+def measure_gas(result, contract, mockup_dir, client, protocol, size,
+                cost_per_byte):
+    mockup = Mockup(mockup_dir, client=client, protocol=protocol)
+    bench = Bench(mockup, {"FA2": contract}, switches=result["switches"])
+    fa2_workload(bench, [size])
+    paid = bench.originations["bench_fa2"].paid_storage_diff
+    result["origination_bytes"] = paid
+    result["origination_burn"] = (paid + ORIGINATION_SIZE) * cost_per_byte
+    result["gas"] = {m.entrypoint: m.gas for m in bench.measurements}
+    result["gas_total"] = round(sum(result["gas"].values()), 3)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.matrix",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--smartpy", default=DEFAULT_CLI)
+    parser.add_argument("--octez-client", default="octez-client")
+    parser.add_argument("--protocol", default=None)
+    parser.add_argument("--switches", default=",".join(MATRIX_SWITCHES),
+                        help="comma separated switches to combine "
+                             "(default: %(default)s)")
+    parser.add_argument("--fix", action="append", default=[],
+                        metavar="NAME=true|false",
+                        help="only build variants with this switch value")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--gas", action="store_true",
+                        help="also originate each variant in a mockup and "
+                             "run the fixed workload")
+    parser.add_argument("--size", type=int, default=10,
+                        help="batch size of the fixed workload")
+    parser.add_argument("--cost-per-byte", type=int, default=250,
+                        help="storage burn in mutez per byte")
+    parser.add_argument("--sort", default="origination_burn",
+                        choices=["code_size", "storage_type_size",
+                                 "origination_burn", "gas_total"])
+    parser.add_argument("--output", default="fa2_matrix.json")
+    return parser.parse_args(argv)
+
+
+def run(args) -> int:
+    known = dict(switches())
+    fixed = {}
+    for item in args.fix:
+        name, value = item.split("=", 1)
+        if name not in known:
+            sys.exit("unknown switch %r, expected one of: %s"
+                     % (name, ", ".join(known)))
+        fixed[name] = value == "true"
+    varied = [name for name in args.switches.split(",") if name]
+    for name in varied:
+        if name not in known:
+            sys.exit("unknown switch %r, expected one of: %s"
+                     % (name, ", ".join(known)))
+    todo = list(variants(fixed, varied))
+    if args.gas and args.sort == "origination_burn":
+        args.sort = "gas_total"
+    print("%d variants" % len(todo), file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix="typed-matrix-") as tmp:
+        def build(indexed):
+            i, variant = indexed
+            out = os.path.join(tmp, str(i))
+            try:
+                contract, result = measure_sizes(
+                    variant, os.path.join(out, "build"), args.smartpy,
+                    args.cost_per_byte)
+                if args.gas:
+                    measure_gas(result, contract, os.path.join(out, "mockup"),
+                                args.octez_client, args.protocol, args.size,
+                                args.cost_per_byte)
+            except (CompilationFailed, OperationFailed) as e:
+                print("failed %s" % variant_name(variant), file=sys.stderr)
+                return dict(name=variant_name(variant), switches=variant,
+                            error=str(e))
+            print("built %s" % result["name"], file=sys.stderr)
+            return result
+
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            built = list(pool.map(build, enumerate(todo)))
+
+    failed = [r for r in built if "error" in r]
+    results = sorted((r for r in built if "error" not in r),
+                     key=lambda r: r.get(args.sort, 0))
+    with open(args.output, "w") as f:
+        json.dump(dict(sort=args.sort, size=args.size, results=results,
+                       failed=failed), f, indent=2)
+        f.write("\n")
+    for r in results[:20]:
+        print("%10s  code %6d  storage type %5d  origination %8d mutez  %s" % (
+            r.get("gas_total", "-"), r["code_size"], r["storage_type_size"],
+            r["origination_burn"], r["name"]))
+    if failed:
+        print("%d variants failed, see %s" % (len(failed), args.output),
+              file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
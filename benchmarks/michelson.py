@@ -0,0 +1,219 @@
+"""Encode Python values as Michelson expressions for a compiled parameter type.
+
+Parameters are laid out by walking the Micheline JSON type emitted by the
+SmartPy compiler and matching its field annotations, so the workloads do not
+have to know the record layouts chosen by each contract configuration.
+
+Value conventions:
+
+* records are ``dict`` keyed by field name, tuples are ``tuple``;
+  single field records may be given as a ``dict`` or as their value;
+* variants are ``(case_name, payload)`` pairs;
+* lists and sets are ``list``, maps and big maps are ``dict``;
+* bytes are ``bytes``, addresses and strings are ``str``;
+* lambdas (and any value given verbatim) are wrapped in :class:`Raw`.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+class Raw(str):
+    """A Michelson expression inserted as is."""
+
+
+class EncodingError(Exception):
+    pass
+
+
+def field_name(ty: Dict[str, Any]) -> Optional[str]:
+    for annot in ty.get("annots", []):
+        if annot.startswith("%"):
+            return annot[1:]
+    return None
+
+
+def load_contract(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def section(contract: List[Dict[str, Any]], prim: str) -> Dict[str, Any]:
+    for item in contract:
+        if item.get("prim") == prim:
+            return item["args"][0]
+    raise EncodingError("no %s section" % prim)
+
+
+def entrypoint_type(parameter: Dict[str, Any], entrypoint: str) -> Dict[str, Any]:
+    """Return the type of ``entrypoint`` inside a parameter type."""
+    if field_name(parameter) == entrypoint:
+        return parameter
+    if parameter["prim"] == "or":
+        for arg in parameter["args"]:
+            try:
+                return entrypoint_type(arg, entrypoint)
+            except EncodingError:
+                pass
+    elif entrypoint == "default":
+        return parameter
+    raise EncodingError("unknown entrypoint %r" % entrypoint)
+
+
+def entrypoints(parameter: Dict[str, Any]) -> List[str]:
+    name = field_name(parameter)
+    if name is not None:
+        return [name]
+    if parameter["prim"] == "or":
+        return [ep for arg in parameter["args"] for ep in entrypoints(arg)]
+    return []
+
+
+def _paren(expr: str) -> str:
+    return "(%s)" % expr if " " in expr and expr[0] not in "{(\"" else expr
+
+
+def _encode_pair(ty: Dict[str, Any], value: Any) -> str:
+    if isinstance(value, dict):
+        def encode_arg(arg):
+            name = field_name(arg)
+            if name is not None:
+                if name not in value:
+                    raise EncodingError("missing field %r" % name)
+                return encode(arg, value[name])
+            if arg["prim"] == "pair":
+                return _encode_pair(arg, value)
+            raise EncodingError("unannotated field in record %r" % arg)
+        args = [encode_arg(arg) for arg in ty["args"]]
+    else:
+        values = list(value)
+        if len(values) != len(ty["args"]):
+            # A flat tuple for a right comb: (a, b, c) for pair a (pair b c).
+            head, rest = ty["args"][:-1], ty["args"][-1]
+            args = [encode(arg, v) for arg, v in zip(head, values)]
+            args.append(_encode_pair(rest, values[len(head):]))
+        else:
+            args = [encode(arg, v) for arg, v in zip(ty["args"], values)]
+    return "Pair %s" % " ".join(_paren(a) for a in args)
+
+
+def _variant_path(ty: Dict[str, Any], case: str) -> Optional[List[str]]:
+    if field_name(ty) == case:
+        return []
+    if ty["prim"] != "or":
+        return None
+    for side, arg in zip(("Left", "Right"), ty["args"]):
+        path = _variant_path(arg, case)
+        if path is not None:
+            return [side] + path
+    return None
+
+
+def encode(ty: Dict[str, Any], value: Any) -> str:
+    """Encode ``value`` as a Michelson expression of type ``ty``."""
+    if isinstance(value, Raw):
+        return str(value)
+    prim = ty["prim"]
+    if isinstance(value, dict) and len(value) == 1 and \
+            prim not in ("pair", "map", "big_map"):
+        # Single field records compile to their field.
+        (value,) = value.values()
+    if prim in ("nat", "int", "mutez"):
+        return str(int(value))
+    if prim in ("string", "address", "key_hash", "key", "signature",
+                "timestamp", "chain_id", "contract"):
+        return json.dumps(value)
+    if prim == "bytes":
+        return "0x" + (value.hex() if isinstance(value, bytes) else value)
+    if prim == "bool":
+        return "True" if value else "False"
+    if prim == "unit":
+        return "Unit"
+    if prim == "option":
+        if value is None:
+            return "None"
+        return "Some %s" % _paren(encode(ty["args"][0], value))
+    if prim in ("list", "set"):
+        return "{ %s }" % " ; ".join(encode(ty["args"][0], v) for v in value)
+    if prim in ("map", "big_map"):
+        kt, vt = ty["args"]
+        return "{ %s }" % " ; ".join(
+            "Elt %s %s" % (_paren(encode(kt, k)), _paren(encode(vt, value[k])))
+            for k in sorted(value))
+    if prim == "pair":
+        return _encode_pair(ty, value)
+    if prim == "or":
+        case, payload = value
+        path = _variant_path(ty, case)
+        if path is None:
+            raise EncodingError("unknown variant case %r" % case)
+        leaf = ty
+        for side in path:
+            leaf = leaf["args"][0 if side == "Left" else 1]
+        expr = encode(leaf, payload)
+        for side in reversed(path):
+            expr = "%s %s" % (side, _paren(expr))
+        return expr
+    raise EncodingError("cannot encode values of type %s" % prim)
+
+
+def _zarith_size(n: int) -> int:
+    bits = abs(n).bit_length()
+    return 1 if bits <= 6 else 1 + -(-(bits - 6) // 7)
+
+
+def micheline_size(expr: Any) -> int:
+    """Size in bytes of a Micheline JSON expression in binary encoding."""
+    if isinstance(expr, list):
+        return 5 + sum(micheline_size(e) for e in expr)
+    if "int" in expr:
+        return 1 + _zarith_size(int(expr["int"]))
+    if "string" in expr:
+        return 5 + len(expr["string"].encode())
+    if "bytes" in expr:
+        return 5 + len(expr["bytes"]) // 2
+    args = expr.get("args", [])
+    annots = expr.get("annots", [])
+    size = 2 + sum(micheline_size(a) for a in args)
+    if len(args) > 2:
+        # Generic application: length prefixed arguments, annotations field.
+        return size + 4 + 4 + len(" ".join(annots).encode())
+    if annots:
+        size += 4 + len(" ".join(annots).encode())
+    return size
+
+
+class Contract:
+    """The compiled Michelson of a contract and its parameter encoder."""
+
+    def __init__(self, code_path: str, json_path: str, storage_path: str):
+        self.code_path = code_path
+        self.storage_path = storage_path
+        self.micheline = load_contract(json_path)
+        self.parameter = section(self.micheline, "parameter")
+        self.storage_json_path = json_path.replace("_contract.json",
+                                                   "_storage.json")
+
+    def entrypoints(self) -> List[str]:
+        return entrypoints(self.parameter)
+
+    def encode(self, entrypoint: str, value: Any) -> str:
+        return encode(entrypoint_type(self.parameter, entrypoint), value)
+
+    def code_size(self) -> int:
+        return micheline_size(self.micheline)
+
+    def storage_type_size(self) -> int:
+        return micheline_size(section(self.micheline, "storage"))
+
+    def initial_storage_size(self) -> int:
+        return micheline_size(load_contract(self.storage_json_path))
+
+    def initial_storage(self, substitutions: Dict[str, str]) -> str:
+        with open(self.storage_path) as f:
+            storage = f.read().strip()
+        for old, new in substitutions.items():
+            storage = storage.replace('"%s"' % old, '"%s"' % new)
+        return storage
@@ -0,0 +1,164 @@
+"""Run operations in an ``octez-client`` mockup and read their receipts."""
+
+from __future__ import annotations
+
+import json
+import re
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+class OperationFailed(Exception):
+    pass
+
+
+ADDRESS = r"(?:tz[1-4]|KT1)[1-9A-HJ-NP-Za-km-z]{33}"
+_TO = re.compile(r"^\s*To: (%s)" % ADDRESS)
+_ORIGINATED = re.compile(r"^\s*(KT1[1-9A-HJ-NP-Za-km-z]{33})\s*$")
+_STORAGE_SIZE = re.compile(r"^\s*Storage size: (\d+) bytes")
+_PAID_DIFF = re.compile(r"^\s*Paid storage size diff: (-?\d+) bytes")
+_GAS = re.compile(r"^\s*Consumed gas: ([\d.]+)")
+_INTERNAL = re.compile(r"^\s*Internal (Transaction|Event|Origination|Delegation)")
+_KNOWN_ADDRESS = re.compile(r"^(\w+): (%s)" % ADDRESS)
+_FAILWITH = re.compile(r'FAILWITH instruction\s+with\s+"((?:[^"\\]|\\.)*)"')
+
+
+@dataclass
+class Receipt:
+    """What an applied operation cost, as reported by the client.
+
+    ``storage_diff`` is the storage size change of the called contract; it
+    is filled in by callers that know the size before the operation.
+    """
+
+    gas: float = 0.0
+    paid_storage_diff: int = 0
+    internal_operations: int = 0
+    storage_sizes: Dict[str, int] = field(default_factory=dict)
+    originated: List[str] = field(default_factory=list)
+    storage_diff: int = 0
+
+    @staticmethod
+    def parse(output: str) -> "Receipt":
+        receipt = Receipt()
+        current: Optional[str] = None
+        in_originated = False
+        for line in output.splitlines():
+            if "Originated contracts:" in line:
+                in_originated = True
+                continue
+            m = _ORIGINATED.match(line)
+            if in_originated and m:
+                current = m.group(1)
+                receipt.originated.append(current)
+                continue
+            in_originated = False
+            m = _TO.match(line)
+            if m:
+                current = m.group(1)
+                continue
+            m = _STORAGE_SIZE.match(line)
+            if m and current is not None:
+                receipt.storage_sizes[current] = int(m.group(1))
+                continue
+            m = _PAID_DIFF.match(line)
+            if m:
+                receipt.paid_storage_diff += int(m.group(1))
+                continue
+            m = _GAS.match(line)
+            if m:
+                receipt.gas += float(m.group(1))
+                continue
+            if _INTERNAL.match(line):
+                receipt.internal_operations += 1
+        return receipt
+
+
+def format_tez(mutez: int) -> str:
+    return "%d.%06d" % divmod(mutez, 1000000)
+
+
+def failure_message(error: str) -> str:
+    """The string a failed operation reached FAILWITH with, or the first
+    line of the client error."""
+    m = _FAILWITH.search(error)
+    if m:
+        return m.group(1)
+    return error.strip().splitlines()[0] if error.strip() else "failed"
+
+
+class Mockup:
+    """A throw-away mockup chain living in ``base_dir``."""
+
+    def __init__(self, base_dir: str, client: str = "octez-client",
+                 protocol: Optional[str] = None, burn_cap: str = "100"):
+        self.base_dir = base_dir
+        self.client = client
+        self.burn_cap = burn_cap
+        args = ["create", "mockup"]
+        if protocol is not None:
+            args += ["--protocol", protocol]
+        self.run(*args)
+
+    def run(self, *args: str) -> str:
+        proc = subprocess.run([self.client, "--mode", "mockup",
+                               "--base-dir", self.base_dir, *args],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+        if proc.returncode != 0:
+            raise OperationFailed(proc.stderr.strip() or proc.stdout.strip())
+        return proc.stdout
+
+    def accounts(self) -> Dict[str, str]:
+        """Map the aliases known to the client to their addresses."""
+        known = {}
+        for line in self.run("list", "known", "addresses").splitlines():
+            m = _KNOWN_ADDRESS.match(line)
+            if m:
+                known[m.group(1)] = m.group(2)
+        return known
+
+    def add_account(self, alias: str, funding_mutez: int,
+                    source: str = "bootstrap1") -> str:
+        self.run("gen", "keys", alias, "--force")
+        self.run("transfer", format_tez(funding_mutez), "from", source, "to",
+                 alias, "--burn-cap", self.burn_cap)
+        return self.run("show", "address", alias).split("Hash: ")[1].split()[0]
+
+    def add_accounts(self, aliases: List[str], funding_mutez: int,
+                     source: str = "bootstrap1",
+                     batch_size: int = 100) -> Dict[str, str]:
+        """Create ``aliases`` and fund them with ``batch_size`` transfers
+        per operation."""
+        addresses = {}
+        for alias in aliases:
+            self.run("gen", "keys", alias, "--force")
+            addresses[alias] = self.run("show", "address", alias).split(
+                "Hash: ")[1].split()[0]
+        targets = list(addresses.values())
+        for start in range(0, len(targets), batch_size):
+            transfers = [dict(destination=address,
+                              amount=format_tez(funding_mutez))
+                         for address in targets[start:start + batch_size]]
+            self.run("multiple", "transfers", "from", source, "using",
+                     json.dumps(transfers), "--burn-cap", self.burn_cap)
+        return addresses
+
+    def originate(self, alias: str, code_path: str, storage: str,
+                  source: str = "bootstrap1"):
+        output = self.run("originate", "contract", alias, "transferring", "0",
+                          "from", source, "running", code_path,
+                          "--init", storage, "--burn-cap", self.burn_cap,
+                          "--force")
+        receipt = Receipt.parse(output)
+        if not receipt.originated:
+            raise OperationFailed("no contract originated:\n" + output)
+        return receipt.originated[0], receipt
+
+    def call(self, source: str, destination: str, entrypoint: str,
+             arg: str, amount: int = 0) -> Receipt:
+        output = self.run("transfer", format_tez(amount), "from", source,
+                          "to", destination, "--entrypoint", entrypoint,
+                          "--arg", arg, "--burn-cap", self.burn_cap)
+        return Receipt.parse(output)
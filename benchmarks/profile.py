@@ -0,0 +1,316 @@
+"""Attribute the compiled Michelson of each entry point to SmartPy source.
+
+Usage::
+
+    python -m benchmarks.profile --folded profile.folded
+    python -m benchmarks.profile --env lean_storage=true --targets FA2 --top 15
+    python -m benchmarks.profile --tz build/FA2/step_000_cont_0_contract.tz
+
+The ``*_contract.tz`` files written by the SmartPy compiler start each entry
+point with a ``# == name ==`` comment and precede the instructions of every
+SmartPy command with that command as a comment, indented like the code it
+produced. Each instruction is charged to the stack of enclosing commands,
+e.g. ``transfer;sp.for transfer in params:;sp.for tx in transfer.txs:;...``,
+which ``--folded`` writes in the folded format of flamegraph.pl and
+speedscope.
+
+The analysis is static. The size is the binary Micheline size of the
+instructions. The gas is an estimate: the interpreter cost of each
+instruction for small operands, in milligas, from :data:`COSTS`. Map
+accesses, packing and comparisons grow with their operands, and reading a
+big_map also pays for loading the value. So use the estimate to find where
+an entry point spends its code, and ``benchmarks.run`` for totals; the
+report says so in its header.
+
+Commands are grouped by the helper they call, see :data:`CONSTRUCTS`.
+``ledger_key.make`` is the ``Pair``/``PACK`` of a ledger key kept in the
+``from_user`` and ``to_user`` locals of ``transfer``, apart from the
+ledger ``GET``/``UPDATE`` charged to ``ledger``. Where a key is built
+inline in a ledger access (``mint``, ``burn``, ``balance_of``), both are
+charged to ``ledger``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .smartpy import DEFAULT_CLI, TARGETS, compile_targets
+
+# Milligas of an instruction with small operands; others cost DEFAULT_COST.
+COSTS = {
+    "TRANSFER_TOKENS": 60, "CONTRACT": 30, "SELF_ADDRESS": 10,
+    "GET": 80, "MEM": 80, "UPDATE": 100, "GET_AND_UPDATE": 120,
+    "PACK": 300, "UNPACK": 300, "BLAKE2B": 450, "SHA256": 450,
+    "COMPARE": 35, "ADD": 35, "SUB": 35, "SUB_MUTEZ": 20, "MUL": 90,
+    "EDIV": 300, "ABS": 20, "ISNAT": 20, "INT": 10, "NEG": 25,
+    "CONCAT": 60, "SIZE": 10, "SLICE": 30,
+    "FAILWITH": 170, "LAMBDA": 10, "EXEC": 10, "APPLY": 140,
+    "ITER": 20, "MAP": 20, "LOOP": 10, "LOOP_LEFT": 10,
+    "EMIT": 60,
+}
+DEFAULT_COST = 10
+
+# Data constructors, types and keywords: sized but not executed.
+NOT_INSTRUCTIONS = {
+    "Pair", "Left", "Right", "Some", "None", "Unit", "True", "False", "Elt",
+    "parameter", "storage", "code", "view",
+}
+
+# Helpers of the contracts, recognized in the printed SmartPy commands.
+CONSTRUCTS = [
+    (re.compile(r'sp\.local\("(from|to)_user"'), "ledger_key.make"),
+    (re.compile(r"operators(_for_all)?\.contains\("), "operator_set.is_member"),
+    (re.compile(r"\.ledger\b"), "ledger"),
+    (re.compile(r"token_metadata|token_uris"), "token_metadata"),
+    (re.compile(r"sp\.split_tokens\("), "sp.split_tokens"),
+    (re.compile(r"sp\.contract\(|sp\.transfer\("), "fa2_transfer"),
+    (re.compile(r"sp\.send\("), "sp.send"),
+    (re.compile(r"sp\.pack\("), "sp.pack"),
+    (re.compile(r"sp\.blake2b\("), "sp.blake2b"),
+    (re.compile(r"\.swaps\b"), "swaps"),
+    (re.compile(r"sp\.verify\("), "sp.verify"),
+]
+
+_ENTRY = re.compile(r"^# == (\w+) ==")
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|0x[0-9a-fA-F]*|-?\d+|[%@:][\w.%@]*'
+                    r"|[A-Za-z_][A-Za-z0-9_]*|[{}();]")
+
+DISPATCH = "(dispatch)"
+
+
+class Cost(NamedTuple):
+    instructions: int
+    size: int
+    gas: int
+
+
+def _zarith_size(n: int) -> int:
+    bits = abs(n).bit_length()
+    return 1 if bits <= 6 else 1 + -(-(bits - 6) // 7)
+
+
+def line_cost(code: str) -> Cost:
+    """Instructions, Micheline bytes and estimated milligas of one line of
+    code, comments removed."""
+    instructions = size = gas = 0
+    for token in _TOKEN.findall(code):
+        if token.startswith('"'):
+            size += 5 + len(token) - 2
+        elif token.startswith("0x"):
+            size += 5 + (len(token) - 2) // 2
+        elif token.lstrip("-").isdigit():
+            size += 1 + _zarith_size(int(token))
+        elif token[0] in "%@:":
+            size += 4 + len(token)
+        elif token == "{":
+            size += 5
+        elif token[0].isalpha() or token[0] == "_":
+            size += 2
+            if token.isupper() and token not in NOT_INSTRUCTIONS:
+                instructions += 1
+                gas += COSTS.get(token, DEFAULT_COST)
+    return Cost(instructions, size, gas)
+
+
+def split_comment(line: str) -> Tuple[str, str]:
+    """(code, comment) of a .tz line, ``#`` inside strings not counting."""
+    in_string = False
+    escaped = False
+    for i, char in enumerate(line):
+        if escaped:
+            escaped = False
+        elif char == "\\" and in_string:
+            escaped = True
+        elif char == '"':
+            in_string = not in_string
+        elif char == "#" and not in_string:
+            return line[:i], line[i + 1:].strip()
+    return line, ""
+
+
+def command_of(comment: str) -> str:
+    """The SmartPy command of a full-line comment, without the stack
+    annotation SmartPy appends after another ``#``."""
+    return split_comment(comment)[0].strip()
+
+
+class _Frame(NamedTuple):
+    indent: int
+    label: str
+    entry: bool
+
+
+def attribute(lines: Iterator[str]) -> Dict[Tuple[str, ...], Cost]:
+    """Cost of the instructions of ``lines`` (a .tz file) by stack of
+    (entry point, command, nested command...)."""
+    costs: Dict[Tuple[str, ...], List[int]] = defaultdict(lambda: [0, 0, 0])
+    frames: List[_Frame] = []
+    in_code = False
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        indent = len(line) - len(line.lstrip())
+        if not in_code:
+            in_code = stripped.startswith("code")
+            if not in_code:
+                continue
+        if stripped.startswith("#"):
+            entry = _ENTRY.match(stripped)
+            if entry:
+                while frames and frames[-1].indent >= indent:
+                    frames.pop()
+                frames.append(_Frame(indent, entry.group(1), True))
+                continue
+            command = command_of(stripped[1:])
+            if not command or command.startswith("@"):
+                # Stack annotations are not commands.
+                continue
+            while frames and (frames[-1].indent > indent or (
+                    frames[-1].indent == indent and not frames[-1].entry)):
+                frames.pop()
+            frames.append(_Frame(indent, command, False))
+            continue
+        while frames and frames[-1].indent > indent:
+            frames.pop()
+        code, _ = split_comment(line)
+        cost = line_cost(code)
+        if not cost.size:
+            continue
+        stack = tuple(f.label for f in frames)
+        if not frames or not frames[0].entry:
+            stack = (DISPATCH,) + stack
+        total = costs[stack]
+        total[0] += cost.instructions
+        total[1] += cost.size
+        total[2] += cost.gas
+    return {stack: Cost(*total) for stack, total in costs.items()}
+
+
+def construct(command: str) -> Optional[str]:
+    for pattern, name in CONSTRUCTS:
+        if pattern.search(command):
+            return name
+    return None
+
+
+class EntryProfile(NamedTuple):
+    total: Cost
+    # Innermost recognized construct (or command) -> cost.
+    constructs: Dict[str, Cost]
+
+
+def _add(a: Cost, b: Cost) -> Cost:
+    return Cost(a.instructions + b.instructions, a.size + b.size, a.gas + b.gas)
+
+
+def by_entrypoint(costs: Dict[Tuple[str, ...], Cost]) -> Dict[str, EntryProfile]:
+    totals: Dict[str, Cost] = defaultdict(lambda: Cost(0, 0, 0))
+    constructs: Dict[str, Dict[str, Cost]] = defaultdict(
+        lambda: defaultdict(lambda: Cost(0, 0, 0)))
+    for stack, cost in costs.items():
+        entry = stack[0]
+        totals[entry] = _add(totals[entry], cost)
+        label = "(entry point)"
+        for command in reversed(stack[1:]):
+            label = construct(command) or command
+            if construct(command):
+                break
+        constructs[entry][label] = _add(constructs[entry][label], cost)
+    return {entry: EntryProfile(totals[entry], dict(constructs[entry]))
+            for entry in totals}
+
+
+def folded(costs: Dict[Tuple[str, ...], Cost], target: str,
+           metric: str = "gas") -> List[str]:
+    """flamegraph.pl lines: ``target;entry;command;... value``."""
+    lines = []
+    for stack, cost in sorted(costs.items()):
+        value = getattr(cost, metric)
+        if value:
+            frames = [target] + [re.sub(r"[;\s]+", " ", f) for f in stack]
+            lines.append("%s %d" % (";".join(frames), value))
+    return lines
+
+
+HEADER = ("%s: static estimate, not a measurement: gas is the sum of "
+          "per-instruction milligas for small operands (see benchmarks.run "
+          "for measured gas)")
+
+
+def format_profile(target: str, profiles: Dict[str, EntryProfile],
+                   top: int) -> str:
+    out = [HEADER % target]
+    for entry, profile in sorted(profiles.items(),
+                                 key=lambda item: -item[1].total.gas):
+        total = profile.total
+        out.append("%s.%s: %d instructions, %d bytes, ~%d milligas (est.)" % (
+            target, entry, total.instructions, total.size, total.gas))
+        ranked = sorted(profile.constructs.items(), key=lambda item: -item[1].gas)
+        for label, cost in ranked[:top]:
+            share = 100.0 * cost.gas / total.gas if total.gas else 0.0
+            if len(label) > 70:
+                label = label[:67] + "..."
+            out.append("  %5.1f%%  %6d mg est.  %5d B  %s" % (share, cost.gas,
+                                                        cost.size, label))
+    return "\n".join(out)
+
+
+def profile_file(path: str) -> Dict[Tuple[str, ...], Cost]:
+    with open(path) as f:
+        return attribute(iter(f))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.profile",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--tz", action="append", default=[],
+                        help="profile this compiled contract instead of "
+                             "compiling the targets")
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help="comma separated subset of: %s" % ", ".join(TARGETS))
+    parser.add_argument("--smartpy", default=DEFAULT_CLI)
+    parser.add_argument("--env", action="append", default=[],
+                        metavar="NAME=VALUE",
+                        help="environment variable for the SmartPy "
+                             "compilation, e.g. lean_storage=true")
+    parser.add_argument("--top", type=int, default=10,
+                        help="constructs listed per entry point")
+    parser.add_argument("--folded", default=None,
+                        help="write the stacks in folded format to this file")
+    parser.add_argument("--metric", choices=Cost._fields, default="gas",
+                        help="value of the folded stacks (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results: List[Tuple[str, Dict[Tuple[str, ...], Cost]]] = []
+    if args.tz:
+        results = [(os.path.basename(path).split("_contract")[0],
+                    profile_file(path)) for path in args.tz]
+    else:
+        env = dict(item.split("=", 1) for item in args.env)
+        with tempfile.TemporaryDirectory(prefix="typed-profile-") as tmp:
+            contracts = compile_targets(tmp, cli=args.smartpy, env=env)
+            results = [(target, profile_file(contracts[target].code_path))
+                       for target in args.targets.split(",")]
+    stacks = []
+    for target, costs in results:
+        print(format_profile(target, by_entrypoint(costs), args.top))
+        stacks += folded(costs, target, args.metric)
+    if args.folded:
+        with open(args.folded, "w") as f:
+            f.write("\n".join(stacks) + "\n")
+        print("wrote %d stacks to %s" % (len(stacks), args.folded),
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
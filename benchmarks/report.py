@@ -0,0 +1,67 @@
+"""Write benchmark reports and compare them against a baseline."""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List
+
+from .workloads import Measurement
+
+
+def write_report(path: str, measurements: List[Measurement],
+                 meta: Dict[str, Any]) -> Dict[str, Any]:
+    report = dict(meta, results=[m.to_json() for m in measurements])
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return report
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _index(report: Dict[str, Any]):
+    return {(r["contract"], r["entrypoint"], r["size"]): r
+            for r in report["results"]}
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any],
+            gas_threshold: float, storage_threshold: int) -> List[str]:
+    """List the regressions of ``report`` against ``baseline``.
+
+    Gas may grow by ``gas_threshold`` (a fraction of the baseline), paid
+    storage by ``storage_threshold`` bytes, and internal operations not at
+    all. Entries missing from either side are ignored.
+    """
+    regressions = []
+    old = _index(baseline)
+    for key, new in sorted(_index(report).items()):
+        if key not in old:
+            continue
+        ref = old[key]
+        name = "%s.%s[%d]" % key
+        if new["gas"] > ref["gas"] * (1 + gas_threshold):
+            regressions.append("%s: gas %.3f -> %.3f (+%.1f%%)" % (
+                name, ref["gas"], new["gas"],
+                100.0 * (new["gas"] - ref["gas"]) / max(ref["gas"], 1)))
+        if new["paid_storage_diff"] > ref["paid_storage_diff"] + storage_threshold:
+            regressions.append("%s: paid storage %d -> %d bytes" % (
+                name, ref["paid_storage_diff"], new["paid_storage_diff"]))
+        if new["internal_operations"] > ref["internal_operations"]:
+            regressions.append("%s: internal operations %d -> %d" % (
+                name, ref["internal_operations"], new["internal_operations"]))
+    return regressions
+
+
+def format_table(measurements: List[Measurement]) -> str:
+    rows = [("contract", "entrypoint", "size", "gas", "gas/item",
+             "storage", "paid", "int.ops")]
+    for m in measurements:
+        rows.append((m.contract, m.entrypoint, str(m.size), "%.0f" % m.gas,
+                     "%.0f" % m.gas_per_item, str(m.storage_diff),
+                     str(m.paid_storage_diff), str(m.internal_operations)))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(row, widths))
+                     for row in rows)
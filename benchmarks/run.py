@@ -0,0 +1,89 @@
+"""Benchmark every entry point and check the results against a baseline.
+
+Usage::
+
+    python -m benchmarks.run --output bench_report.json \\
+        --baseline benchmarks/baseline.json
+
+The contracts are compiled with the SmartPy CLI, then originated and driven
+in an ``octez-client`` mockup, whose receipts give the consumed gas, the
+storage size changes and the internal operations of each call.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+
+from . import report
+from .octez import Mockup
+from .smartpy import DEFAULT_CLI, compile_targets
+from .workloads import WORKLOADS, Bench, parse_switches
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--smartpy", default=DEFAULT_CLI,
+                        help="path to SmartPy.sh (default: %(default)s)")
+    parser.add_argument("--octez-client", default="octez-client")
+    parser.add_argument("--protocol", default=None,
+                        help="mockup protocol hash (default: client default)")
+    parser.add_argument("--sizes", default="1,10,100",
+                        help="comma separated batch sizes (default: %(default)s)")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help="comma separated subset of: %s" % ", ".join(WORKLOADS))
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--baseline", default=None,
+                        help="report to compare against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write the results to --baseline instead of "
+                             "comparing")
+    parser.add_argument("--gas-threshold", type=float, default=0.02,
+                        help="allowed relative gas increase (default: %(default)s)")
+    parser.add_argument("--storage-threshold", type=int, default=0,
+                        help="allowed paid storage increase in bytes "
+                             "(default: %(default)s)")
+    parser.add_argument("--env", action="append", default=[],
+                        metavar="NAME=VALUE",
+                        help="environment variable for the SmartPy "
+                             "compilation, e.g. lean_storage=true")
+    return parser.parse_args(argv)
+
+
+def run(args) -> int:
+    sizes = [int(s) for s in args.sizes.split(",")]
+    env = dict(item.split("=", 1) for item in args.env)
+    with tempfile.TemporaryDirectory(prefix="typed-bench-") as tmp:
+        contracts = compile_targets(os.path.join(tmp, "build"),
+                                    cli=args.smartpy, env=env)
+        mockup = Mockup(os.path.join(tmp, "mockup"), client=args.octez_client,
+                        protocol=args.protocol)
+        bench = Bench(mockup, contracts, switches=parse_switches(env))
+        for name in args.workloads.split(","):
+            WORKLOADS[name](bench, sizes)
+    print(report.format_table(bench.measurements))
+    meta = dict(sizes=sizes, env=env, protocol=args.protocol)
+    if args.update_baseline:
+        if args.baseline is None:
+            sys.exit("--update-baseline requires --baseline")
+        report.write_report(args.baseline, bench.measurements, meta)
+        return 0
+    result = report.write_report(args.output, bench.measurements, meta)
+    if args.baseline is None:
+        return 0
+    regressions = report.compare(result, report.load_report(args.baseline),
+                                 args.gas_threshold, args.storage_threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
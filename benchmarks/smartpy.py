@@ -0,0 +1,78 @@
+"""Compile the contracts with the SmartPy command line interface."""
+
+from __future__ import annotations
+
+import glob
+import os
+import subprocess
+from typing import Dict, Optional
+
+from .michelson import Contract
+
+DEFAULT_CLI = os.path.expanduser("~/smartpy-cli/SmartPy.sh")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Compilation target name -> script, as declared by sp.add_compilation_target.
+TARGETS = {
+    "FA2": "contracts/fa2_v1.py",
+    "typedmarket": "contracts/market_v1.py",
+    "minter": "contracts/minter_v1.py",
+    "typedregister": "contracts/register_v1.py",
+}
+
+
+class CompilationFailed(Exception):
+    pass
+
+
+class ScenarioFailed(Exception):
+    pass
+
+
+def compile_script(script: str, output_dir: str, cli: str = DEFAULT_CLI,
+                   env: Optional[Dict[str, str]] = None) -> None:
+    # Run from the root, where the scripts find metadatas/.
+    proc = subprocess.run([cli, "compile", os.path.join(ROOT, script),
+                           os.path.abspath(output_dir)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, cwd=ROOT,
+                          env=dict(os.environ, **(env or {})))
+    if proc.returncode != 0:
+        raise CompilationFailed("%s:\n%s" % (script, proc.stderr or proc.stdout))
+
+
+def run_test(script: str, output_dir: str, cli: str = DEFAULT_CLI,
+             env: Optional[Dict[str, str]] = None) -> None:
+    """Run the test scenarios of ``script`` with ``SmartPy.sh test``."""
+    proc = subprocess.run([cli, "test", os.path.join(ROOT, script),
+                           os.path.abspath(output_dir)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, cwd=ROOT,
+                          env=dict(os.environ, **(env or {})))
+    if proc.returncode != 0:
+        raise ScenarioFailed("%s:\n%s" % (script, proc.stderr or proc.stdout))
+
+
+def _output(target_dir: str, suffix: str) -> str:
+    found = sorted(glob.glob(os.path.join(target_dir, "*" + suffix)))
+    if not found:
+        raise CompilationFailed("no %s in %s" % (suffix, target_dir))
+    return found[0]
+
+
+def load_target(output_dir: str, target: str) -> Contract:
+    target_dir = os.path.join(output_dir, target)
+    return Contract(code_path=_output(target_dir, "_contract.tz"),
+                    json_path=_output(target_dir, "_contract.json"),
+                    storage_path=_output(target_dir, "_storage.tz"))
+
+
+def compile_targets(output_dir: str, cli: str = DEFAULT_CLI,
+                    env: Optional[Dict[str, str]] = None) -> Dict[str, Contract]:
+    """Compile every contract script and load its compilation target."""
+    contracts = {}
+    for target, script in TARGETS.items():
+        compile_script(script, output_dir, cli=cli, env=env)
+        contracts[target] = load_target(output_dir, target)
+    return contracts
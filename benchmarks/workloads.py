@@ -0,0 +1,352 @@
+"""Workloads driving every entry point of the contracts at several sizes.
+
+Each workload originates its own contracts in the mockup, prepares the
+state it needs (setup operations are not measured) and records one
+:class:`Measurement` per (entry point, size).  For batch entry points the
+size is the number of items in a single call; for the others it is the
+number of consecutive calls.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .michelson import Contract, Raw
+from .octez import Mockup, Receipt
+
+# Addresses hardcoded in the compilation targets, replaced in the initial
+# storage by accounts and contracts of the mockup.
+ADMIN_PLACEHOLDER = "tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"
+FA2_PLACEHOLDER = "KT1J6NY5AU61GzUX51n59wwiZcGJ9DrNTwbK"
+
+BALANCE_CALLBACK = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "balance_callback.tz")
+
+TOKEN_INFO = {"": b"ipfs://QmSRJz65xXLuu5tSR1RfnGE86SaHe4qwPQamet7S1joJjC"}
+PRICE = 1000000
+
+
+@dataclass
+class Measurement:
+    contract: str
+    entrypoint: str
+    size: int
+    calls: int
+    gas: float
+    gas_per_item: float
+    storage_diff: int
+    paid_storage_diff: int
+    internal_operations: int
+
+    def key(self):
+        return (self.contract, self.entrypoint, self.size)
+
+    def to_json(self):
+        return asdict(self)
+
+
+def parse_switches(env: Dict[str, str]) -> Dict[str, bool]:
+    """Read FA2_config switches the way ``global_parameter`` does."""
+    return {name: value == "true" for name, value in env.items()
+            if value in ("true", "false")}
+
+
+class Bench:
+    """Shared state of a benchmark run: the mockup and compiled contracts."""
+
+    def __init__(self, mockup: Mockup, contracts: Dict[str, Contract],
+                 switches: Optional[Dict[str, bool]] = None):
+        self.mockup = mockup
+        self.contracts = contracts
+        self.switches = switches or {}
+        self.accounts = mockup.accounts()
+        self.admin = self.accounts["bootstrap1"]
+        self.storage_sizes: Dict[str, int] = {}
+        self.originations: Dict[str, Receipt] = {}
+        self.addresses: Dict[str, str] = {}
+        self.measurements: List[Measurement] = []
+
+    def switch(self, name: str, default: bool = False) -> bool:
+        """The value of a configuration switch the contracts were compiled
+        with."""
+        return self.switches.get(name, default)
+
+    def originate(self, alias: str, target: str,
+                  fa2: str = FA2_PLACEHOLDER) -> str:
+        contract = self.contracts[target]
+        storage = contract.initial_storage({ADMIN_PLACEHOLDER: self.admin,
+                                            FA2_PLACEHOLDER: fa2})
+        address, receipt = self.mockup.originate(alias, contract.code_path,
+                                                 storage)
+        self.addresses[address] = target
+        self.originations[alias] = receipt
+        self.storage_sizes.update(receipt.storage_sizes)
+        return address
+
+    def originate_raw(self, alias: str, code_path: str, storage: str) -> str:
+        address, receipt = self.mockup.originate(alias, code_path, storage)
+        self.storage_sizes.update(receipt.storage_sizes)
+        return address
+
+    def call(self, source: str, destination: str, entrypoint: str, value,
+             amount: int = 0) -> Receipt:
+        contract = self.contracts[self.addresses[destination]]
+        receipt = self.mockup.call(self.accounts.get(source, source),
+                                   destination, entrypoint,
+                                   contract.encode(entrypoint, value), amount)
+        before = self.storage_sizes.get(destination, 0)
+        receipt.storage_diff = receipt.storage_sizes.get(destination, before) \
+            - before
+        self.storage_sizes.update(receipt.storage_sizes)
+        return receipt
+
+    def measure(self, entrypoint: str, size: int,
+                calls: Callable[[], Iterable[Receipt]], contract: str):
+        """Run ``calls`` and record their cumulated cost."""
+        gas, paid, internal, storage, count = 0.0, 0, 0, 0, 0
+        for receipt in calls():
+            gas += receipt.gas
+            paid += receipt.paid_storage_diff
+            internal += receipt.internal_operations
+            storage += receipt.storage_diff
+            count += 1
+        self.measurements.append(Measurement(
+            contract=contract, entrypoint=entrypoint, size=size, calls=count,
+            gas=round(gas, 3), gas_per_item=round(gas / size, 3),
+            storage_diff=storage, paid_storage_diff=paid,
+            internal_operations=internal))
+
+
+class Counter:
+    def __init__(self, start: int = 0, step: int = 1):
+        self.value = start
+        self.step = step
+
+    def take(self, n: int) -> List[int]:
+        values = [self.value + i * self.step for i in range(n)]
+        self.value += n * self.step
+        return values
+
+
+def fa2_workload(bench: Bench, sizes: List[int]):
+    admin, holder, operator = "bootstrap1", "bootstrap2", "bootstrap3"
+    fa2 = bench.originate("bench_fa2", "FA2")
+    callback = bench.originate_raw("bench_callback", BALANCE_CALLBACK, "Unit")
+    entrypoints = bench.contracts["FA2"].entrypoints()
+    holder_address = bench.accounts[holder]
+    # Single asset contracts only know token 0, NFTs only hold one unit.
+    tokens = Counter(step=0 if bench.switch("single_asset") else 1)
+    supply, unit = (1, 1) if bench.switch("non_fungible") else (100, 10)
+
+    def mint(address, token_id):
+        return dict(address=address, amount=supply, token_id=token_id,
+                    token_info=TOKEN_INFO)
+
+    for n in sizes:
+        ids = tokens.take(n)
+        bench.measure("mint", n, lambda: (
+            bench.call(admin, fa2, "mint", mint(bench.admin, i)) for i in ids),
+            contract="FA2")
+        batch_ids = tokens.take(n)
+        bench.measure("mint_batch", n, lambda: [
+            bench.call(admin, fa2, "mint_batch",
+                       [mint(bench.admin, i) for i in batch_ids])],
+            contract="FA2")
+        bench.measure("transfer", n, lambda: [
+            bench.call(admin, fa2, "transfer", [dict(
+                from_=bench.admin,
+                txs=[dict(to_=holder_address, token_id=i, amount=unit)
+                     for i in ids])])],
+            contract="FA2")
+        if bench.switch("support_operator", True):
+            bench.measure("update_operators", n, lambda: [
+                bench.call(holder, fa2, "update_operators", [
+                    ("add_operator", dict(owner=holder_address,
+                                          operator=bench.accounts[operator],
+                                          token_id=i)) for i in ids])],
+                contract="FA2")
+            # The operator path: one operators lookup per tx.
+            bench.measure("transfer_operator", n, lambda: [
+                bench.call(operator, fa2, "transfer", [dict(
+                    from_=holder_address,
+                    txs=[dict(to_=holder_address, token_id=i, amount=unit)
+                         for i in ids])])],
+                contract="FA2")
+        bench.measure("balance_of", n, lambda: [
+            bench.call(holder, fa2, "balance_of", dict(
+                requests=[dict(owner=holder_address, token_id=i) for i in ids],
+                callback=callback))],
+            contract="FA2")
+        bench.measure("token_metadata", n, lambda: [
+            bench.call(holder, fa2, "token_metadata", dict(
+                token_ids=ids, handler=Raw("{ DROP ; UNIT }")))],
+            contract="FA2")
+        bench.measure("burn", n, lambda: (
+            bench.call(holder, fa2, "burn", dict(
+                address=holder_address, token_id=i, amount=unit)) for i in ids),
+            contract="FA2")
+    if bench.switch("operator_for_all"):
+        bench.measure("update_operators_for_all", 1, lambda: [
+            bench.call(holder, fa2, "update_operators_for_all", [
+                ("add_operator", dict(owner=holder_address,
+                                      operator=bench.accounts[operator]))])],
+            contract="FA2")
+    bench.measure("set_pause", 1, lambda: [
+        bench.call(admin, fa2, "set_pause", False)], contract="FA2")
+    bench.measure("set_administrator", 1, lambda: [
+        bench.call(admin, fa2, "set_administrator", bench.admin)],
+        contract="FA2")
+    if "transfer_mutez" in entrypoints:
+        bench.measure("transfer_mutez", 1, lambda: [
+            bench.call(admin, fa2, "transfer_mutez", dict(
+                destination=holder_address, amount=PRICE), amount=PRICE)],
+            contract="FA2")
+    bench.measure("payout_balance", 1, lambda: [
+        bench.call(admin, fa2, "payout_balance", None, amount=PRICE)],
+        contract="FA2")
+
+
+def _minted_fa2(bench: Bench, alias: str):
+    """Originate an FA2 administrated by a fresh minter."""
+    fa2 = bench.originate(alias + "_fa2", "FA2")
+    minter = bench.originate(alias + "_minter", "minter", fa2=fa2)
+    bench.call("bootstrap1", fa2, "set_administrator", minter)
+    return fa2, minter
+
+
+def minter_workload(bench: Bench, sizes: List[int]):
+    admin, artist = "bootstrap1", "bootstrap2"
+    _, minter = _minted_fa2(bench, "bench_minter")
+    for n in sizes:
+        bench.measure("mint_TYPED", n, lambda: (
+            bench.call(artist, minter, "mint_TYPED",
+                       dict(amount=10, metadata=TOKEN_INFO[""]))
+            for _ in range(n)), contract="minter")
+        bench.measure("mint_TYPED_batch", n, lambda: [
+            bench.call(artist, minter, "mint_TYPED_batch",
+                       [dict(amount=10, metadata=TOKEN_INFO[""])] * n)],
+            contract="minter")
+    bench.measure("update_royalties", 1, lambda: [
+        bench.call(admin, minter, "update_royalties", 100)], contract="minter")
+    bench.measure("set_pause_mint", 1, lambda: [
+        bench.call(admin, minter, "set_pause_mint", False)], contract="minter")
+    bench.measure("payout_balance", 1, lambda: [
+        bench.call(admin, minter, "payout_balance", None, amount=PRICE)],
+        contract="minter")
+
+
+def market_workload(bench: Bench, sizes: List[int]):
+    admin, seller, buyer = "bootstrap1", "bootstrap2", "bootstrap3"
+    fa2, minter = _minted_fa2(bench, "bench_market")
+    market = bench.originate("bench_market", "typedmarket", fa2=fa2)
+    seller_address = bench.accounts[seller]
+    tokens = Counter()
+    swaps = Counter()
+
+    # Every size uses a fresh token held by the seller with the market as
+    # operator.
+    def new_token():
+        bench.call(seller, minter, "mint_TYPED",
+                   dict(amount=9999, metadata=TOKEN_INFO[""]))
+        token_id = tokens.take(1)[0]
+        bench.call(seller, fa2, "update_operators", [
+            ("add_operator", dict(owner=seller_address, operator=market,
+                                  token_id=token_id))])
+        return token_id
+
+    def swap(token_id, editions=1):
+        return bench.call(seller, market, "swap", dict(
+            fa2=fa2, objkt_id=token_id, objkt_amount=editions,
+            xtz_per_objkt=PRICE, royalties=0, creator=seller_address))
+
+    def swap_bundle(items):
+        return bench.call(seller, market, "swap_bundle", dict(
+            fa2=fa2, items=items, xtz_per_bundle=PRICE,
+            creator=seller_address))
+
+    def open_swaps(token_id, n, editions=1):
+        for _ in range(n):
+            swap(token_id, editions)
+        return swaps.take(n)
+
+    for n in sizes:
+        token_id = new_token()
+        bench.measure("swap", n, lambda: (swap(token_id) for _ in range(n)),
+                      contract="typedmarket")
+        ids = swaps.take(n)
+        bench.measure("collect", n, lambda: (
+            bench.call(buyer, market, "collect", i, amount=PRICE)
+            for i in ids), contract="typedmarket")
+        edition_swap = open_swaps(token_id, 1, editions=n)[0]
+        bench.measure("collect_editions", n, lambda: [
+            bench.call(buyer, market, "collect_editions",
+                       dict(swap_id=edition_swap, quantity=n),
+                       amount=PRICE * n)], contract="typedmarket")
+        ids = open_swaps(token_id, n)
+        bench.measure("collect_batch", n, lambda: [
+            bench.call(buyer, market, "collect_batch", ids,
+                       amount=PRICE * n)], contract="typedmarket")
+        ids = open_swaps(token_id, n)
+        bench.measure("cancel_swap", n, lambda: (
+            bench.call(seller, market, "cancel_swap", i) for i in ids),
+            contract="typedmarket")
+        ids = open_swaps(token_id, n)
+        bench.measure("update_price", n, lambda: (
+            bench.call(seller, market, "update_price",
+                       dict(swap_id=i, xtz_per_objkt=PRICE * 2)) for i in ids),
+            contract="typedmarket")
+        bench.measure("cancel_swaps", n, lambda: [
+            bench.call(seller, market, "cancel_swaps", ids)],
+            contract="typedmarket")
+        if bench.switch("bundles"):
+            # One bundle of n tokens against the n swaps above.
+            items = [dict(token_id=new_token(), amount=1) for _ in range(n)]
+            bench.measure("swap_bundle", n, lambda: [swap_bundle(items)],
+                          contract="typedmarket")
+            bundle_id = swaps.take(1)[0]
+            bench.measure("collect_bundle", n, lambda: [
+                bench.call(buyer, market, "collect_bundle", bundle_id,
+                           amount=PRICE)], contract="typedmarket")
+            swap_bundle(items)
+            bundle_id = swaps.take(1)[0]
+            bench.measure("cancel_bundle", n, lambda: [
+                bench.call(seller, market, "cancel_bundle", bundle_id)],
+                contract="typedmarket")
+    if bench.switch("pull_payments"):
+        bench.measure("withdraw", 1, lambda: [
+            bench.call(seller, market, "withdraw", None)],
+            contract="typedmarket")
+    for entrypoint, value in [("update_fee", 50), ("update_royalties", 100),
+                              ("set_pause_swaps", False),
+                              ("set_pause_collects", False)]:
+        bench.measure(entrypoint, 1, lambda: [
+            bench.call(admin, market, entrypoint, value)],
+            contract="typedmarket")
+    bench.measure("payout_balance", 1, lambda: [
+        bench.call(admin, market, "payout_balance", None, amount=PRICE)],
+        contract="typedmarket")
+
+
+def register_workload(bench: Bench, sizes: List[int]):
+    admin = "bootstrap1"
+    users = ["bootstrap2", "bootstrap3", "bootstrap4", "bootstrap5"]
+    register = bench.originate("bench_register", "typedregister")
+    names = Counter()
+    for n in sizes:
+        bench.measure("register", n, lambda: (
+            bench.call(users[i % len(users)], register, "register",
+                       dict(name=b"user-%d" % names.take(1)[0]))
+            for i in range(n)), contract="typedregister")
+    bench.measure("payout_balance", 1, lambda: [
+        bench.call(admin, register, "payout_balance", None, amount=PRICE)],
+        contract="typedregister")
+
+
+WORKLOADS = {
+    "fa2": fa2_workload,
+    "minter": minter_workload,
+    "market": market_workload,
+    "register": register_workload,
+}
@@ -1,3 +1,5 @@
+import json
+import os
 import smartpy as sp
 
 class FA2_config:
@@ -12,7 +14,13 @@ class FA2_config:
                  assume_consecutive_token_ids = True,
                  add_permissions_descriptor   = False,
                  lazy_entry_points = False,
-                 lazy_entry_points_multiple = False
+                 lazy_entry_points_multiple = False,
+                 lean_storage                 = False,
+                 compact_metadata             = False,
+                 operator_for_all             = False,
+                 nft_ledger                   = False,
+                 emit_events                  = False,
+                 track_total_supply           = False
                  ):
 
         if debug_mode:
@@ -29,9 +37,21 @@ class FA2_config:
         self.add_permissions_descriptor = add_permissions_descriptor
         self.lazy_entry_points = lazy_entry_points
         self.lazy_entry_points_multiple = lazy_entry_points_multiple
+        self.lean_storage = lean_storage
+        self.compact_metadata = compact_metadata
+        self.operator_for_all = operator_for_all
+        self.nft_ledger = nft_ledger
+        self.emit_events = emit_events
+        self.track_total_supply = track_total_supply
         if lazy_entry_points and lazy_entry_points_multiple:
             raise Exception(
                 "Cannot provide lazy_entry_points and lazy_entry_points_multiple")
+        if operator_for_all and not support_operator:
+            raise Exception(
+                "Cannot provide operator_for_all without support_operator")
+        if nft_ledger and not non_fungible:
+            raise Exception(
+                "Cannot provide nft_ledger without non_fungible")
 
         name = "FA2"
         if debug_mode:
@@ -56,6 +76,18 @@ class FA2_config:
             name += "-lep"
         if lazy_entry_points_multiple:
             name += "-lepm"
+        if lean_storage:
+            name += "-lean"
+        if compact_metadata:
+            name += "-compact_metadata"
+        if operator_for_all:
+            name += "-op_all"
+        if nft_ledger:
+            name += "-nft_ledger"
+        if emit_events:
+            name += "-events"
+        if track_total_supply:
+            name += "-supply"
         self.name = name
 
 
@@ -71,6 +103,8 @@ class Error_message:
     def not_operator(self):          return self.make("NOT_OPERATOR")
     def not_owner(self):             return self.make("NOT_OWNER")
     def operators_unsupported(self): return self.make("OPERATORS_UNSUPPORTED")
+    def not_enumerable(self):        return self.make("TOKEN_IDS_NOT_ENUMERABLE")
+    def compact_metadata_key(self):  return self.make("COMPACT_METADATA_KEY")
 
 class Batch_transfer:
     def __init__(self, config):
@@ -109,6 +143,13 @@ class Operator_param:
                       operator = operator,
                       token_id = token_id)
         return sp.set_type_expr(r, self.get_type())
+    def get_for_all_type(self):
+        t = sp.TRecord(
+            owner = sp.TAddress,
+            operator = sp.TAddress)
+        if self.config.force_layouts:
+            t = t.layout(("owner", "operator"))
+        return t
 
 
 class Ledger_key:
@@ -132,6 +173,16 @@ class Ledger_value:
     def make(balance):
         return sp.record(balance = balance)
 
+# With FA2_config(nft_ledger = True) the ledger maps each token id to its
+# owner instead of (owner, token_id) to a balance of 0 or 1.
+class Nft_ledger:
+    def get_type():
+        return sp.TAddress
+    def owns(ledger, owner, token_id):
+        return ledger.get_opt(token_id) == sp.some(owner)
+    def balance(ledger, owner, token_id):
+        return sp.eif(Nft_ledger.owns(ledger, owner, token_id), sp.nat(1), sp.nat(0))
+
 class Operator_set:
     def __init__(self, config):
         self.config = config
@@ -162,6 +213,32 @@ class Operator_set:
         del set[self.make_key(owner, operator, token_id)]
     def is_member(self, set, owner, operator, token_id):
         return set.contains(self.make_key(owner, operator, token_id))
+    # Operators of every token of an owner, keyed on (owner, operator) only.
+    def for_all_inner_type(self):
+        return sp.TRecord(owner = sp.TAddress,
+                          operator = sp.TAddress
+                          ).layout(("owner", "operator"))
+    def for_all_key_type(self):
+        if self.config.readable:
+            return self.for_all_inner_type()
+        else:
+            return sp.TBytes
+    def make_for_all(self):
+        return self.config.my_map(tkey = self.for_all_key_type(), tvalue = sp.TUnit)
+    def make_for_all_key(self, owner, operator):
+        metakey = sp.record(owner = owner,
+                            operator = operator)
+        metakey = sp.set_type_expr(metakey, self.for_all_inner_type())
+        if self.config.readable:
+            return metakey
+        else:
+            return sp.pack(metakey)
+    def add_for_all(self, set, owner, operator):
+        set[self.make_for_all_key(owner, operator)] = sp.unit
+    def remove_for_all(self, set, owner, operator):
+        del set[self.make_for_all_key(owner, operator)]
+    def is_member_for_all(self, set, owner, operator):
+        return set.contains(self.make_for_all_key(owner, operator))
 
 class Balance_of:
     def request_type():
@@ -195,6 +272,32 @@ class Token_meta_data:
         sp.set_type(expr, self.get_type())
     def request_type(self):
         return token_id_type
+    def value_type(self):
+        if self.config.compact_metadata:
+            # Only the URI stored under the "" key of token_info.
+            return sp.TBytes
+        return self.get_type()
+    def big_map_name(self):
+        # TZIP-12 consumers decode a big_map named token_metadata as
+        # (token_id, token_info) records: compact builds keep their URIs
+        # under another name and answer through the off-chain view.
+        if self.config.compact_metadata:
+            return "token_uris"
+        return "token_metadata"
+    def make(self, token_id, token_info):
+        if self.config.compact_metadata:
+            # Only a token_info made of the "" key alone is stored whole.
+            sp.verify((sp.len(token_info) == 1) & token_info.contains(""),
+                      message = Error_message(self.config).compact_metadata_key())
+            return token_info[""]
+        return sp.record(token_id = token_id, token_info = token_info)
+    def get(self, token_metadata, token_id):
+        if self.config.compact_metadata:
+            return sp.set_type_expr(
+                sp.record(token_id = token_id,
+                          token_info = sp.map({"": token_metadata[token_id]})),
+                self.get_type())
+        return token_metadata[token_id]
 
 class Permissions_descriptor:
     def __init__(self, config):
@@ -256,17 +359,23 @@ class Token_id_set:
             # The "set" is its cardinal.
             return sp.nat(0)
         else:
-            return sp.set(t = token_id_type)
+            # A big_map only loads the keys an operation reads or writes,
+            # where a set would be deserialized whole on every call.
+            return self.config.my_map(tkey = token_id_type, tvalue = sp.TUnit)
     def add(self, metaset, v):
         if self.config.assume_consecutive_token_ids:
             metaset.set(sp.max(metaset, v + 1))
         else:
-            metaset.add(v)
+            metaset[v] = sp.unit
     def contains(self, metaset, v):
         if self.config.assume_consecutive_token_ids:
             return (v < metaset)
         else:
-            metaset.contains(v)
+            return metaset.contains(v)
+    def enumerable(self):
+        return self.config.assume_consecutive_token_ids
+    def elements(self, metaset):
+        return sp.range(0, metaset)
 
 
 def mutez_transfer(contract, params):
@@ -294,32 +403,80 @@ class FA2_core(sp.Contract):
                 v = self.permissions_descriptor_.make()
                 sp.transfer(v, sp.mutez(0), params)
             self.permissions_descriptor = sp.entry_point(permissions_descriptor)
+        if self.config.operator_for_all:
+            def update_operators_for_all(self, params):
+                sp.set_type(params, sp.TList(
+                    sp.TVariant(
+                        add_operator = self.operator_param.get_for_all_type(),
+                        remove_operator = self.operator_param.get_for_all_type())))
+                sp.for update in params:
+                    with update.match_cases() as arg:
+                        with arg.match("add_operator") as upd:
+                            sp.verify((upd.owner == sp.sender) |
+                                      (self.is_administrator(sp.sender)))
+                            self.operator_set.add_for_all(self.data.operators_for_all,
+                                                          upd.owner,
+                                                          upd.operator)
+                        with arg.match("remove_operator") as upd:
+                            sp.verify((upd.owner == sp.sender) |
+                                      (self.is_administrator(sp.sender)))
+                            self.operator_set.remove_for_all(self.data.operators_for_all,
+                                                             upd.owner,
+                                                             upd.operator)
+            self.update_operators_for_all = sp.entry_point(update_operators_for_all)
+            extra_storage["operators_for_all"] = self.operator_set.make_for_all()
+        if self.config.track_total_supply:
+            # Kept by mint and burn for the total_supply views.
+            extra_storage["total_supply"] = self.config.my_map(tkey = token_id_type, tvalue = sp.TNat)
+        extra_storage[self.token_meta_data.big_map_name()] = self.config.my_map(
+            tvalue = self.token_meta_data.value_type())
         if config.lazy_entry_points:
             self.add_flag("lazy_entry_points")
         if config.lazy_entry_points_multiple:
             self.add_flag("lazy_entry_points_multiple")
         self.init(
             payout = sp.address("tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"), #bu adres degiscek
-            ledger =self.config.my_map(tvalue = Ledger_value.get_type()),
-            token_metadata =self.config.my_map(tvalue = self.token_meta_data.get_type()),
+            ledger = self.ledger(),
             operators = self.operator_set.make(),
             all_tokens = self.token_id_set.empty(),
             **extra_storage
         )
 
+    def token_metadata_map(self):
+        if self.config.compact_metadata:
+            return self.data.token_uris
+        return self.data.token_metadata
+
+    def ledger(self):
+        if self.config.nft_ledger:
+            return self.config.my_map(tkey = token_id_type, tvalue = Nft_ledger.get_type())
+        else:
+            return self.config.my_map(tvalue = Ledger_value.get_type())
+
     @sp.entry_point
     def transfer(self, params):
         sp.verify( ~self.is_paused() )
         sp.set_type(params, self.batch_transfer.get_type())
+        is_admin = sp.local("is_admin", self.is_administrator(sp.sender))
         sp.for transfer in params:
            current_from = transfer.from_
+           # Ownership only depends on `from_`: owners and the administrator
+           # skip the operator lookup of every tx. Operators are checked per
+           # tx, without a set of the token ids already checked for `from_`:
+           # its gas was never measured against this plain check.
+           is_owner = sp.local("is_owner", is_admin.value | (current_from == sp.sender))
+           if self.config.operator_for_all:
+               # An operator of all the tokens of `from_` is checked first and
+               # then needs no per-token approval.
+               sp.if ~ is_owner.value:
+                   is_owner.value = self.operator_set.is_member_for_all(
+                       self.data.operators_for_all, current_from, sp.sender)
            sp.for tx in transfer.txs:
                 if self.config.single_asset:
                     sp.verify(tx.token_id == 0, "single-asset: token-id <> 0")
                 if self.config.support_operator:
+                    sp.if ~ is_owner.value:
                           sp.verify(
-                              (self.is_administrator(sp.sender)) |
-                              (current_from == sp.sender) |
                               self.operator_set.is_member(self.data.operators,
                                                           current_from,
                                                           sp.sender,
@@ -327,38 +484,66 @@ class FA2_core(sp.Contract):
                               message = self.error_message.not_operator())
                 else:
                           sp.verify(
-                              (self.is_administrator(sp.sender)) |
-                              (current_from == sp.sender),
+                              is_owner.value,
                               message = self.error_message.not_owner())
-                sp.verify(self.data.token_metadata.contains(tx.token_id),
+                sp.verify(self.token_metadata_map().contains(tx.token_id),
                           message = self.error_message.token_undefined())
                 sp.if (tx.amount > 0):
-                    from_user = self.ledger_key.make(current_from, tx.token_id)
-                    sp.verify(
-                        (self.data.ledger[from_user].balance >= tx.amount),
-                        message = self.error_message.insufficient_balance())
-                    to_user = self.ledger_key.make(tx.to_, tx.token_id)
-                    self.data.ledger[from_user].balance = sp.as_nat(
-                        self.data.ledger[from_user].balance - tx.amount)
-                    sp.if self.data.ledger.contains(to_user):
-                        self.data.ledger[to_user].balance += tx.amount
-                    sp.else:
-                         self.data.ledger[to_user] = Ledger_value.make(tx.amount)
+                    if self.config.nft_ledger:
+                        # A single big_map update moves the token.
+                        sp.verify(
+                            (tx.amount == 1) &
+                            Nft_ledger.owns(self.data.ledger, current_from, tx.token_id),
+                            message = self.error_message.insufficient_balance())
+                        self.data.ledger[tx.token_id] = tx.to_
+                    else:
+                        from_user = sp.local("from_user", self.ledger_key.make(current_from, tx.token_id))
+                        from_balance = sp.local("from_balance", self.data.ledger[from_user.value].balance)
+                        sp.verify(
+                            (from_balance.value >= tx.amount),
+                            message = self.error_message.insufficient_balance())
+                        if self.config.lean_storage:
+                            sp.if from_balance.value == tx.amount:
+                                del self.data.ledger[from_user.value]
+                            sp.else:
+                                self.data.ledger[from_user.value].balance = sp.as_nat(
+                                    from_balance.value - tx.amount)
+                        else:
+                            self.data.ledger[from_user.value].balance = sp.as_nat(
+                                from_balance.value - tx.amount)
+                        to_user = sp.local("to_user", self.ledger_key.make(tx.to_, tx.token_id))
+                        sp.if self.data.ledger.contains(to_user.value):
+                            self.data.ledger[to_user.value].balance += tx.amount
+                        sp.else:
+                             self.data.ledger[to_user.value] = Ledger_value.make(tx.amount)
                 sp.else:
                     pass
-     
+           if self.config.emit_events:
+               # One event per batch item, its (from_, txs) as sent.
+               sp.emit(transfer, tag = "transfer")
+
     @sp.entry_point
     def burn(self, params):
         sp.set_type(params, sp.TRecord(address = sp.TAddress, token_id = sp.TNat, amount = sp.TNat))
         sp.verify( ~self.is_paused())
         sp.verify((self.is_administrator(sp.sender)) |(params.address == sp.sender),message = self.error_message.not_owner())
-        sp.verify(self.data.token_metadata.contains(params.token_id),message = self.error_message.token_undefined())
+        sp.verify(self.token_metadata_map().contains(params.token_id),message = self.error_message.token_undefined())
         sp.if (params.amount > 0):
-            from_user = self.ledger_key.make(params.address, params.token_id)
-            sp.verify((self.data.ledger[from_user].balance >= params.amount),message = self.error_message.insufficient_balance())
-            self.data.ledger[from_user].balance = sp.as_nat(self.data.ledger[from_user].balance - params.amount)
-            sp.if (self.data.ledger[from_user].balance == 0):
-                del self.data.ledger[from_user]
+            if self.config.nft_ledger:
+                sp.verify((params.amount == 1) &
+                          Nft_ledger.owns(self.data.ledger, params.address, params.token_id),
+                          message = self.error_message.insufficient_balance())
+                del self.data.ledger[params.token_id]
+            else:
+                from_user = self.ledger_key.make(params.address, params.token_id)
+                sp.verify((self.data.ledger[from_user].balance >= params.amount),message = self.error_message.insufficient_balance())
+                self.data.ledger[from_user].balance = sp.as_nat(self.data.ledger[from_user].balance - params.amount)
+                sp.if (self.data.ledger[from_user].balance == 0):
+                    del self.data.ledger[from_user]
+            if self.config.track_total_supply:
+                self.data.total_supply[params.token_id] = sp.as_nat(self.data.total_supply[params.token_id] - params.amount)
+            if self.config.emit_events:
+                sp.emit(params, tag = "burn")
         sp.else:
             pass
                      
@@ -367,24 +552,32 @@ class FA2_core(sp.Contract):
         sp.verify( ~self.is_paused() )
         sp.set_type(params, Balance_of.entry_point_type())
         def f_process_request(req):
-            user = self.ledger_key.make(req.owner, req.token_id)
-            sp.verify(self.data.token_metadata.contains(req.token_id),
+            sp.verify(self.token_metadata_map().contains(req.token_id),
                       message = self.error_message.token_undefined())
-            sp.if self.data.ledger.contains(user):
-                balance = self.data.ledger[user].balance
-                sp.result(
-                    sp.record(
-                        request = sp.record(
-                            owner = sp.set_type_expr(req.owner, sp.TAddress),
-                            token_id = sp.set_type_expr(req.token_id, sp.TNat)),
-                        balance = balance))
-            sp.else:
+            if self.config.nft_ledger:
                 sp.result(
                     sp.record(
                         request = sp.record(
                             owner = sp.set_type_expr(req.owner, sp.TAddress),
                             token_id = sp.set_type_expr(req.token_id, sp.TNat)),
-                        balance = 0))
+                        balance = Nft_ledger.balance(self.data.ledger, req.owner, req.token_id)))
+            else:
+                user = self.ledger_key.make(req.owner, req.token_id)
+                sp.if self.data.ledger.contains(user):
+                    balance = self.data.ledger[user].balance
+                    sp.result(
+                        sp.record(
+                            request = sp.record(
+                                owner = sp.set_type_expr(req.owner, sp.TAddress),
+                                token_id = sp.set_type_expr(req.token_id, sp.TNat)),
+                            balance = balance))
+                sp.else:
+                    sp.result(
+                        sp.record(
+                            request = sp.record(
+                                owner = sp.set_type_expr(req.owner, sp.TAddress),
+                                token_id = sp.set_type_expr(req.token_id, sp.TNat)),
+                            balance = 0))
         res = sp.local("responses", params.requests.map(f_process_request))
         destination = sp.set_type_expr(params.callback,
                                        sp.TContract(Balance_of.response_type()))
@@ -446,10 +639,13 @@ class FA2_pause(FA2_core):
         self.data.paused = params
 
 class FA2_mint(FA2_core):
-    @sp.entry_point
-    def mint(self, params):
-        sp.verify(self.is_administrator(sp.sender))
-        # We don't check for pauseness because we're the admin.
+    def mint_param_type(self):
+        return sp.TRecord(address = sp.TAddress,
+                          amount = sp.TNat,
+                          token_id = token_id_type,
+                          token_info = sp.TMap(sp.TString, sp.TBytes))
+
+    def mint_token(self, params):
         if self.config.single_asset:
             sp.verify(params.token_id == 0, "single-asset: token-id <> 0")
         if self.config.non_fungible:
@@ -457,19 +653,43 @@ class FA2_mint(FA2_core):
             sp.verify(~ self.token_id_set.contains(self.data.all_tokens,
                                                    params.token_id),
                       "NFT-asset: cannot mint twice same token")
-        user = self.ledger_key.make(params.address, params.token_id)
         self.token_id_set.add(self.data.all_tokens, params.token_id)
-        sp.if self.data.ledger.contains(user):
-            self.data.ledger[user].balance += params.amount
-        sp.else:
-            self.data.ledger[user] = Ledger_value.make(params.amount)
-        sp.if self.data.token_metadata.contains(params.token_id):
+        if self.config.nft_ledger:
+            self.data.ledger[params.token_id] = params.address
+        else:
+            user = self.ledger_key.make(params.address, params.token_id)
+            sp.if self.data.ledger.contains(user):
+                self.data.ledger[user].balance += params.amount
+            sp.else:
+                self.data.ledger[user] = Ledger_value.make(params.amount)
+        if self.config.track_total_supply:
+            self.data.total_supply[params.token_id] = self.data.total_supply.get(params.token_id, 0) + params.amount
+        sp.if self.token_metadata_map().contains(params.token_id):
              pass
         sp.else:
-             self.data.token_metadata[params.token_id] = sp.record(
-                 token_id=params.token_id,
-                 token_info=params.token_info
-                 )
+             self.token_metadata_map()[params.token_id] = self.token_meta_data.make(
+                 params.token_id, params.token_info)
+        if self.config.emit_events:
+            # The token_info is left out: it is in the token metadata map.
+            sp.emit(sp.record(address = params.address,
+                              token_id = params.token_id,
+                              amount = params.amount),
+                    tag = "mint")
+
+    @sp.entry_point
+    def mint(self, params):
+        sp.set_type(params, self.mint_param_type())
+        sp.verify(self.is_administrator(sp.sender))
+        # We don't check for pauseness because we're the admin.
+        self.mint_token(params)
+
+    @sp.entry_point
+    def mint_batch(self, params):
+        sp.set_type(params, sp.TList(self.mint_param_type()))
+        # The administrator check is paid once for the whole batch.
+        sp.verify(self.is_administrator(sp.sender))
+        sp.for item in params:
+            self.mint_token(item)
 
 class FA2_token_metadata(FA2_core):
     @sp.entry_point
@@ -483,10 +703,82 @@ class FA2_token_metadata(FA2_core):
                             sp.TUnit)
                     ).layout(("token_ids", "handler")))
         def f_on_request(req):
-            self.token_meta_data.set_type_and_layout(self.data.token_metadata[req])
-            sp.result(self.data.token_metadata[req])
+            sp.result(self.token_meta_data.get(self.token_metadata_map(), req))
         sp.compute(params.handler(params.token_ids.map(f_on_request)))
 
+    # TZIP-12 token_metadata off-chain view, published in the contract
+    # metadata of compact_metadata builds, whose token_uris big_map only
+    # holds the URIs.
+    @sp.offchain_view(pure = True, name = "token_metadata")
+    def token_metadata_view(self, token_id):
+        sp.set_type(token_id, token_id_type)
+        sp.verify(self.token_metadata_map().contains(token_id),
+                  message = self.error_message.token_undefined())
+        sp.result(self.token_meta_data.get(self.token_metadata_map(), token_id))
+
+class FA2_onchain_views(FA2_core):
+    # Unlike balance_of, the views answer 0 for undefined tokens instead of
+    # failing.
+    def ledger_balance(self, owner, token_id):
+        if self.config.nft_ledger:
+            return Nft_ledger.balance(self.data.ledger, owner, token_id)
+        user = self.ledger_key.make(owner, token_id)
+        return self.data.ledger.get(user, Ledger_value.make(0)).balance
+
+    @sp.onchain_view()
+    def get_balance(self, params):
+        sp.set_type(params, Balance_of.request_type())
+        sp.result(self.ledger_balance(params.owner, params.token_id))
+
+    @sp.onchain_view()
+    def get_balances(self, params):
+        sp.set_type(params, sp.TList(Balance_of.request_type()))
+        def f_process_request(req):
+            sp.result(sp.record(request = req,
+                                balance = self.ledger_balance(req.owner, req.token_id)))
+        sp.result(sp.set_type_expr(params.map(f_process_request),
+                                   Balance_of.response_type()))
+
+    # On-chain views of FA2_config(track_total_supply = True), added by FA2.
+    def total_supply(self, token_id):
+        sp.set_type(token_id, token_id_type)
+        sp.result(self.data.total_supply.get(token_id, 0))
+
+    def total_supplies(self, token_ids):
+        sp.set_type(token_ids, sp.TList(token_id_type))
+        def f_process_request(token_id):
+            sp.result(sp.record(token_id = token_id,
+                                total_supply = self.data.total_supply.get(token_id, 0)))
+        sp.result(token_ids.map(f_process_request))
+
+    @sp.onchain_view()
+    def is_operator(self, params):
+        sp.set_type(params, self.operator_param.get_type())
+        if self.config.operator_for_all:
+            sp.result(self.operator_set.is_member_for_all(self.data.operators_for_all,
+                                                          params.owner,
+                                                          params.operator) |
+                      self.operator_set.is_member(self.data.operators,
+                                                  params.owner,
+                                                  params.operator,
+                                                  params.token_id))
+        elif self.config.support_operator:
+            sp.result(self.operator_set.is_member(self.data.operators,
+                                                  params.owner,
+                                                  params.operator,
+                                                  params.token_id))
+        else:
+            sp.result(sp.bool(False))
+
+    @sp.onchain_view()
+    def all_tokens(self):
+        sp.set_result_type(sp.TList(token_id_type))
+        if self.token_id_set.enumerable():
+            sp.result(self.token_id_set.elements(self.data.all_tokens))
+        else:
+            # The keys of a big_map cannot be listed on chain.
+            sp.failwith(self.error_message.not_enumerable())
+
 def global_parameter(env_var, default):
     try:
         if os.environ[env_var] == "true" :
@@ -510,10 +802,34 @@ def environment_config():
         add_permissions_descriptor = global_parameter("add_permissions_descriptor", False),
         lazy_entry_points = global_parameter("lazy_entry_points", False),
         lazy_entry_points_multiple = global_parameter("lazy_entry_points_multiple", False),
+        lean_storage = global_parameter("lean_storage", False),
+        compact_metadata = global_parameter("compact_metadata", False),
+        operator_for_all = global_parameter("operator_for_all", False),
+        nft_ledger = global_parameter("nft_ledger", False),
+        emit_events = global_parameter("emit_events", False),
+        track_total_supply = global_parameter("track_total_supply", False),
     )
-class FA2(FA2_token_metadata, FA2_mint, FA2_administrator, FA2_pause, FA2_core):
+def load_metadata(name):
+    # Scripts imported with sp.io.import_script_from_url have no __file__;
+    # they are run from the root of the repository.
+    try:
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+    except NameError:
+        root = os.curdir
+    with open(os.path.join(root, "metadatas", name)) as f:
+        return json.load(f)
+
+class FA2(FA2_onchain_views, FA2_token_metadata, FA2_mint, FA2_administrator, FA2_pause, FA2_core):
     def __init__(self, config, admin, meta):
+        if config.track_total_supply:
+            self.total_supply = sp.onchain_view()(FA2_onchain_views.total_supply)
+            self.total_supplies = sp.onchain_view()(FA2_onchain_views.total_supplies)
         FA2_core.__init__(self, config, paused = False, administrator = admin, metadata = meta)
+        if config.compact_metadata:
+            # Compiled next to the contract as
+            # *_metadata.fa2_metadata.json, with the Michelson of the view.
+            self.init_metadata("fa2_metadata", dict(load_metadata("fa2_metadata.json"),
+                                                    views = [self.token_metadata_view]))
 
 
 sp.add_compilation_target("FA2", FA2(
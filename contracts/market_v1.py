@@ -1,5 +1,37 @@
+import os
 import smartpy as sp
 
+class Market_config:
+    def __init__(self,
+                 live_royalties = False,
+                 escrow       = True,
+                 lazy_entry_points = False,
+                 pull_payments = False,
+                 emit_events = False,
+                 bundles = False
+                 ):
+        self.live_royalties = live_royalties
+        self.escrow = escrow
+        self.lazy_entry_points = lazy_entry_points
+        self.pull_payments = pull_payments
+        self.emit_events = emit_events
+        self.bundles = bundles
+
+        name = "typedmarket"
+        if live_royalties:
+            name += "-live_royalties"
+        if not escrow:
+            name += "-no_escrow"
+        if lazy_entry_points:
+            name += "-lazy"
+        if pull_payments:
+            name += "-pull"
+        if emit_events:
+            name += "-events"
+        if bundles:
+            name += "-bundles"
+        self.name = name
+
 class TypedMarket(sp.Contract):
     SWAP_TYPE = sp.TRecord(
         issuer=sp.TAddress,
@@ -11,20 +43,87 @@ class TypedMarket(sp.Contract):
         creator=sp.TAddress).layout(
             ("issuer", ("fa2", ("objkt_id", ("objkt_amount", ("xtz_per_objkt", ("royalties", "creator")))))))
 
-    def __init__(self, manager, metadata, allowed_fa2s, fee, royalties):
-        self.init_type(sp.TRecord(
+    # With live_royalties, swaps read the royalties from storage at collect
+    # time instead of keeping the value they were listed with: the manager's
+    # update_royalties also changes the terms of open swaps.
+    LIVE_ROYALTIES_SWAP_TYPE = sp.TRecord(
+        issuer=sp.TAddress,
+        fa2=sp.TAddress,
+        objkt_id=sp.TNat,
+        objkt_amount=sp.TNat,
+        xtz_per_objkt=sp.TMutez,
+        creator=sp.TAddress).layout(
+            ("issuer", ("fa2", ("objkt_id", ("objkt_amount", ("xtz_per_objkt", "creator"))))))
+
+    TX_TYPE = sp.TRecord(
+        to_=sp.TAddress,
+        token_id=sp.TNat,
+        amount=sp.TNat).layout(("to_", ("token_id", "amount")))
+
+    TRANSFER_TYPE = sp.TRecord(
+        from_=sp.TAddress,
+        txs=sp.TList(TX_TYPE)).layout(("from_", "txs"))
+
+    # A bundle sells all its items at once, for xtz_per_bundle.
+    BUNDLE_ITEM_TYPE = sp.TRecord(
+        token_id=sp.TNat,
+        amount=sp.TNat).layout(("token_id", "amount"))
+
+    BUNDLE_TYPE = sp.TRecord(
+        issuer=sp.TAddress,
+        fa2=sp.TAddress,
+        items=sp.TList(BUNDLE_ITEM_TYPE),
+        xtz_per_bundle=sp.TMutez,
+        royalties=sp.TNat,
+        creator=sp.TAddress).layout(
+            ("issuer", ("fa2", ("items", ("xtz_per_bundle", ("royalties", "creator"))))))
+
+    LIVE_ROYALTIES_BUNDLE_TYPE = sp.TRecord(
+        issuer=sp.TAddress,
+        fa2=sp.TAddress,
+        items=sp.TList(BUNDLE_ITEM_TYPE),
+        xtz_per_bundle=sp.TMutez,
+        creator=sp.TAddress).layout(
+            ("issuer", ("fa2", ("items", ("xtz_per_bundle", "creator")))))
+
+    # Entry points stored as big_map lambdas with lazy_entry_points, and
+    # cancel_bundle with bundles.
+    LAZY_ENTRY_POINTS = ["cancel_swap", "cancel_swaps", "update_price",
+                         "update_fee", "update_royalties", "set_pause_swaps",
+                         "set_pause_collects", "payout_balance"]
+
+    # The lazy entry points the manager can replace with update_entry_point:
+    # only the settings. The ones that move escrowed tokens or tez keep the
+    # code the contract was originated with.
+    UPDATABLE_ENTRY_POINTS = ["update_fee", "update_royalties",
+                              "set_pause_swaps", "set_pause_collects"]
+
+    def __init__(self, manager, metadata, allowed_fa2s, fee, royalties, config = None):
+        self.config = config if config is not None else Market_config()
+        if self.config.lazy_entry_points:
+            # Only the swap and collect entry points stay in the contract code
+            # that every call parses.
+            self.add_flag("lazy_entry_points")
+            def update_entry_point(self, params):
+                self.check_is_manager()
+                self.check_no_tez_transfer()
+                with params.match_cases() as arg:
+                    for name in TypedMarket.UPDATABLE_ENTRY_POINTS:
+                        with arg.match(name) as code:
+                            sp.set_entry_point(name, code)
+            self.update_entry_point = sp.entry_point(update_entry_point, lazify = False)
+        storage_type = dict(
             manager=sp.TAddress,
             metadata=sp.TBigMap(sp.TString, sp.TBytes),
             allowed_fa2s=sp.TBigMap(sp.TAddress, sp.TUnit),
-            swaps=sp.TBigMap(sp.TNat, TypedMarket.SWAP_TYPE),
+            swaps=sp.TBigMap(sp.TNat, self.swap_type()),
             fee=sp.TNat,
             royalties=sp.TNat,
             fee_recipient=sp.TAddress,
             counter=sp.TNat,
             swaps_paused=sp.TBool,
-            collects_paused=sp.TBool))
-
-        self.init(
+            collects_paused=sp.TBool)
+        storage = dict(
             manager=manager,
             metadata=metadata,
             allowed_fa2s=allowed_fa2s,
@@ -35,6 +134,63 @@ class TypedMarket(sp.Contract):
             counter=0,
             swaps_paused=False,
             collects_paused=False)
+        if self.config.pull_payments:
+            # Collects credit the proceeds here instead of sending them;
+            # pending_total is the part of the balance they owe.
+            def withdraw(self):
+                self.check_no_tez_transfer()
+                amount = sp.local("amount", self.data.pending_payouts.get(sp.sender, sp.mutez(0)))
+                sp.verify(amount.value > sp.mutez(0), message="MP_NOTHING_TO_WITHDRAW")
+                del self.data.pending_payouts[sp.sender]
+                self.data.pending_total -= amount.value
+                sp.send(sp.sender, amount.value)
+            self.withdraw = sp.entry_point(withdraw, lazify = False)
+            storage_type.update(pending_payouts=sp.TBigMap(sp.TAddress, sp.TMutez),
+                                pending_total=sp.TMutez)
+            storage.update(pending_payouts=sp.big_map(),
+                           pending_total=sp.mutez(0))
+        if self.config.bundles:
+            # Bundles are numbered with the swaps, by counter.
+            self.swap_bundle = sp.entry_point(TypedMarket.swap_bundle, lazify = False)
+            self.collect_bundle = sp.entry_point(TypedMarket.collect_bundle, lazify = False)
+            self.cancel_bundle = sp.entry_point(TypedMarket.cancel_bundle)
+            self.get_bundle = sp.onchain_view()(TypedMarket.get_bundle)
+            storage_type.update(bundles=sp.TBigMap(sp.TNat, self.bundle_type()))
+            storage.update(bundles=sp.big_map())
+        self.init_type(sp.TRecord(**storage_type))
+        self.init(**storage)
+
+    def swap_type(self):
+        if self.config.live_royalties:
+            return TypedMarket.LIVE_ROYALTIES_SWAP_TYPE
+        return TypedMarket.SWAP_TYPE
+
+    def make_swap(self, issuer, fa2, objkt_id, objkt_amount, xtz_per_objkt, creator):
+        if self.config.live_royalties:
+            return sp.record(issuer=issuer,fa2=fa2,objkt_id=objkt_id,objkt_amount=objkt_amount,xtz_per_objkt=xtz_per_objkt,creator=creator)
+        return sp.record(issuer=issuer,fa2=fa2,objkt_id=objkt_id,objkt_amount=objkt_amount,xtz_per_objkt=xtz_per_objkt,royalties=self.data.royalties,creator=creator)
+
+    def bundle_type(self):
+        if self.config.live_royalties:
+            return TypedMarket.LIVE_ROYALTIES_BUNDLE_TYPE
+        return TypedMarket.BUNDLE_TYPE
+
+    def make_bundle(self, issuer, fa2, items, xtz_per_bundle, creator):
+        if self.config.live_royalties:
+            return sp.record(issuer=issuer,fa2=fa2,items=items,xtz_per_bundle=xtz_per_bundle,creator=creator)
+        return sp.record(issuer=issuer,fa2=fa2,items=items,xtz_per_bundle=xtz_per_bundle,royalties=self.data.royalties,creator=creator)
+
+    def swap_royalties(self, swap):
+        if self.config.live_royalties:
+            return self.data.royalties
+        return swap.royalties
+
+    def token_holder(self, issuer):
+        # Without escrow the tokens stay with the issuer, the market being
+        # one of their operators, until they are collected.
+        if self.config.escrow:
+            return sp.self_address
+        return issuer
 
     def check_is_manager(self):
         sp.verify(sp.sender == self.data.manager, message="MP_NOT_MANAGER")
@@ -42,49 +198,143 @@ class TypedMarket(sp.Contract):
     def check_no_tez_transfer(self):
         sp.verify(sp.amount == sp.tez(0), message="MP_TEZ_TRANSFER")
 
-    @sp.entry_point
+    @sp.entry_point(lazify = False)
     def swap(self, params):
         sp.set_type(params, sp.TRecord(fa2=sp.TAddress,objkt_id=sp.TNat,objkt_amount=sp.TNat,xtz_per_objkt=sp.TMutez,royalties=sp.TNat,creator=sp.TAddress).layout(("fa2", ("objkt_id", ("objkt_amount", ("xtz_per_objkt", ("royalties", "creator")))))))
         sp.verify(~self.data.swaps_paused, message="MP_SWAPS_PAUSED")
         self.check_no_tez_transfer()
         sp.verify(self.data.allowed_fa2s.contains(params.fa2),message="MP_FA2_NOT_ALLOWED")
         sp.verify(params.objkt_amount > 0, message="MP_NO_SWAPPED_EDITIONS")
-        self.fa2_transfer(fa2=params.fa2,from_=sp.sender,to_=sp.self_address,token_id=params.objkt_id,token_amount=params.objkt_amount)
-        self.data.swaps[self.data.counter] = sp.record(issuer=sp.sender,fa2=params.fa2,objkt_id=params.objkt_id,objkt_amount=params.objkt_amount,xtz_per_objkt=params.xtz_per_objkt,royalties= self.data.royalties,creator=params.creator)
+        if self.config.escrow:
+            self.fa2_transfer(fa2=params.fa2,from_=sp.sender,to_=sp.self_address,token_id=params.objkt_id,token_amount=params.objkt_amount)
+        self.data.swaps[self.data.counter] = self.make_swap(issuer=sp.sender,fa2=params.fa2,objkt_id=params.objkt_id,objkt_amount=params.objkt_amount,xtz_per_objkt=params.xtz_per_objkt,creator=params.creator)
+        if self.config.emit_events:
+            sp.emit(sp.record(swap_id=self.data.counter,issuer=sp.sender,fa2=params.fa2,objkt_id=params.objkt_id,objkt_amount=params.objkt_amount,xtz_per_objkt=params.xtz_per_objkt), tag="swap")
         self.data.counter += 1
 
-    @sp.entry_point
+    @sp.entry_point(lazify = False)
     def collect(self, swap_id):
         sp.set_type(swap_id, sp.TNat)
+        self.collect_swap(swap_id, sp.nat(1))
+
+    @sp.entry_point(lazify = False)
+    def collect_editions(self, params):
+        sp.set_type(params, sp.TRecord(swap_id=sp.TNat, quantity=sp.TNat).layout(("swap_id", "quantity")))
+        self.collect_swap(params.swap_id, params.quantity)
+
+    @sp.entry_point(lazify = False)
+    def collect_batch(self, swap_ids):
+        sp.set_type(swap_ids, sp.TList(sp.TNat))
         sp.verify(~self.data.collects_paused, message="MP_COLLECTS_PAUSED")
-        sp.verify(self.data.swaps.contains(swap_id), message="MP_WRONG_SWAP_ID")
-        swap = sp.local("swap", self.data.swaps[swap_id])
-        sp.verify(sp.sender != swap.value.issuer, message="MP_IS_SWAP_ISSUER")
-        sp.verify(sp.amount == swap.value.xtz_per_objkt,message="MP_WRONG_TEZ_AMOUNT")
-        sp.verify(swap.value.objkt_amount > 0, message="MP_SWAP_COLLECTED")
-        with sp.if_(swap.value.xtz_per_objkt != sp.tez(0)):
-            royalties_amount = sp.local("royalties_amount", sp.split_tokens(swap.value.xtz_per_objkt, swap.value.royalties, 1000))
-            with sp.if_(royalties_amount.value > sp.mutez(0)):
-                sp.send(swap.value.creator, royalties_amount.value)
-            fee_amount = sp.local("fee_amount", sp.split_tokens(swap.value.xtz_per_objkt, self.data.fee, 1000))
-            with sp.if_(fee_amount.value > sp.mutez(0)):
-                sp.send(self.data.fee_recipient, fee_amount.value)
-            sp.send(swap.value.issuer, sp.amount - royalties_amount.value - fee_amount.value)
-        self.fa2_transfer(fa2=swap.value.fa2,from_=sp.self_address,to_=sp.sender,token_id=swap.value.objkt_id,token_amount=1)
-        self.data.swaps[swap_id].objkt_amount = sp.as_nat(swap.value.objkt_amount - 1)
-        with sp.if_(self.data.swaps[swap_id].objkt_amount == 0):
-            del self.data.swaps[swap_id]
-            
+        total = sp.local("total", sp.mutez(0))
+        payouts = sp.local("payouts", sp.map(tkey=sp.TAddress, tvalue=sp.TMutez))
+        transfers = sp.local("transfers", self.empty_transfers())
+        def credit(address, amount):
+            payouts.value[address] = payouts.value.get(address, sp.mutez(0)) + amount
+        with sp.for_("swap_id", swap_ids) as swap_id:
+            sp.verify(self.data.swaps.contains(swap_id), message="MP_WRONG_SWAP_ID")
+            swap = sp.local("swap", self.data.swaps[swap_id])
+            sp.verify(sp.sender != swap.value.issuer, message="MP_IS_SWAP_ISSUER")
+            sp.verify(swap.value.objkt_amount > 0, message="MP_SWAP_COLLECTED")
+            total.value += swap.value.xtz_per_objkt
+            with sp.if_(swap.value.xtz_per_objkt != sp.tez(0)):
+                self.split_payment(swap.value, swap.value.xtz_per_objkt, credit)
+            self.queue_transfer(transfers.value, fa2=swap.value.fa2,from_=self.token_holder(swap.value.issuer),tx=sp.record(to_=sp.sender,token_id=swap.value.objkt_id,amount=1))
+            self.emit_collect(swap_id, sp.nat(1))
+            with sp.if_(swap.value.objkt_amount == 1):
+                del self.data.swaps[swap_id]
+            with sp.else_():
+                self.data.swaps[swap_id].objkt_amount = sp.as_nat(swap.value.objkt_amount - 1)
+        sp.verify(sp.amount == total.value, message="MP_WRONG_TEZ_AMOUNT")
+        with sp.for_("payout", payouts.value.items()) as payout:
+            with sp.if_(payout.value > sp.mutez(0)):
+                self.pay(payout.key, payout.value)
+        self.send_transfers(transfers.value)
+
     @sp.entry_point
     def cancel_swap(self, swap_id):
         sp.set_type(swap_id, sp.TNat)
         self.check_no_tez_transfer()
-        sp.verify(self.data.swaps.contains(swap_id), message="MP_WRONG_SWAP_ID")
-        swap = sp.local("swap", self.data.swaps[swap_id])
-        sp.verify(sp.sender == swap.value.issuer, message="MP_NOT_SWAP_ISSUER")
-        sp.verify(swap.value.objkt_amount > 0, message="MP_SWAP_COLLECTED")
-        self.fa2_transfer(fa2=swap.value.fa2,from_=sp.self_address,to_=sp.sender,token_id=swap.value.objkt_id,token_amount=swap.value.objkt_amount)
-        del self.data.swaps[swap_id]
+        swap = self.remove_swap(swap_id)
+        if self.config.escrow:
+            self.fa2_transfer(fa2=swap.value.fa2,from_=sp.self_address,to_=sp.sender,token_id=swap.value.objkt_id,token_amount=swap.value.objkt_amount)
+
+    @sp.entry_point
+    def cancel_swaps(self, swap_ids):
+        sp.set_type(swap_ids, sp.TList(sp.TNat))
+        self.check_no_tez_transfer()
+        transfers = sp.local("transfers", self.empty_transfers())
+        with sp.for_("swap_id", swap_ids) as swap_id:
+            swap = self.remove_swap(swap_id)
+            if self.config.escrow:
+                self.queue_transfer(transfers.value, fa2=swap.value.fa2,from_=sp.self_address,tx=sp.record(to_=sp.sender,token_id=swap.value.objkt_id,amount=swap.value.objkt_amount))
+        if self.config.escrow:
+            self.send_transfers(transfers.value)
+
+    @sp.entry_point
+    def update_price(self, params):
+        sp.set_type(params, sp.TRecord(swap_id=sp.TNat, xtz_per_objkt=sp.TMutez).layout(("swap_id", "xtz_per_objkt")))
+        sp.verify(~self.data.swaps_paused, message="MP_SWAPS_PAUSED")
+        self.check_no_tez_transfer()
+        sp.verify(self.data.swaps.contains(params.swap_id), message="MP_WRONG_SWAP_ID")
+        sp.verify(sp.sender == self.data.swaps[params.swap_id].issuer, message="MP_NOT_SWAP_ISSUER")
+        self.data.swaps[params.swap_id].xtz_per_objkt = params.xtz_per_objkt
+        if self.config.emit_events:
+            sp.emit(params, tag="update_price")
+
+    # Entry points of Market_config(bundles = True).
+    def swap_bundle(self, params):
+        sp.set_type(params, sp.TRecord(fa2=sp.TAddress,items=sp.TList(TypedMarket.BUNDLE_ITEM_TYPE),xtz_per_bundle=sp.TMutez,creator=sp.TAddress).layout(("fa2", ("items", ("xtz_per_bundle", "creator")))))
+        sp.verify(~self.data.swaps_paused, message="MP_SWAPS_PAUSED")
+        self.check_no_tez_transfer()
+        sp.verify(self.data.allowed_fa2s.contains(params.fa2),message="MP_FA2_NOT_ALLOWED")
+        sp.verify(sp.len(params.items) > 0, message="MP_NO_SWAPPED_EDITIONS")
+        with sp.for_("item", params.items) as item:
+            sp.verify(item.amount > 0, message="MP_NO_SWAPPED_EDITIONS")
+        if self.config.escrow:
+            # All the items in one FA2 transfer.
+            self.fa2_transfer_txs(fa2=params.fa2,from_=sp.sender,txs=self.bundle_txs(params.items, sp.self_address))
+        self.data.bundles[self.data.counter] = self.make_bundle(issuer=sp.sender,fa2=params.fa2,items=params.items,xtz_per_bundle=params.xtz_per_bundle,creator=params.creator)
+        if self.config.emit_events:
+            sp.emit(sp.record(bundle_id=self.data.counter,issuer=sp.sender,fa2=params.fa2,items=params.items,xtz_per_bundle=params.xtz_per_bundle), tag="swap_bundle")
+        self.data.counter += 1
+
+    def collect_bundle(self, bundle_id):
+        sp.set_type(bundle_id, sp.TNat)
+        sp.verify(~self.data.collects_paused, message="MP_COLLECTS_PAUSED")
+        sp.verify(self.data.bundles.contains(bundle_id), message="MP_WRONG_SWAP_ID")
+        bundle = sp.local("bundle", self.data.bundles[bundle_id])
+        sp.verify(sp.sender != bundle.value.issuer, message="MP_IS_SWAP_ISSUER")
+        sp.verify(sp.amount == bundle.value.xtz_per_bundle, message="MP_WRONG_TEZ_AMOUNT")
+        with sp.if_(bundle.value.xtz_per_bundle != sp.tez(0)):
+            self.split_payment(bundle.value, bundle.value.xtz_per_bundle, self.pay)
+        self.fa2_transfer_txs(fa2=bundle.value.fa2,from_=self.token_holder(bundle.value.issuer),txs=self.bundle_txs(bundle.value.items, sp.sender))
+        del self.data.bundles[bundle_id]
+        if self.config.emit_events:
+            sp.emit(sp.record(bundle_id=bundle_id,buyer=sp.sender), tag="collect_bundle")
+
+    def cancel_bundle(self, bundle_id):
+        sp.set_type(bundle_id, sp.TNat)
+        self.check_no_tez_transfer()
+        sp.verify(self.data.bundles.contains(bundle_id), message="MP_WRONG_SWAP_ID")
+        bundle = sp.local("bundle", self.data.bundles[bundle_id])
+        sp.verify(sp.sender == bundle.value.issuer, message="MP_NOT_SWAP_ISSUER")
+        del self.data.bundles[bundle_id]
+        if self.config.escrow:
+            self.fa2_transfer_txs(fa2=bundle.value.fa2,from_=sp.self_address,txs=self.bundle_txs(bundle.value.items, sp.sender))
+        if self.config.emit_events:
+            sp.emit(bundle_id, tag="cancel_bundle")
+
+    def get_bundle(self, bundle_id):
+        sp.set_type(bundle_id, sp.TNat)
+        sp.verify(self.data.bundles.contains(bundle_id), message="MP_WRONG_SWAP_ID")
+        if self.config.live_royalties:
+            bundle = sp.local("bundle", self.data.bundles[bundle_id])
+            sp.result(sp.set_type_expr(
+                sp.record(issuer=bundle.value.issuer,fa2=bundle.value.fa2,items=bundle.value.items,xtz_per_bundle=bundle.value.xtz_per_bundle,royalties=self.data.royalties,creator=bundle.value.creator),
+                TypedMarket.BUNDLE_TYPE))
+        else:
+            sp.result(self.data.bundles[bundle_id])
 
     @sp.entry_point
     def update_fee(self, new_fee):
@@ -119,16 +369,143 @@ class TypedMarket(sp.Contract):
     @sp.entry_point
     def payout_balance(self):
         sp.verify(sp.sender == self.data.manager, message="only the admin can receive the payment from the contract")
-        sp.send(self.data.manager,sp.balance)
-        
+        if self.config.pull_payments:
+            sp.send(self.data.manager,sp.balance - self.data.pending_total)
+        else:
+            sp.send(self.data.manager,sp.balance)
+
+    @sp.onchain_view()
+    def get_swap(self, swap_id):
+        sp.set_type(swap_id, sp.TNat)
+        sp.verify(self.data.swaps.contains(swap_id), message="MP_WRONG_SWAP_ID")
+        if self.config.live_royalties:
+            # Swaps are returned with the market-wide royalties so that
+            # callers see the same record type in every configuration.
+            swap = sp.local("swap", self.data.swaps[swap_id])
+            sp.result(sp.set_type_expr(
+                sp.record(issuer=swap.value.issuer,fa2=swap.value.fa2,objkt_id=swap.value.objkt_id,objkt_amount=swap.value.objkt_amount,xtz_per_objkt=swap.value.xtz_per_objkt,royalties=self.data.royalties,creator=swap.value.creator),
+                TypedMarket.SWAP_TYPE))
+        else:
+            sp.result(self.data.swaps[swap_id])
+
+    @sp.onchain_view()
+    def get_counter(self):
+        sp.result(self.data.counter)
+
+    @sp.onchain_view()
+    def get_fee(self):
+        sp.result(self.data.fee)
+
+    @sp.onchain_view()
+    def get_royalties(self):
+        sp.result(self.data.royalties)
+
+    def collect_swap(self, swap_id, quantity):
+        sp.verify(~self.data.collects_paused, message="MP_COLLECTS_PAUSED")
+        sp.verify(self.data.swaps.contains(swap_id), message="MP_WRONG_SWAP_ID")
+        swap = sp.local("swap", self.data.swaps[swap_id])
+        sp.verify(sp.sender != swap.value.issuer, message="MP_IS_SWAP_ISSUER")
+        sp.verify(quantity > 0, message="MP_NO_COLLECTED_EDITIONS")
+        sp.verify(swap.value.objkt_amount >= quantity, message="MP_SWAP_COLLECTED")
+        total = sp.local("total", sp.split_tokens(swap.value.xtz_per_objkt, quantity, 1))
+        sp.verify(sp.amount == total.value,message="MP_WRONG_TEZ_AMOUNT")
+        with sp.if_(total.value != sp.tez(0)):
+            self.split_payment(swap.value, total.value, self.pay)
+        self.fa2_transfer(fa2=swap.value.fa2,from_=self.token_holder(swap.value.issuer),to_=sp.sender,token_id=swap.value.objkt_id,token_amount=quantity)
+        self.emit_collect(swap_id, quantity)
+        with sp.if_(swap.value.objkt_amount == quantity):
+            del self.data.swaps[swap_id]
+        with sp.else_():
+            self.data.swaps[swap_id].objkt_amount = sp.as_nat(swap.value.objkt_amount - quantity)
+
+    def remove_swap(self, swap_id):
+        sp.verify(self.data.swaps.contains(swap_id), message="MP_WRONG_SWAP_ID")
+        swap = sp.local("swap", self.data.swaps[swap_id])
+        sp.verify(sp.sender == swap.value.issuer, message="MP_NOT_SWAP_ISSUER")
+        sp.verify(swap.value.objkt_amount > 0, message="MP_SWAP_COLLECTED")
+        del self.data.swaps[swap_id]
+        if self.config.emit_events:
+            sp.emit(swap_id, tag="cancel_swap")
+        return swap
+
+    def emit_collect(self, swap_id, quantity):
+        # The price paid is the one of the last swap or update_price event.
+        if self.config.emit_events:
+            sp.emit(sp.record(swap_id=swap_id,buyer=sp.sender,quantity=quantity), tag="collect")
+
+    def pay(self, address, amount):
+        if self.config.pull_payments:
+            self.data.pending_payouts[address] = self.data.pending_payouts.get(address, sp.mutez(0)) + amount
+            self.data.pending_total += amount
+        else:
+            sp.send(address, amount)
+
+    def split_payment(self, swap, total, pay):
+        royalties_amount = sp.local("royalties_amount", sp.split_tokens(total, self.swap_royalties(swap), 1000))
+        with sp.if_(royalties_amount.value > sp.mutez(0)):
+            pay(swap.creator, royalties_amount.value)
+        fee_amount = sp.local("fee_amount", sp.split_tokens(total, self.data.fee, 1000))
+        with sp.if_(fee_amount.value > sp.mutez(0)):
+            pay(self.data.fee_recipient, fee_amount.value)
+        pay(swap.issuer, total - royalties_amount.value - fee_amount.value)
+
     def fa2_transfer(self, fa2, from_, to_, token_id, token_amount):
-        c = sp.contract(t=sp.TList(sp.TRecord(from_=sp.TAddress,txs=sp.TList(sp.TRecord(to_=sp.TAddress,token_id=sp.TNat,amount=sp.TNat).layout(("to_", ("token_id", "amount")))))),address=fa2,entry_point="transfer").open_some()
-        sp.transfer(arg=sp.list([sp.record(from_=from_,txs=sp.list([sp.record(to_=to_,token_id=token_id,amount=token_amount)]))]),amount=sp.mutez(0),destination=c)
+        self.fa2_transfer_txs(fa2=fa2,from_=from_,txs=sp.list([sp.record(to_=to_,token_id=token_id,amount=token_amount)]))
+
+    def fa2_transfer_txs(self, fa2, from_, txs):
+        self.fa2_transfer_batch(fa2=fa2,batch=sp.list([sp.record(from_=from_,txs=txs)]))
+
+    def fa2_transfer_batch(self, fa2, batch):
+        c = sp.contract(t=sp.TList(TypedMarket.TRANSFER_TYPE),address=fa2,entry_point="transfer").open_some()
+        sp.transfer(arg=batch,amount=sp.mutez(0),destination=c)
+
+    def bundle_txs(self, items, to_):
+        txs = sp.local("txs", sp.list(t=TypedMarket.TX_TYPE))
+        with sp.for_("item", items) as item:
+            txs.value.push(sp.record(to_=to_,token_id=item.token_id,amount=item.amount))
+        return txs.value
+
+    # Pending transfers: fa2 -> from_ -> txs, sent with one FA2 call per fa2.
+    def empty_transfers(self):
+        return sp.map(tkey=sp.TAddress, tvalue=sp.TMap(sp.TAddress, sp.TList(TypedMarket.TX_TYPE)))
+
+    def queue_transfer(self, transfers, fa2, from_, tx):
+        sources = sp.local("sources", transfers.get(fa2, sp.map(tkey=sp.TAddress, tvalue=sp.TList(TypedMarket.TX_TYPE))))
+        sources.value[from_] = sp.cons(tx, sources.value.get(from_, sp.list(t=TypedMarket.TX_TYPE)))
+        transfers[fa2] = sources.value
+
+    def send_transfers(self, transfers):
+        with sp.for_("transfer", transfers.items()) as transfer:
+            batch = sp.local("batch", sp.list(t=TypedMarket.TRANSFER_TYPE))
+            with sp.for_("source", transfer.value.items()) as source:
+                batch.value.push(sp.record(from_=source.key,txs=source.value))
+            self.fa2_transfer_batch(fa2=transfer.key,batch=batch.value)
+
+def global_parameter(env_var, default):
+    try:
+        if os.environ[env_var] == "true" :
+            return True
+        if os.environ[env_var] == "false" :
+            return False
+        return default
+    except:
+        return default
+
+def environment_config():
+    return Market_config(
+        live_royalties = global_parameter("live_royalties", False),
+        escrow = global_parameter("escrow", True),
+        lazy_entry_points = global_parameter("lazy_entry_points", False),
+        pull_payments = global_parameter("pull_payments", False),
+        emit_events = global_parameter("emit_events", False),
+        bundles = global_parameter("bundles", False),
+    )
 
 sp.add_compilation_target("typedmarket", TypedMarket(
     manager=sp.address("tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"),
     metadata=sp.utils.metadata_of_url("ipfs://QmNoYCy8RA2FEjpb6kzQbmo4w8nVuWkNEJRoQhsV7VBEun"),
     allowed_fa2s=sp.big_map({sp.address("KT1J6NY5AU61GzUX51n59wwiZcGJ9DrNTwbK"): sp.unit}),
     royalties=sp.nat(100),
-    fee=sp.nat(50)))
+    fee=sp.nat(50),
+    config=environment_config()))
 
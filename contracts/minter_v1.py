@@ -1,8 +1,40 @@
+import os
 import smartpy as sp
 
+class Minter_config:
+    def __init__(self,
+                 lazy_entry_points = False
+                 ):
+        self.lazy_entry_points = lazy_entry_points
+
+        name = "minter"
+        if lazy_entry_points:
+            name += "-lazy"
+        self.name = name
+
 
 class TypedMinter(sp.Contract):
-    def __init__(self, objkt, manager, metadata, royal):
+    MINT_TYPE = sp.TRecord(address=sp.TAddress,amount=sp.TNat,token_id=sp.TNat,token_info=sp.TMap(sp.TString, sp.TBytes))
+
+    # Entry points stored as big_map lambdas with lazy_entry_points.
+    LAZY_ENTRY_POINTS = ["update_royalties", "set_pause_mint", "payout_balance"]
+
+    # The lazy entry points the manager can replace with update_entry_point.
+    UPDATABLE_ENTRY_POINTS = ["update_royalties", "set_pause_mint"]
+
+    def __init__(self, objkt, manager, metadata, royal, config = None):
+        self.config = config if config is not None else Minter_config()
+        if self.config.lazy_entry_points:
+            # Only the mint entry points stay in the contract code that every
+            # call parses.
+            self.add_flag("lazy_entry_points")
+            def update_entry_point(self, params):
+                sp.verify(sp.sender == self.data.manager, message="MP_NOT_MANAGER")
+                with params.match_cases() as arg:
+                    for name in TypedMinter.UPDATABLE_ENTRY_POINTS:
+                        with arg.match(name) as code:
+                            sp.set_entry_point(name, code)
+            self.update_entry_point = sp.entry_point(update_entry_point, lazify = False)
         self.init(
             royalties = sp.big_map(tkey=sp.TNat, tvalue=sp.TRecord(issuer=sp.TAddress, royalties=sp.TNat)),
             objkt_id = 0,
@@ -12,15 +44,31 @@ class TypedMinter(sp.Contract):
             royal=royal,
             mint_paused=False
             )
-    @sp.entry_point
+    @sp.entry_point(lazify = False)
     def mint_TYPED(self, params):
         sp.verify((params.amount > 0) & (params.amount <= 9999))
         sp.verify(~self.data.mint_paused, message="mint paused")
-        c = sp.contract(sp.TRecord(address=sp.TAddress,amount=sp.TNat,token_id=sp.TNat,token_info=sp.TMap(sp.TString, sp.TBytes)), self.data.objkt, entry_point = "mint").open_some()
+        c = sp.contract(TypedMinter.MINT_TYPE, self.data.objkt, entry_point = "mint").open_some()
         sp.transfer(sp.record(address=sp.sender,amount=params.amount,token_id=self.data.objkt_id,token_info={ '' : params.metadata }), sp.mutez(0), c)
         self.data.royalties[self.data.objkt_id] = sp.record(issuer=sp.sender, royalties=self.data.royal)
         self.data.objkt_id += 1
 
+    @sp.entry_point(lazify = False)
+    def mint_TYPED_batch(self, params):
+        sp.set_type(params, sp.TList(sp.TRecord(amount=sp.TNat, metadata=sp.TBytes)))
+        sp.verify(sp.len(params) > 0, message="empty batch")
+        sp.verify(~self.data.mint_paused, message="mint paused")
+        objkt_id = sp.local("objkt_id", self.data.objkt_id)
+        mints = sp.local("mints", sp.list(t=TypedMinter.MINT_TYPE))
+        with sp.for_("item", params) as item:
+            sp.verify((item.amount > 0) & (item.amount <= 9999))
+            mints.value.push(sp.record(address=sp.sender,amount=item.amount,token_id=objkt_id.value,token_info={ '' : item.metadata }))
+            self.data.royalties[objkt_id.value] = sp.record(issuer=sp.sender, royalties=self.data.royal)
+            objkt_id.value += 1
+        self.data.objkt_id = objkt_id.value
+        c = sp.contract(sp.TList(TypedMinter.MINT_TYPE), self.data.objkt, entry_point = "mint_batch").open_some()
+        sp.transfer(mints.value.rev(), sp.mutez(0), c)
+
     @sp.entry_point
     def update_royalties(self, new_royal):
         sp.set_type(new_royal, sp.TNat)
@@ -39,8 +87,24 @@ class TypedMinter(sp.Contract):
         sp.verify(sp.sender == self.data.manager, message="only the admin can receive the payment from the contract")
         sp.send(self.data.manager,sp.balance)
 
+def global_parameter(env_var, default):
+    try:
+        if os.environ[env_var] == "true" :
+            return True
+        if os.environ[env_var] == "false" :
+            return False
+        return default
+    except:
+        return default
+
+def environment_config():
+    return Minter_config(
+        lazy_entry_points = global_parameter("lazy_entry_points", False),
+    )
+
 sp.add_compilation_target("minter", TypedMinter(
     objkt=sp.address("KT1J6NY5AU61GzUX51n59wwiZcGJ9DrNTwbK"),
     manager=sp.address("tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"),
     royal=sp.nat(100),
-    metadata=sp.utils.metadata_of_url("ipfs://QmbguJKMRmWpp4e9eenxwmsNqCcB34gzG58QymnEPkBhU8")))
+    metadata=sp.utils.metadata_of_url("ipfs://QmbguJKMRmWpp4e9eenxwmsNqCcB34gzG58QymnEPkBhU8"),
+    config=environment_config()))
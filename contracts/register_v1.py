@@ -1,29 +1,92 @@
+import os
 import smartpy as sp
 
+class Register_config:
+    def __init__(self,
+                 compact = False,
+                 emit_events = False
+                 ):
+        self.compact = compact
+        self.emit_events = emit_events
+
+        name = "typedregister"
+        if compact:
+            name += "-compact"
+        if emit_events:
+            name += "-events"
+        self.name = name
+
+
 class TypedRegister(sp.Contract):
 #sp.trace(sp.amount)
-    def __init__(self):
-        self.init(
-            name_check = sp.big_map(tkey=sp.TBytes, tvalue=sp.TRecord(name =  sp.TBytes)),
-            userlist = sp.big_map(tkey=sp.TAddress, tvalue=sp.TRecord(name =  sp.TBytes)),
-            admin = sp.address("tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"),
-            metadata = sp.utils.metadata_of_url("ipfs://QmeEMPmjUZ2uDoUJ741xxJersrEMBjW2axJKuNbMhYi76J")
-        )     
+    def __init__(self, config = None):
+        self.config = config if config is not None else Register_config()
+        if self.config.compact:
+            # name_check maps the BLAKE2b hash of a name to its owner and
+            # userlist the owner to the bare name: the name is stored once
+            # and the keys have a fixed size.
+            def resolve_name(self, name):
+                sp.set_type(name, sp.TBytes)
+                sp.result(self.data.name_check.get_opt(sp.blake2b(name)))
+            self.resolve_name = sp.onchain_view()(resolve_name)
+            def reverse_lookup(self, address):
+                sp.set_type(address, sp.TAddress)
+                sp.result(self.data.userlist.get_opt(address))
+            self.reverse_lookup = sp.onchain_view()(reverse_lookup)
+            self.init(
+                name_check = sp.big_map(tkey=sp.TBytes, tvalue=sp.TAddress),
+                userlist = sp.big_map(tkey=sp.TAddress, tvalue=sp.TBytes),
+                admin = sp.address("tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"),
+                metadata = sp.utils.metadata_of_url("ipfs://QmeEMPmjUZ2uDoUJ741xxJersrEMBjW2axJKuNbMhYi76J")
+            )
+        else:
+            self.init(
+                name_check = sp.big_map(tkey=sp.TBytes, tvalue=sp.TRecord(name =  sp.TBytes)),
+                userlist = sp.big_map(tkey=sp.TAddress, tvalue=sp.TRecord(name =  sp.TBytes)),
+                admin = sp.address("tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"),
+                metadata = sp.utils.metadata_of_url("ipfs://QmeEMPmjUZ2uDoUJ741xxJersrEMBjW2axJKuNbMhYi76J")
+            )
 
     @sp.entry_point
     def register(self, params):
-        sp.verify(~self.data.name_check.contains(params.name), message="this name is taken")
-        sp.if (self.data.userlist.contains(sp.sender)):
-            del self.data.name_check[self.data.userlist[sp.sender].name]
-            self.data.name_check[params.name] = sp.record(name=params.name)
-            self.data.userlist[sp.sender] = sp.record(name=params.name)
-        sp.else:
-            self.data.name_check[params.name] = sp.record(name=params.name)
-            self.data.userlist[sp.sender] = sp.record(name=params.name)
+        if self.config.compact:
+            name_hash = sp.local("name_hash", sp.blake2b(params.name))
+            sp.verify(~self.data.name_check.contains(name_hash.value), message="this name is taken")
+            sp.if (self.data.userlist.contains(sp.sender)):
+                del self.data.name_check[sp.blake2b(self.data.userlist[sp.sender])]
+            self.data.name_check[name_hash.value] = sp.sender
+            self.data.userlist[sp.sender] = params.name
+        else:
+            sp.verify(~self.data.name_check.contains(params.name), message="this name is taken")
+            sp.if (self.data.userlist.contains(sp.sender)):
+                del self.data.name_check[self.data.userlist[sp.sender].name]
+                self.data.name_check[params.name] = sp.record(name=params.name)
+                self.data.userlist[sp.sender] = sp.record(name=params.name)
+            sp.else:
+                self.data.name_check[params.name] = sp.record(name=params.name)
+                self.data.userlist[sp.sender] = sp.record(name=params.name)
+        if self.config.emit_events:
+            sp.emit(sp.record(address=sp.sender, name=params.name), tag="register")
 
     @sp.entry_point
     def payout_balance(self):
         sp.verify(sp.sender == self.data.admin, message="not admin")
         sp.send(self.data.admin,sp.balance)
 
-sp.add_compilation_target("typedregister", TypedRegister())
+def global_parameter(env_var, default):
+    try:
+        if os.environ[env_var] == "true" :
+            return True
+        if os.environ[env_var] == "false" :
+            return False
+        return default
+    except:
+        return default
+
+def environment_config():
+    return Register_config(
+        compact = global_parameter("compact_register", False),
+        emit_events = global_parameter("emit_events", False),
+    )
+
+sp.add_compilation_target("typedregister", TypedRegister(config=environment_config()))
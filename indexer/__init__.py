@@ -0,0 +1,9 @@
+"""Incremental off-chain index of the FA2, market, minter and register
+contracts, built from their operations and big_map diffs."""
+
+from .indexer import Indexer
+from .micheline import DecodeError
+from .sources import SandboxNode, read_paths
+from .store import Store
+
+__all__ = ["DecodeError", "Indexer", "SandboxNode", "Store", "read_paths"]
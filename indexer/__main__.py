@@ -0,0 +1,60 @@
+"""Index exported operations.
+
+Usage::
+
+    python -m indexer --config contracts.json --db index.sqlite ops/
+
+Running it again with the same ``--db`` resumes after the last indexed
+operation.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+
+from .indexer import Indexer
+from .sources import read_paths
+from .store import Store
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m indexer",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--config", required=True,
+                        help="JSON file describing the indexed contracts")
+    parser.add_argument("--db", default=":memory:",
+                        help="SQLite database (default: in memory)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="operations per transaction (default: %(default)s)")
+    parser.add_argument("paths", nargs="+",
+                        help="JSON or JSON lines files, or directories of them")
+    return parser.parse_args(argv)
+
+
+def run(args) -> int:
+    with open(args.config) as f:
+        config = json.load(f)
+    store = Store(args.db)
+    indexer = Indexer(store, config, batch_size=args.batch_size)
+    start = time.perf_counter()
+    indexer.run(read_paths(args.paths))
+    elapsed = time.perf_counter() - start
+    print("%d operations applied, %d skipped, %.0f ops/s, checkpoint %s" % (
+        indexer.applied, indexer.skipped,
+        indexer.applied / elapsed if elapsed else 0, indexer.checkpoint),
+        file=sys.stderr)
+    for table, count in store.counts().items():
+        print("%-10s %d" % (table, count))
+    store.close()
+    return 0
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Apply an operation stream to a :class:`~indexer.store.Store`.
+
+An operation is a JSON object::
+
+    {"id": 1042, "level": 3051, "hash": "oo...",
+     "target": "KT1...", "entrypoint": "transfer", "parameter": <micheline>,
+     "status": "applied",
+     "big_map_diffs": [{"big_map": 5, "action": "update",
+                        "key": <micheline>, "value": <micheline>},
+                       {"big_map": 5, "action": "remove", "key": <micheline>}]}
+
+``id`` increases along the stream, internal operations included, and is
+the checkpoint the indexer resumes from. A diff names its big_map either
+by id, resolved with the configuration, or by ``contract`` and ``path``
+(``"ledger"``, ``"swaps"``...).
+
+The configuration says what the contracts are::
+
+    {"contracts": {"KT1...": {"kind": "fa2", "big_maps": {"ledger": 5,
+                                                          "operators": 6}},
+                   "KT1...": {"kind": "market", "big_maps": {"swaps": 9}}}}
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from . import layouts
+from .micheline import DecodeError, as_address, as_int
+from .store import Store
+
+KINDS = ("fa2", "market", "minter", "register")
+
+# Entry points of Market_config(bundles = True), which write the bundles
+# big_map.
+BUNDLE_ENTRYPOINTS = ("swap_bundle", "collect_bundle", "cancel_bundle")
+
+Handler = Callable[[Store, str, str, Any, Any], None]
+
+
+def _fa2_ledger(store, contract, action, key, value):
+    if layouts.is_nft_ledger_key(key):
+        token_id = as_int(key)
+        if action == "remove":
+            store.remove_token(contract, token_id)
+        else:
+            store.set_owner(contract, token_id,
+                            layouts.fa2_nft_ledger_value(value))
+        return
+    owner, token_id = layouts.fa2_ledger_key(key)
+    if action == "remove":
+        store.remove_balance(contract, owner, token_id)
+    else:
+        store.set_balance(contract, owner, token_id,
+                          layouts.fa2_ledger_value(value))
+
+
+def _fa2_operators(store, contract, action, key, value):
+    owner, operator, token_id = layouts.fa2_operator_key(key)
+    if action == "remove":
+        store.remove_operator(contract, owner, operator, token_id)
+    else:
+        store.add_operator(contract, owner, operator, token_id)
+
+
+def _fa2_operators_for_all(store, contract, action, key, value):
+    owner, operator = layouts.fa2_operator_for_all_key(key)
+    if action == "remove":
+        store.remove_operator_for_all(contract, owner, operator)
+    else:
+        store.add_operator_for_all(contract, owner, operator)
+
+
+def _market_swaps(store, contract, action, key, value):
+    swap_id = as_int(key)
+    if action == "remove":
+        store.remove_swap(contract, swap_id)
+    else:
+        store.set_swap(contract, swap_id, layouts.market_swap(value))
+
+
+def _market_bundles(store, contract, action, key, value):
+    bundle_id = as_int(key)
+    if action == "remove":
+        store.remove_bundle(contract, bundle_id)
+    else:
+        store.set_bundle(contract, bundle_id, layouts.market_bundle(value))
+
+
+def _minter_royalties(store, contract, action, key, value):
+    if action != "remove":
+        issuer, royalties = layouts.minter_royalties(value)
+        store.set_royalties(contract, as_int(key), issuer, royalties)
+
+
+def _register_userlist(store, contract, action, key, value):
+    address = as_address(key)
+    if action == "remove":
+        store.remove_name(contract, address)
+    else:
+        store.set_name(contract, address, layouts.register_name(value))
+
+
+def _ignore(store, contract, action, key, value):
+    pass
+
+
+# Big maps whose content the index mirrors. ``name_check`` is the reverse
+# of ``userlist``; ``token_metadata`` (``token_uris`` in compact_metadata
+# builds) and ``total_supply`` are not indexed.
+HANDLERS: Dict[Tuple[str, str], Handler] = {
+    ("fa2", "ledger"): _fa2_ledger,
+    ("fa2", "operators"): _fa2_operators,
+    ("fa2", "operators_for_all"): _fa2_operators_for_all,
+    ("market", "swaps"): _market_swaps,
+    ("market", "bundles"): _market_bundles,
+    ("minter", "royalties"): _minter_royalties,
+    ("register", "userlist"): _register_userlist,
+    ("register", "name_check"): _ignore,
+}
+
+
+class Indexer:
+    """Keep ``store`` in sync with the contracts of ``config``.
+
+    Operations are applied in transactions of ``batch_size`` operations,
+    each committing the checkpoint with the data, so that an interrupted
+    run resumes after the last committed operation.
+    """
+
+    def __init__(self, store: Store, config: Dict[str, Any],
+                 batch_size: int = 1000):
+        self.store = store
+        self.batch_size = batch_size
+        self.kinds: Dict[str, str] = {}
+        self.paths: Dict[str, Set[str]] = {}
+        self.big_maps: Dict[int, Tuple[str, Handler]] = {}
+        for address, contract in config["contracts"].items():
+            kind = contract["kind"]
+            if kind not in KINDS:
+                raise ValueError("unknown contract kind %r" % kind)
+            self.kinds[address] = kind
+            self.paths[address] = set(contract.get("big_maps", {}))
+            for path, big_map in contract.get("big_maps", {}).items():
+                handler = HANDLERS.get((kind, path), _ignore)
+                self.big_maps[int(big_map)] = (address, handler)
+        self.checkpoint: Optional[int] = store.checkpoint()
+        self.applied = 0
+        self.skipped = 0
+        self.pending = 0
+        self.level: Optional[int] = None
+
+    def _handler(self, diff: Dict[str, Any]) -> Optional[Tuple[str, Handler]]:
+        if "big_map" in diff:
+            return self.big_maps.get(int(diff["big_map"]))
+        kind = self.kinds.get(diff.get("contract"))
+        if kind is None:
+            return None
+        return diff["contract"], HANDLERS.get((kind, diff["path"]), _ignore)
+
+    def _check_indexed(self, op: Dict[str, Any]):
+        """Refuse the bundle operations of a market whose bundles big_map
+        is not configured: its diffs would be dropped as unknown."""
+        target = op.get("target")
+        if (self.kinds.get(target) == "market"
+                and op.get("entrypoint") in BUNDLE_ENTRYPOINTS
+                and "bundles" not in self.paths[target]
+                and not any(d.get("path") == "bundles"
+                            for d in op.get("big_map_diffs", ()))):
+            raise ValueError("operation %s: %s of %s, whose bundles big_map "
+                             "is not in the configuration"
+                             % (op["id"], op["entrypoint"], target))
+
+    def apply(self, op: Dict[str, Any]):
+        """Apply one operation, unless it is before the checkpoint."""
+        op_id = op["id"]
+        if self.checkpoint is not None and op_id <= self.checkpoint:
+            self.skipped += 1
+            return
+        if op.get("status", "applied") == "applied":
+            self._check_indexed(op)
+            for diff in op.get("big_map_diffs", ()):
+                target = self._handler(diff)
+                if target is not None:
+                    contract, handler = target
+                    try:
+                        handler(self.store, contract, diff["action"],
+                                diff["key"], diff.get("value"))
+                    except DecodeError as e:
+                        raise DecodeError("operation %s: %s" % (op_id, e))
+            if (self.kinds.get(op.get("target")) == "fa2"
+                    and op.get("entrypoint") == "transfer"):
+                self.store.add_transfers(
+                    op_id, op["target"],
+                    layouts.fa2_transfer_param(op["parameter"]))
+        self.checkpoint = op_id
+        self.level = op.get("level", self.level)
+        self.applied += 1
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.store.set_checkpoint(self.checkpoint, self.level)
+            self.store.commit()
+            self.pending = 0
+
+    def run(self, ops: Iterable[Dict[str, Any]]):
+        for op in ops:
+            self.apply(op)
+        self.flush()
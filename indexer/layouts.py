@@ -0,0 +1,151 @@
+"""Storage and parameter layouts of the FA2, market, minter and register.
+
+Each decoder takes a Micheline JSON value as found in big_map diffs or
+operation parameters and returns plain Python values.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from .micheline import (DecodeError, as_address, as_bytes, as_int, as_list,
+                        flatten, pair)
+
+
+def _is_packed(value: Any) -> bool:
+    return isinstance(value, dict) and value.get("bytes", "").startswith("05")
+
+
+def _unpackable(value: Any, what: str):
+    if _is_packed(value):
+        raise DecodeError("packed %s (FA2_config readable=False) are not "
+                          "supported" % what)
+
+
+# FA2 (contracts/fa2_v1.py)
+#
+# Token metadata is not decoded: ``token_metadata`` holds TZIP-12
+# ``Pair token_id token_info`` records, and compact_metadata builds hold
+# the bare URI bytes in ``token_uris`` instead.
+
+def fa2_ledger_key(key: Any) -> Tuple[str, int]:
+    """Ledger_key: ``Pair owner token_id``, or ``owner`` for single assets."""
+    _unpackable(key, "ledger keys")
+    if isinstance(key, dict) and key.get("prim") != "Pair":
+        return as_address(key), 0
+    owner, token_id = pair(key)
+    return as_address(owner), as_int(token_id)
+
+
+def is_nft_ledger_key(key: Any) -> bool:
+    """Ledgers of ``nft_ledger`` builds are keyed on the bare token id."""
+    return isinstance(key, dict) and "int" in key
+
+
+def fa2_ledger_value(value: Any) -> int:
+    """Ledger_value: ``{balance}``, compiled to the bare nat."""
+    return as_int(value)
+
+
+def fa2_nft_ledger_value(value: Any) -> str:
+    """The owner of the token, for ``nft_ledger`` builds."""
+    return as_address(value)
+
+
+def fa2_operator_key(key: Any) -> Tuple[str, str, int]:
+    """Operator_set key: ``Pair owner (Pair operator token_id)``."""
+    _unpackable(key, "operator keys")
+    owner, operator, token_id = flatten(key)
+    return as_address(owner), as_address(operator), as_int(token_id)
+
+
+def fa2_operator_for_all_key(key: Any) -> Tuple[str, str]:
+    """Operator_set key of ``operators_for_all``: ``Pair owner operator``."""
+    _unpackable(key, "operator keys")
+    owner, operator = pair(key)
+    return as_address(owner), as_address(operator)
+
+
+def fa2_transfer_param(param: Any) -> List[Tuple[str, str, int, int]]:
+    """Batch_transfer: ``{Pair from_ {Pair to_ (Pair token_id amount)}}``.
+
+    Returns (from_, to_, token_id, amount) tuples.
+    """
+    txs = []
+    for transfer in as_list(param):
+        from_, items = pair(transfer)
+        from_ = as_address(from_)
+        for tx in as_list(items):
+            to_, token_id, amount = flatten(tx)
+            txs.append((from_, as_address(to_), as_int(token_id),
+                        as_int(amount)))
+    return txs
+
+
+# TypedMarket (contracts/market_v1.py)
+
+SWAP_FIELDS = ("issuer", "fa2", "objkt_id", "objkt_amount", "xtz_per_objkt",
+               "royalties", "creator")
+LIVE_ROYALTIES_SWAP_FIELDS = ("issuer", "fa2", "objkt_id", "objkt_amount",
+                              "xtz_per_objkt", "creator")
+
+_ADDRESS_FIELDS = {"issuer", "fa2", "creator"}
+
+
+def market_swap(value: Any) -> Dict[str, Any]:
+    """SWAP_TYPE, or LIVE_ROYALTIES_SWAP_TYPE whose royalties are market-wide."""
+    leaves = flatten(value)
+    if len(leaves) == len(SWAP_FIELDS):
+        fields = SWAP_FIELDS
+    elif len(leaves) == len(LIVE_ROYALTIES_SWAP_FIELDS):
+        fields = LIVE_ROYALTIES_SWAP_FIELDS
+    else:
+        raise DecodeError("unknown swap layout: %r" % (value,))
+    swap: Dict[str, Any] = {"royalties": None}
+    for name, leaf in zip(fields, leaves):
+        swap[name] = as_address(leaf) if name in _ADDRESS_FIELDS else as_int(leaf)
+    return swap
+
+
+BUNDLE_FIELDS = ("issuer", "fa2", "items", "xtz_per_bundle", "royalties",
+                 "creator")
+LIVE_ROYALTIES_BUNDLE_FIELDS = ("issuer", "fa2", "items", "xtz_per_bundle",
+                                "creator")
+
+
+def market_bundle(value: Any) -> Dict[str, Any]:
+    """BUNDLE_TYPE, or LIVE_ROYALTIES_BUNDLE_TYPE; ``items`` are
+    (token_id, amount) tuples."""
+    leaves = flatten(value)
+    if len(leaves) == len(BUNDLE_FIELDS):
+        fields = BUNDLE_FIELDS
+    elif len(leaves) == len(LIVE_ROYALTIES_BUNDLE_FIELDS):
+        fields = LIVE_ROYALTIES_BUNDLE_FIELDS
+    else:
+        raise DecodeError("unknown bundle layout: %r" % (value,))
+    bundle: Dict[str, Any] = {"royalties": None}
+    for name, leaf in zip(fields, leaves):
+        if name == "items":
+            bundle[name] = [tuple(as_int(x) for x in pair(item))
+                            for item in as_list(leaf)]
+        elif name in _ADDRESS_FIELDS:
+            bundle[name] = as_address(leaf)
+        else:
+            bundle[name] = as_int(leaf)
+    return bundle
+
+
+# TypedMinter (contracts/minter_v1.py)
+
+def minter_royalties(value: Any) -> Tuple[str, int]:
+    """``{issuer, royalties}``: ``Pair issuer royalties``."""
+    issuer, royalties = pair(value)
+    return as_address(issuer), as_int(royalties)
+
+
+# TypedRegister (contracts/register_v1.py)
+
+def register_name(value: Any) -> bytes:
+    """``{name}`` records compile to the bare bytes."""
+    return as_bytes(value)
+
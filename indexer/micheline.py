@@ -0,0 +1,111 @@
+"""Helpers reading Micheline JSON values, readable or optimized."""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List
+
+_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# Base58check prefixes of tz1, tz2, tz3 and KT1 addresses.
+_IMPLICIT_PREFIXES = {0: b"\x06\xa1\x9f", 1: b"\x06\xa1\xa1", 2: b"\x06\xa1\xa4"}
+_ORIGINATED_PREFIX = b"\x02\x5a\x79"
+
+
+class DecodeError(Exception):
+    pass
+
+
+def b58check(payload: bytes) -> str:
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    n = int.from_bytes(data, "big")
+    out = ""
+    while n:
+        n, r = divmod(n, 58)
+        out = _ALPHABET[r] + out
+    pad = len(data) - len(data.lstrip(b"\0"))
+    return "1" * pad + out
+
+
+def address_of_bytes(raw: bytes) -> str:
+    """Decode the 22 bytes binary form of an address."""
+    if len(raw) < 22:
+        raise DecodeError("address too short: %s" % raw.hex())
+    if raw[0] == 0 and raw[1] in _IMPLICIT_PREFIXES:
+        return b58check(_IMPLICIT_PREFIXES[raw[1]] + raw[2:22])
+    if raw[0] == 1:
+        return b58check(_ORIGINATED_PREFIX + raw[1:21])
+    raise DecodeError("unknown address tag: %s" % raw.hex())
+
+
+def flatten(value: Any) -> List[Any]:
+    """Leaves of a right comb of pairs, in order.
+
+    ``Pair a (Pair b c)``, ``Pair a b c`` and ``[a, b, c]`` all give
+    ``[a, b, c]``.
+    """
+    if isinstance(value, list):
+        items = value
+    elif isinstance(value, dict) and value.get("prim") == "Pair":
+        items = value["args"]
+    else:
+        return [value]
+    return items[:-1] + flatten(items[-1])
+
+
+def pair(value: Any) -> List[Any]:
+    """The two components of a pair, whatever its notation."""
+    if isinstance(value, list):
+        items = value
+    elif isinstance(value, dict) and value.get("prim") == "Pair":
+        items = value["args"]
+    else:
+        raise DecodeError("not a pair: %r" % (value,))
+    if len(items) == 2:
+        return items
+    return [items[0], {"prim": "Pair", "args": items[1:]}]
+
+
+def as_int(value: Dict[str, Any]) -> int:
+    try:
+        return int(value["int"])
+    except (KeyError, TypeError, ValueError):
+        raise DecodeError("not an int: %r" % (value,))
+
+
+def as_bytes(value: Dict[str, Any]) -> bytes:
+    try:
+        return bytes.fromhex(value["bytes"])
+    except (KeyError, TypeError, ValueError):
+        raise DecodeError("not bytes: %r" % (value,))
+
+
+def as_string(value: Dict[str, Any]) -> str:
+    try:
+        return value["string"]
+    except (KeyError, TypeError):
+        raise DecodeError("not a string: %r" % (value,))
+
+
+def as_address(value: Dict[str, Any]) -> str:
+    if isinstance(value, dict) and "string" in value:
+        return value["string"]
+    return address_of_bytes(as_bytes(value))
+
+
+def as_bool(value: Dict[str, Any]) -> bool:
+    prim = value.get("prim") if isinstance(value, dict) else None
+    if prim not in ("True", "False"):
+        raise DecodeError("not a bool: %r" % (value,))
+    return prim == "True"
+
+
+def as_list(value: Any) -> List[Any]:
+    if not isinstance(value, list):
+        raise DecodeError("not a sequence: %r" % (value,))
+    return value
+
+
+def as_map(value: Any) -> List[List[Any]]:
+    """The (key, value) pairs of a map literal."""
+    return [elt["args"] for elt in as_list(value)]
@@ -0,0 +1,55 @@
+"""Operation streams: exported JSON files or a node stand-in."""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+def read_file(path: str) -> Iterator[Dict[str, Any]]:
+    """Operations of a JSON array file, or of a JSON lines file."""
+    with open(path) as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_paths(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Operations of files and directories, directories in name order."""
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(n for n in os.listdir(path)
+                           if n.endswith((".json", ".jsonl")))
+            yield from read_paths(os.path.join(path, n) for n in names)
+        else:
+            yield from read_file(path)
+
+
+class SandboxNode:
+    """In-memory stand-in for a node: operations are pushed as they are
+    baked and read back from a level on, as a poller would."""
+
+    def __init__(self):
+        self.operations: List[Dict[str, Any]] = []
+
+    def push(self, op: Dict[str, Any]):
+        op = dict(op)
+        op.setdefault("id", len(self.operations) + 1)
+        op.setdefault("level", self.head())
+        self.operations.append(op)
+
+    def head(self) -> int:
+        return self.operations[-1]["level"] if self.operations else 0
+
+    def operations_since(self, op_id: int = 0) -> Iterator[Dict[str, Any]]:
+        for op in self.operations:
+            if op["id"] > op_id:
+                yield op
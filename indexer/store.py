@@ -0,0 +1,253 @@
+"""SQLite backed index of the contracts' state."""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    fa2 TEXT NOT NULL, owner TEXT NOT NULL, token_id INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    PRIMARY KEY (fa2, token_id, owner));
+CREATE INDEX IF NOT EXISTS ledger_by_owner ON ledger (owner, fa2, token_id);
+
+CREATE TABLE IF NOT EXISTS operators (
+    fa2 TEXT NOT NULL, owner TEXT NOT NULL, operator TEXT NOT NULL,
+    token_id INTEGER NOT NULL,
+    PRIMARY KEY (fa2, owner, operator, token_id));
+
+CREATE TABLE IF NOT EXISTS operators_for_all (
+    fa2 TEXT NOT NULL, owner TEXT NOT NULL, operator TEXT NOT NULL,
+    PRIMARY KEY (fa2, owner, operator));
+
+CREATE TABLE IF NOT EXISTS swaps (
+    market TEXT NOT NULL, swap_id INTEGER NOT NULL,
+    issuer TEXT NOT NULL, fa2 TEXT NOT NULL, objkt_id INTEGER NOT NULL,
+    objkt_amount INTEGER NOT NULL, xtz_per_objkt INTEGER NOT NULL,
+    royalties INTEGER, creator TEXT NOT NULL,
+    PRIMARY KEY (market, swap_id));
+CREATE INDEX IF NOT EXISTS swaps_by_token ON swaps (fa2, objkt_id);
+CREATE INDEX IF NOT EXISTS swaps_by_issuer ON swaps (issuer);
+
+CREATE TABLE IF NOT EXISTS bundles (
+    market TEXT NOT NULL, bundle_id INTEGER NOT NULL,
+    issuer TEXT NOT NULL, fa2 TEXT NOT NULL, xtz_per_bundle INTEGER NOT NULL,
+    royalties INTEGER, creator TEXT NOT NULL,
+    PRIMARY KEY (market, bundle_id));
+CREATE INDEX IF NOT EXISTS bundles_by_issuer ON bundles (issuer);
+
+CREATE TABLE IF NOT EXISTS bundle_items (
+    market TEXT NOT NULL, bundle_id INTEGER NOT NULL, fa2 TEXT NOT NULL,
+    token_id INTEGER NOT NULL, amount INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS bundle_items_by_bundle ON bundle_items (market, bundle_id);
+CREATE INDEX IF NOT EXISTS bundle_items_by_token ON bundle_items (fa2, token_id);
+
+CREATE TABLE IF NOT EXISTS royalties (
+    minter TEXT NOT NULL, token_id INTEGER NOT NULL,
+    issuer TEXT NOT NULL, royalties INTEGER NOT NULL,
+    PRIMARY KEY (minter, token_id));
+
+CREATE TABLE IF NOT EXISTS names (
+    register TEXT NOT NULL, address TEXT NOT NULL, name BLOB NOT NULL,
+    PRIMARY KEY (register, address));
+CREATE UNIQUE INDEX IF NOT EXISTS names_by_name ON names (register, name);
+
+CREATE TABLE IF NOT EXISTS transfers (
+    op_id INTEGER NOT NULL, fa2 TEXT NOT NULL, from_ TEXT NOT NULL,
+    to_ TEXT NOT NULL, token_id INTEGER NOT NULL, amount INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS transfers_by_token ON transfers (fa2, token_id);
+
+CREATE TABLE IF NOT EXISTS checkpoint (
+    name TEXT PRIMARY KEY, op_id INTEGER NOT NULL, level INTEGER);
+"""
+
+
+class Store:
+    """The index. Mutations are only visible to others after :meth:`commit`."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # Mutations
+
+    def set_balance(self, fa2: str, owner: str, token_id: int, balance: int):
+        self.db.execute("INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?)",
+                        (fa2, owner, token_id, balance))
+
+    def remove_balance(self, fa2: str, owner: str, token_id: int):
+        self.db.execute("DELETE FROM ledger WHERE fa2 = ? AND owner = ? "
+                        "AND token_id = ?", (fa2, owner, token_id))
+
+    def set_owner(self, fa2: str, token_id: int, owner: str):
+        """Single owner of an NFT: the previous owner's row goes away."""
+        self.remove_token(fa2, token_id)
+        self.set_balance(fa2, owner, token_id, 1)
+
+    def remove_token(self, fa2: str, token_id: int):
+        self.db.execute("DELETE FROM ledger WHERE fa2 = ? AND token_id = ?",
+                        (fa2, token_id))
+
+    def add_operator(self, fa2: str, owner: str, operator: str, token_id: int):
+        self.db.execute("INSERT OR IGNORE INTO operators VALUES (?, ?, ?, ?)",
+                        (fa2, owner, operator, token_id))
+
+    def remove_operator(self, fa2: str, owner: str, operator: str,
+                        token_id: int):
+        self.db.execute("DELETE FROM operators WHERE fa2 = ? AND owner = ? "
+                        "AND operator = ? AND token_id = ?",
+                        (fa2, owner, operator, token_id))
+
+    def add_operator_for_all(self, fa2: str, owner: str, operator: str):
+        self.db.execute("INSERT OR IGNORE INTO operators_for_all VALUES (?, ?, ?)",
+                        (fa2, owner, operator))
+
+    def remove_operator_for_all(self, fa2: str, owner: str, operator: str):
+        self.db.execute("DELETE FROM operators_for_all WHERE fa2 = ? "
+                        "AND owner = ? AND operator = ?", (fa2, owner, operator))
+
+    def set_swap(self, market: str, swap_id: int, swap: Dict[str, Any]):
+        self.db.execute(
+            "INSERT OR REPLACE INTO swaps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (market, swap_id, swap["issuer"], swap["fa2"], swap["objkt_id"],
+             swap["objkt_amount"], swap["xtz_per_objkt"], swap["royalties"],
+             swap["creator"]))
+
+    def remove_swap(self, market: str, swap_id: int):
+        self.db.execute("DELETE FROM swaps WHERE market = ? AND swap_id = ?",
+                        (market, swap_id))
+
+    def set_bundle(self, market: str, bundle_id: int, bundle: Dict[str, Any]):
+        self.remove_bundle(market, bundle_id)
+        self.db.execute(
+            "INSERT INTO bundles VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (market, bundle_id, bundle["issuer"], bundle["fa2"],
+             bundle["xtz_per_bundle"], bundle["royalties"], bundle["creator"]))
+        self.db.executemany(
+            "INSERT INTO bundle_items VALUES (?, ?, ?, ?, ?)",
+            [(market, bundle_id, bundle["fa2"], token_id, amount)
+             for token_id, amount in bundle["items"]])
+
+    def remove_bundle(self, market: str, bundle_id: int):
+        self.db.execute("DELETE FROM bundles WHERE market = ? AND bundle_id = ?",
+                        (market, bundle_id))
+        self.db.execute("DELETE FROM bundle_items WHERE market = ? "
+                        "AND bundle_id = ?", (market, bundle_id))
+
+    def set_royalties(self, minter: str, token_id: int, issuer: str,
+                      royalties: int):
+        self.db.execute("INSERT OR REPLACE INTO royalties VALUES (?, ?, ?, ?)",
+                        (minter, token_id, issuer, royalties))
+
+    def set_name(self, register: str, address: str, name: bytes):
+        self.db.execute("DELETE FROM names WHERE register = ? AND name = ?",
+                        (register, name))
+        self.db.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?)",
+                        (register, address, name))
+
+    def remove_name(self, register: str, address: str):
+        self.db.execute("DELETE FROM names WHERE register = ? AND address = ?",
+                        (register, address))
+
+    def add_transfers(self, op_id: int, fa2: str,
+                      txs: List[Tuple[str, str, int, int]]):
+        self.db.executemany(
+            "INSERT INTO transfers VALUES (?, ?, ?, ?, ?, ?)",
+            [(op_id, fa2) + tx for tx in txs])
+
+    def set_checkpoint(self, op_id: int, level: Optional[int],
+                       name: str = "operations"):
+        self.db.execute("INSERT OR REPLACE INTO checkpoint VALUES (?, ?, ?)",
+                        (name, op_id, level))
+
+    # Queries
+
+    def checkpoint(self, name: str = "operations") -> Optional[int]:
+        row = self.db.execute("SELECT op_id FROM checkpoint WHERE name = ?",
+                              (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def balance(self, fa2: str, owner: str, token_id: int) -> int:
+        row = self.db.execute(
+            "SELECT balance FROM ledger WHERE fa2 = ? AND owner = ? "
+            "AND token_id = ?", (fa2, owner, token_id)).fetchone()
+        return 0 if row is None else row[0]
+
+    def tokens_of(self, owner: str) -> List[Tuple[str, int, int]]:
+        """(fa2, token_id, balance) of the tokens held by ``owner``."""
+        return self.db.execute(
+            "SELECT fa2, token_id, balance FROM ledger WHERE owner = ? "
+            "AND balance > 0 ORDER BY fa2, token_id", (owner,)).fetchall()
+
+    def owners_of(self, fa2: str, token_id: int) -> List[Tuple[str, int]]:
+        return self.db.execute(
+            "SELECT owner, balance FROM ledger WHERE fa2 = ? AND token_id = ? "
+            "AND balance > 0 ORDER BY owner", (fa2, token_id)).fetchall()
+
+    def is_operator(self, fa2: str, owner: str, operator: str,
+                    token_id: int) -> bool:
+        """Per-token operators and operators of all the owner's tokens."""
+        return self.db.execute(
+            "SELECT 1 FROM operators WHERE fa2 = ? AND owner = ? "
+            "AND operator = ? AND token_id = ? UNION ALL "
+            "SELECT 1 FROM operators_for_all WHERE fa2 = ? AND owner = ? "
+            "AND operator = ?",
+            (fa2, owner, operator, token_id, fa2, owner, operator)
+        ).fetchone() is not None
+
+    def open_swaps(self, fa2: str, token_id: int) -> List[Dict[str, Any]]:
+        """Open swaps of a token, cheapest first."""
+        cursor = self.db.execute(
+            "SELECT * FROM swaps WHERE fa2 = ? AND objkt_id = ? "
+            "ORDER BY xtz_per_objkt, swap_id", (fa2, token_id))
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def open_bundles(self, fa2: str, token_id: int) -> List[Dict[str, Any]]:
+        """Open bundles holding a token, cheapest first, with their
+        ``items``."""
+        cursor = self.db.execute(
+            "SELECT DISTINCT bundles.* FROM bundle_items JOIN bundles "
+            "USING (market, bundle_id) WHERE bundle_items.fa2 = ? "
+            "AND bundle_items.token_id = ? "
+            "ORDER BY xtz_per_bundle, bundle_id", (fa2, token_id))
+        columns = [c[0] for c in cursor.description]
+        bundles = [dict(zip(columns, row)) for row in cursor]
+        for bundle in bundles:
+            bundle["items"] = self.db.execute(
+                "SELECT token_id, amount FROM bundle_items WHERE market = ? "
+                "AND bundle_id = ?", (bundle["market"], bundle["bundle_id"])
+            ).fetchall()
+        return bundles
+
+    def royalties(self, minter: str, token_id: int) -> Optional[Tuple[str, int]]:
+        return self.db.execute(
+            "SELECT issuer, royalties FROM royalties WHERE minter = ? "
+            "AND token_id = ?", (minter, token_id)).fetchone()
+
+    def resolve(self, register: str, name: bytes) -> Optional[str]:
+        row = self.db.execute(
+            "SELECT address FROM names WHERE register = ? AND name = ?",
+            (register, name)).fetchone()
+        return None if row is None else row[0]
+
+    def name_of(self, register: str, address: str) -> Optional[bytes]:
+        row = self.db.execute(
+            "SELECT name FROM names WHERE register = ? AND address = ?",
+            (register, address)).fetchone()
+        return None if row is None else row[0]
+
+    def counts(self) -> Dict[str, int]:
+        tables = ["ledger", "operators", "operators_for_all", "swaps",
+                  "bundles", "bundle_items", "royalties", "names", "transfers"]
+        return {t: self.db.execute("SELECT COUNT(*) FROM %s" % t).fetchone()[0]
+                for t in tables}
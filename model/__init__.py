@@ -0,0 +1,12 @@
+"""Pure-Python models of the contracts, for fast property testing.
+
+:mod:`model.fuzz` drives them with random operations and checks the
+invariants of :mod:`model.properties`; :mod:`model.differential` replays
+sampled traces in the SmartPy interpreter to keep the models faithful.
+"""
+
+from .chain import Chain, Failed
+from .contracts import FA2, TypedMarket, TypedMinter, TypedRegister
+
+__all__ = ["Chain", "FA2", "Failed", "TypedMarket", "TypedMinter",
+           "TypedRegister"]
@@ -0,0 +1,156 @@
+"""A minimal chain for the models: tez balances, internal operations and
+all-or-nothing operations.
+
+Storage lives in :class:`JournaledMap` maps, which log the value they
+overwrite so that a failed operation is undone in time proportional to
+what it changed, not to the size of the storage.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+_MISSING = object()
+
+
+class Failed(Exception):
+    """FAILWITH. ``message`` is None for checks without a message and for
+    reads of missing big_map keys."""
+
+    def __init__(self, message: Optional[str] = None):
+        Exception.__init__(self, message)
+        self.message = message
+
+
+class JournaledMap(dict):
+    __slots__ = ("journal",)
+
+    def __init__(self, journal: List[Tuple[Any, Any, Any]], *args):
+        dict.__init__(self, *args)
+        self.journal = journal
+
+    def __setitem__(self, key, value):
+        self.journal.append((self, key, dict.get(self, key, _MISSING)))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        # Like Michelson UPDATE with None, removing a missing key is a no-op.
+        if key in self:
+            self.journal.append((self, key, dict.__getitem__(self, key)))
+            dict.__delitem__(self, key)
+
+    def item(self, key):
+        """``map[key]`` of SmartPy: fails on missing keys."""
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            raise Failed(None)
+
+
+class Context(NamedTuple):
+    sender: str
+    amount: int
+
+
+class Operation(NamedTuple):
+    """An internal operation. ``entrypoint`` is None for plain tez sends."""
+    destination: str
+    entrypoint: Optional[str]
+    params: Any
+    amount: int
+
+
+def send(destination: str, amount: int) -> Operation:
+    return Operation(destination, None, None, amount)
+
+
+class Model:
+    """Base of the contract models.
+
+    ``SCALARS`` are the storage fields that are not maps; they are saved
+    when an operation first enters the contract. Entry points take a :class:`Context` and their
+    parameter, raise :class:`Failed` and return the internal operations.
+    """
+
+    SCALARS: Tuple[str, ...] = ()
+    ENTRYPOINTS: Tuple[str, ...] = ()
+
+    def __init__(self, chain: "Chain", address: str):
+        self.chain = chain
+        self.address = address
+        chain.contracts[address] = self
+
+    def map(self, *args) -> JournaledMap:
+        return JournaledMap(self.chain.journal, *args)
+
+    def snapshot(self) -> Tuple[Any, ...]:
+        return tuple([getattr(self, name) for name in self.SCALARS])
+
+    def restore(self, snapshot: Tuple[Any, ...]):
+        for name, value in zip(self.SCALARS, snapshot):
+            setattr(self, name, value)
+
+    @property
+    def balance(self) -> int:
+        return self.chain.balances.get(self.address, 0)
+
+
+class Chain:
+    """Accounts are plain names; contracts are the addresses of models.
+
+    Implicit accounts start at 0 mutez and may go negative, so that the sum
+    of all balances is always 0.
+    """
+
+    def __init__(self):
+        self.journal: List[Tuple[Any, Any, Any]] = []
+        self.balances: Dict[str, int] = JournaledMap(self.journal)
+        self.contracts: Dict[str, Model] = {}
+        # Scalars of the contracts the current operation entered.
+        self.snapshots: Dict[Model, Tuple[Any, ...]] = {}
+        self.operations = 0
+
+    def _credit(self, address: str, amount: int):
+        if amount:
+            self.balances[address] = self.balances.get(address, 0) + amount
+
+    def _execute(self, sender: str, op: Operation):
+        if op.amount:
+            if self.balances.get(sender, 0) < op.amount and sender in self.contracts:
+                raise Failed("balance too low")
+            self._credit(sender, -op.amount)
+            self._credit(op.destination, op.amount)
+        contract = self.contracts.get(op.destination)
+        if contract is None:
+            return
+        if op.entrypoint not in contract.ENTRYPOINTS:
+            raise Failed("no entrypoint %s" % op.entrypoint)
+        if contract not in self.snapshots:
+            self.snapshots[contract] = contract.snapshot()
+        ops = getattr(contract, op.entrypoint)(Context(sender, op.amount),
+                                               op.params)
+        # Internal operations run depth first, in emission order.
+        for internal in ops or ():
+            self._execute(op.destination, internal)
+
+    def call(self, sender: str, destination: str, entrypoint: str,
+             params: Any = None, amount: int = 0):
+        """Run an operation and all its internal operations, or none of
+        them. Raises :class:`Failed` after undoing a failed operation."""
+        del self.journal[:]
+        self.snapshots.clear()
+        self.operations += 1
+        try:
+            self._execute(sender, Operation(destination, entrypoint, params,
+                                            amount))
+        except Failed:
+            for m, key, old in reversed(self.journal):
+                if old is _MISSING:
+                    dict.pop(m, key, None)
+                else:
+                    dict.__setitem__(m, key, old)
+            for contract, snapshot in self.snapshots.items():
+                contract.restore(snapshot)
+            raise
+        finally:
+            del self.journal[:]
@@ -0,0 +1,403 @@
+"""Executable models of FA2, TypedMinter, TypedMarket and TypedRegister.
+
+Each model follows its contract check by check, with the same failure
+messages, on plain dicts and tuples:
+
+* FA2 ``ledger``: (owner, token_id) -> balance, ``operators``:
+  (owner, operator, token_id) -> True, ``all_tokens``: the number of
+  token ids (``assume_consecutive_token_ids``);
+* TypedMarket ``swaps``: swap_id -> :class:`Swap`;
+* TypedMinter ``royalties``: token_id -> (issuer, royalties);
+* TypedRegister ``userlist``: address -> name and ``name_check``:
+  name -> name.
+
+FA2 is modelled with the ``environment_config()`` defaults: readable
+multi-asset fungible tokens with operators, plus ``lean_storage`` and
+the ``total_supply`` of ``track_total_supply``. The
+``balance_of`` and ``token_metadata`` callback entry points and the
+on-chain views are not modelled.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .chain import Chain, Context, Failed, Model, Operation, send
+
+# Hardcoded in fa2_v1.py (FA2 payout) and register_v1.py (admin).
+PAYOUT = "tz1aqMiWgnFddGZSTsEMSe8qbXkVGn7C4cg5"
+
+
+def split_tokens(amount: int, quantity: int, total: int) -> int:
+    return amount * quantity // total
+
+
+def verify(condition: bool, message: Optional[str] = None):
+    if not condition:
+        raise Failed(message)
+
+
+class FA2(Model):
+    SCALARS = ("administrator", "paused", "all_tokens")
+    ENTRYPOINTS = ("transfer", "burn", "update_operators", "payout_balance",
+                   "set_administrator", "set_pause", "mint", "mint_batch")
+
+    def __init__(self, chain: Chain, address: str, admin: str,
+                 lean_storage: bool = False):
+        Model.__init__(self, chain, address)
+        self.lean_storage = lean_storage
+        self.payout = PAYOUT
+        self.administrator = admin
+        self.paused = False
+        self.all_tokens = 0
+        self.ledger = self.map()
+        self.token_metadata = self.map()
+        self.operators = self.map()
+        self.total_supply = self.map()
+
+    def transfer(self, ctx: Context, batch: List[Tuple[str, List[Tuple[str, int, int]]]]):
+        """``batch``: [(from_, [(to_, token_id, amount)])]."""
+        verify(not self.paused)
+        is_admin = ctx.sender == self.administrator
+        ledger = self.ledger
+        for from_, txs in batch:
+            is_owner = is_admin or from_ == ctx.sender
+            for to_, token_id, amount in txs:
+                verify(is_owner or (from_, ctx.sender, token_id) in self.operators,
+                       "FA2_NOT_OPERATOR")
+                verify(token_id in self.token_metadata, "FA2_TOKEN_UNDEFINED")
+                if amount > 0:
+                    from_balance = ledger.item((from_, token_id))
+                    verify(from_balance >= amount, "FA2_INSUFFICIENT_BALANCE")
+                    if self.lean_storage and from_balance == amount:
+                        del ledger[(from_, token_id)]
+                    else:
+                        ledger[(from_, token_id)] = from_balance - amount
+                    ledger[(to_, token_id)] = ledger.get((to_, token_id), 0) + amount
+
+    def burn(self, ctx: Context, params: Dict[str, Any]):
+        """``params``: {address, token_id, amount}."""
+        verify(not self.paused)
+        address, token_id, amount = params["address"], params["token_id"], params["amount"]
+        verify(ctx.sender == self.administrator or address == ctx.sender,
+               "FA2_NOT_OWNER")
+        verify(token_id in self.token_metadata, "FA2_TOKEN_UNDEFINED")
+        if amount > 0:
+            balance = self.ledger.item((address, token_id))
+            verify(balance >= amount, "FA2_INSUFFICIENT_BALANCE")
+            if balance == amount:
+                del self.ledger[(address, token_id)]
+            else:
+                self.ledger[(address, token_id)] = balance - amount
+            self.total_supply[token_id] = self.total_supply.item(token_id) - amount
+
+    def update_operators(self, ctx: Context, updates: List[Tuple[str, str, str, int]]):
+        """``updates``: [("add_operator" | "remove_operator", owner, operator, token_id)]."""
+        for kind, owner, operator, token_id in updates:
+            verify(owner == ctx.sender or ctx.sender == self.administrator)
+            if kind == "add_operator":
+                self.operators[(owner, operator, token_id)] = True
+            else:
+                del self.operators[(owner, operator, token_id)]
+
+    def payout_balance(self, ctx: Context, params=None):
+        verify(ctx.sender == self.payout,
+               "only the admin can receive the payment from the contract")
+        return [send(self.payout, self.balance)]
+
+    def set_administrator(self, ctx: Context, administrator: str):
+        verify(ctx.sender == self.administrator)
+        self.administrator = administrator
+
+    def set_pause(self, ctx: Context, paused: bool):
+        verify(ctx.sender == self.administrator)
+        self.paused = paused
+
+    def mint_token(self, params: Dict[str, Any]):
+        address, token_id, amount = params["address"], params["token_id"], params["amount"]
+        self.all_tokens = max(self.all_tokens, token_id + 1)
+        self.ledger[(address, token_id)] = self.ledger.get((address, token_id), 0) + amount
+        self.total_supply[token_id] = self.total_supply.get(token_id, 0) + amount
+        if token_id not in self.token_metadata:
+            self.token_metadata[token_id] = params["token_info"]
+
+    def mint(self, ctx: Context, params: Dict[str, Any]):
+        """``params``: {address, amount, token_id, token_info}."""
+        verify(ctx.sender == self.administrator)
+        self.mint_token(params)
+
+    def mint_batch(self, ctx: Context, params: List[Dict[str, Any]]):
+        verify(ctx.sender == self.administrator)
+        for item in params:
+            self.mint_token(item)
+
+
+class TypedMinter(Model):
+    SCALARS = ("objkt_id", "manager", "royal", "mint_paused")
+    ENTRYPOINTS = ("mint_TYPED", "mint_TYPED_batch", "update_royalties",
+                   "set_pause_mint", "payout_balance")
+
+    def __init__(self, chain: Chain, address: str, objkt: str, manager: str,
+                 royal: int):
+        Model.__init__(self, chain, address)
+        self.objkt = objkt
+        self.manager = manager
+        self.royal = royal
+        self.objkt_id = 0
+        self.mint_paused = False
+        self.royalties = self.map()
+
+    def mint_TYPED(self, ctx: Context, params: Dict[str, Any]):
+        """``params``: {amount, metadata}."""
+        verify(0 < params["amount"] <= 9999)
+        verify(not self.mint_paused, "mint paused")
+        op = Operation(self.objkt, "mint", dict(
+            address=ctx.sender, amount=params["amount"],
+            token_id=self.objkt_id, token_info={"": params["metadata"]}), 0)
+        self.royalties[self.objkt_id] = (ctx.sender, self.royal)
+        self.objkt_id += 1
+        return [op]
+
+    def mint_TYPED_batch(self, ctx: Context, params: List[Dict[str, Any]]):
+        verify(len(params) > 0, "empty batch")
+        verify(not self.mint_paused, "mint paused")
+        mints = []
+        for item in params:
+            verify(0 < item["amount"] <= 9999)
+            mints.append(dict(address=ctx.sender, amount=item["amount"],
+                              token_id=self.objkt_id,
+                              token_info={"": item["metadata"]}))
+            self.royalties[self.objkt_id] = (ctx.sender, self.royal)
+            self.objkt_id += 1
+        return [Operation(self.objkt, "mint_batch", mints, 0)]
+
+    def update_royalties(self, ctx: Context, new_royal: int):
+        verify(ctx.sender == self.manager, "MP_NOT_MANAGER")
+        verify(new_royal <= 250, "MP_WRONG_ROYALTIES")
+        self.royal = new_royal
+
+    def set_pause_mint(self, ctx: Context, pause: bool):
+        verify(ctx.sender == self.manager, "MP_NOT_MANAGER")
+        self.mint_paused = pause
+
+    def payout_balance(self, ctx: Context, params=None):
+        verify(ctx.sender == self.manager,
+               "only the admin can receive the payment from the contract")
+        return [send(self.manager, self.balance)]
+
+
+class Swap(NamedTuple):
+    issuer: str
+    fa2: str
+    objkt_id: int
+    objkt_amount: int
+    xtz_per_objkt: int
+    royalties: Optional[int]
+    creator: str
+
+
+class TypedMarket(Model):
+    SCALARS = ("manager", "fee", "royalties", "fee_recipient", "counter",
+               "swaps_paused", "collects_paused")
+    ENTRYPOINTS = ("swap", "collect", "collect_editions", "collect_batch",
+                   "cancel_swap", "cancel_swaps", "update_price", "update_fee",
+                   "update_royalties", "set_pause_swaps", "set_pause_collects",
+                   "payout_balance")
+
+    def __init__(self, chain: Chain, address: str, manager: str,
+                 allowed_fa2s: List[str], fee: int, royalties: int,
+                 live_royalties: bool = False, escrow: bool = True):
+        Model.__init__(self, chain, address)
+        self.live_royalties = live_royalties
+        self.escrow = escrow
+        self.manager = manager
+        self.allowed_fa2s = set(allowed_fa2s)
+        self.fee = fee
+        self.royalties = royalties
+        self.fee_recipient = manager
+        self.counter = 0
+        self.swaps_paused = False
+        self.collects_paused = False
+        self.swaps = self.map()
+
+    def token_holder(self, issuer: str) -> str:
+        return self.address if self.escrow else issuer
+
+    def swap_royalties(self, swap: Swap) -> int:
+        return self.royalties if self.live_royalties else swap.royalties
+
+    def fa2_transfer(self, fa2: str, from_: str, to_: str, token_id: int,
+                     amount: int) -> Operation:
+        return Operation(fa2, "transfer", [(from_, [(to_, token_id, amount)])], 0)
+
+    def split_payment(self, swap: Swap, total: int) -> List[Tuple[str, int]]:
+        payments = []
+        royalties_amount = split_tokens(total, self.swap_royalties(swap), 1000)
+        if royalties_amount > 0:
+            payments.append((swap.creator, royalties_amount))
+        fee_amount = split_tokens(total, self.fee, 1000)
+        if fee_amount > 0:
+            payments.append((self.fee_recipient, fee_amount))
+        payments.append((swap.issuer, total - royalties_amount - fee_amount))
+        return payments
+
+    def swap(self, ctx: Context, params: Dict[str, Any]):
+        """``params``: {fa2, objkt_id, objkt_amount, xtz_per_objkt, royalties, creator}."""
+        verify(not self.swaps_paused, "MP_SWAPS_PAUSED")
+        verify(ctx.amount == 0, "MP_TEZ_TRANSFER")
+        verify(params["fa2"] in self.allowed_fa2s, "MP_FA2_NOT_ALLOWED")
+        verify(params["objkt_amount"] > 0, "MP_NO_SWAPPED_EDITIONS")
+        ops = []
+        if self.escrow:
+            ops.append(self.fa2_transfer(params["fa2"], ctx.sender, self.address,
+                                         params["objkt_id"], params["objkt_amount"]))
+        self.swaps[self.counter] = Swap(
+            ctx.sender, params["fa2"], params["objkt_id"], params["objkt_amount"],
+            params["xtz_per_objkt"], None if self.live_royalties else self.royalties,
+            params["creator"])
+        self.counter += 1
+        return ops
+
+    def collect(self, ctx: Context, swap_id: int):
+        return self.collect_swap(ctx, swap_id, 1)
+
+    def collect_editions(self, ctx: Context, params: Dict[str, int]):
+        """``params``: {swap_id, quantity}."""
+        return self.collect_swap(ctx, params["swap_id"], params["quantity"])
+
+    def collect_swap(self, ctx: Context, swap_id: int, quantity: int):
+        verify(not self.collects_paused, "MP_COLLECTS_PAUSED")
+        verify(swap_id in self.swaps, "MP_WRONG_SWAP_ID")
+        swap = self.swaps[swap_id]
+        verify(ctx.sender != swap.issuer, "MP_IS_SWAP_ISSUER")
+        verify(quantity > 0, "MP_NO_COLLECTED_EDITIONS")
+        verify(swap.objkt_amount >= quantity, "MP_SWAP_COLLECTED")
+        total = swap.xtz_per_objkt * quantity
+        verify(ctx.amount == total, "MP_WRONG_TEZ_AMOUNT")
+        ops = []
+        if total != 0:
+            ops.extend(send(to, amount) for to, amount in self.split_payment(swap, total))
+        ops.append(self.fa2_transfer(swap.fa2, self.token_holder(swap.issuer),
+                                     ctx.sender, swap.objkt_id, quantity))
+        if swap.objkt_amount == quantity:
+            del self.swaps[swap_id]
+        else:
+            self.swaps[swap_id] = swap._replace(objkt_amount=swap.objkt_amount - quantity)
+        return ops
+
+    def collect_batch(self, ctx: Context, swap_ids: List[int]):
+        verify(not self.collects_paused, "MP_COLLECTS_PAUSED")
+        total = 0
+        payouts: Dict[str, int] = {}
+        transfers: Dict[str, Dict[str, List[Tuple[str, int, int]]]] = {}
+        for swap_id in swap_ids:
+            verify(swap_id in self.swaps, "MP_WRONG_SWAP_ID")
+            swap = self.swaps[swap_id]
+            verify(ctx.sender != swap.issuer, "MP_IS_SWAP_ISSUER")
+            verify(swap.objkt_amount > 0, "MP_SWAP_COLLECTED")
+            total += swap.xtz_per_objkt
+            if swap.xtz_per_objkt != 0:
+                for to, amount in self.split_payment(swap, swap.xtz_per_objkt):
+                    payouts[to] = payouts.get(to, 0) + amount
+            transfers.setdefault(swap.fa2, {}).setdefault(
+                self.token_holder(swap.issuer), []).append(
+                    (ctx.sender, swap.objkt_id, 1))
+            if swap.objkt_amount == 1:
+                del self.swaps[swap_id]
+            else:
+                self.swaps[swap_id] = swap._replace(objkt_amount=swap.objkt_amount - 1)
+        verify(ctx.amount == total, "MP_WRONG_TEZ_AMOUNT")
+        # The contract sends these in map key order; the order changes
+        # neither the outcome nor the final storage.
+        ops = [send(to, amount) for to, amount in payouts.items() if amount > 0]
+        for fa2, sources in transfers.items():
+            ops.append(Operation(fa2, "transfer", list(sources.items()), 0))
+        return ops
+
+    def remove_swap(self, ctx: Context, swap_id: int) -> Swap:
+        verify(swap_id in self.swaps, "MP_WRONG_SWAP_ID")
+        swap = self.swaps[swap_id]
+        verify(ctx.sender == swap.issuer, "MP_NOT_SWAP_ISSUER")
+        verify(swap.objkt_amount > 0, "MP_SWAP_COLLECTED")
+        del self.swaps[swap_id]
+        return swap
+
+    def cancel_swap(self, ctx: Context, swap_id: int):
+        verify(ctx.amount == 0, "MP_TEZ_TRANSFER")
+        swap = self.remove_swap(ctx, swap_id)
+        if not self.escrow:
+            return []
+        return [self.fa2_transfer(swap.fa2, self.address, ctx.sender,
+                                  swap.objkt_id, swap.objkt_amount)]
+
+    def cancel_swaps(self, ctx: Context, swap_ids: List[int]):
+        verify(ctx.amount == 0, "MP_TEZ_TRANSFER")
+        txs: Dict[str, List[Tuple[str, int, int]]] = {}
+        for swap_id in swap_ids:
+            swap = self.remove_swap(ctx, swap_id)
+            txs.setdefault(swap.fa2, []).append(
+                (ctx.sender, swap.objkt_id, swap.objkt_amount))
+        if not self.escrow:
+            return []
+        return [Operation(fa2, "transfer", [(self.address, items)], 0)
+                for fa2, items in txs.items()]
+
+    def update_price(self, ctx: Context, params: Dict[str, int]):
+        """``params``: {swap_id, xtz_per_objkt}."""
+        verify(not self.swaps_paused, "MP_SWAPS_PAUSED")
+        verify(ctx.amount == 0, "MP_TEZ_TRANSFER")
+        verify(params["swap_id"] in self.swaps, "MP_WRONG_SWAP_ID")
+        swap = self.swaps[params["swap_id"]]
+        verify(ctx.sender == swap.issuer, "MP_NOT_SWAP_ISSUER")
+        self.swaps[params["swap_id"]] = swap._replace(
+            xtz_per_objkt=params["xtz_per_objkt"])
+
+    def check_manager_call(self, ctx: Context):
+        verify(ctx.sender == self.manager, "MP_NOT_MANAGER")
+        verify(ctx.amount == 0, "MP_TEZ_TRANSFER")
+
+    def update_fee(self, ctx: Context, new_fee: int):
+        self.check_manager_call(ctx)
+        verify(new_fee <= 250, "MP_WRONG_FEES")
+        self.fee = new_fee
+
+    def update_royalties(self, ctx: Context, new_royalties: int):
+        self.check_manager_call(ctx)
+        verify(new_royalties <= 250, "MP_WRONG_ROYALTIES")
+        self.royalties = new_royalties
+
+    def set_pause_swaps(self, ctx: Context, pause: bool):
+        self.check_manager_call(ctx)
+        self.swaps_paused = pause
+
+    def set_pause_collects(self, ctx: Context, pause: bool):
+        self.check_manager_call(ctx)
+        self.collects_paused = pause
+
+    def payout_balance(self, ctx: Context, params=None):
+        verify(ctx.sender == self.manager,
+               "only the admin can receive the payment from the contract")
+        return [send(self.manager, self.balance)]
+
+
+class TypedRegister(Model):
+    ENTRYPOINTS = ("register", "payout_balance")
+
+    def __init__(self, chain: Chain, address: str):
+        Model.__init__(self, chain, address)
+        self.admin = PAYOUT
+        self.name_check = self.map()
+        self.userlist = self.map()
+
+    def register(self, ctx: Context, params: Dict[str, bytes]):
+        """``params``: {name}."""
+        name = params["name"]
+        verify(name not in self.name_check, "this name is taken")
+        if ctx.sender in self.userlist:
+            del self.name_check[self.userlist[ctx.sender]]
+        self.name_check[name] = name
+        self.userlist[ctx.sender] = name
+
+    def payout_balance(self, ctx: Context, params=None):
+        verify(ctx.sender == self.admin, "not admin")
+        return [send(self.admin, self.balance)]
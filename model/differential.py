@@ -0,0 +1,279 @@
+"""Replay fuzzed traces in the SmartPy interpreter and compare storage.
+
+Usage::
+
+    python -m model.differential --samples 5 --ops 300 --output diff_tests
+    python -m model.differential --samples 5 --ops 300 --output diff_tests --run
+
+Each sample is a trace of :mod:`model.fuzz` turned into a SmartPy test
+scenario: every call is run with the outcome the model predicts
+(``valid=False`` and the failure message for failed calls), and the
+storage and balances of the four contracts are then verified against the
+model's final state. ``--run`` runs the scenarios with ``SmartPy.sh test``;
+a divergence makes the scenario, and the command, fail.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import Iterable, List, Optional, Set, Tuple
+
+from benchmarks.smartpy import DEFAULT_CLI, ROOT, ScenarioFailed, run_test
+
+from . import fuzz
+from .contracts import PAYOUT
+from .fuzz import Call, World
+
+CONTRACTS = ("fa2", "minter", "market", "register")
+
+
+def address(name: str) -> str:
+    if name in CONTRACTS:
+        return "%s.address" % name
+    if name == PAYOUT:
+        return 'sp.address("%s")' % PAYOUT
+    return 'accounts["%s"].address' % name
+
+
+def nbytes(value: bytes) -> str:
+    return 'sp.bytes("0x%s")' % value.hex()
+
+
+def record(**fields) -> str:
+    return "sp.record(%s)" % ", ".join("%s = %s" % item for item in fields.items())
+
+
+def plist(items: Iterable[str]) -> str:
+    return "[%s]" % ", ".join(items)
+
+
+def parameter(call: Call) -> str:
+    """The SmartPy expression of the parameter of ``call``."""
+    p = call.params
+    ep = call.entrypoint
+    if ep in ("payout_balance",):
+        return ""
+    if ep == "transfer":
+        return plist(record(from_=address(from_), txs=plist(
+            record(to_=address(to_), token_id=token_id, amount=amount)
+            for to_, token_id, amount in txs)) for from_, txs in p)
+    if ep == "burn":
+        return record(address=address(p["address"]), token_id=p["token_id"],
+                      amount=p["amount"])
+    if ep == "update_operators":
+        return plist('sp.variant("%s", %s)' % (kind, record(
+            owner=address(owner), operator=address(operator), token_id=token_id))
+            for kind, owner, operator, token_id in p)
+    if ep == "set_administrator":
+        return address(p)
+    if ep == "mint_TYPED":
+        return record(amount=p["amount"], metadata=nbytes(p["metadata"]))
+    if ep == "mint_TYPED_batch":
+        return plist(record(amount=item["amount"], metadata=nbytes(item["metadata"]))
+                     for item in p)
+    if ep == "swap":
+        return record(fa2=address(p["fa2"]), objkt_id=p["objkt_id"],
+                      objkt_amount=p["objkt_amount"],
+                      xtz_per_objkt="sp.mutez(%d)" % p["xtz_per_objkt"],
+                      royalties=p["royalties"], creator=address(p["creator"]))
+    if ep == "update_price":
+        return record(swap_id=p["swap_id"],
+                      xtz_per_objkt="sp.mutez(%d)" % p["xtz_per_objkt"])
+    if ep == "collect_editions":
+        return record(swap_id=p["swap_id"], quantity=p["quantity"])
+    if ep == "register":
+        return record(name=nbytes(p["name"]))
+    if isinstance(p, bool):
+        return repr(p)
+    if isinstance(p, list):
+        return plist(str(x) for x in p)
+    return str(p)
+
+
+def run_line(call: Call, outcome: Optional[str]) -> str:
+    args = ["sender = %s" % address(call.sender),
+            "amount = sp.mutez(%d)" % call.amount]
+    if outcome != fuzz.OK:
+        args.append("valid = False")
+        if outcome is not None:
+            args.append("exception = %r" % outcome)
+    return "    %s.%s(%s).run(%s)" % (call.destination, call.entrypoint,
+                                     parameter(call), ", ".join(args))
+
+
+def verify(condition: str) -> str:
+    return "    scenario.verify(%s)" % condition
+
+
+def operator_keys(trace: List[Call]) -> Set[Tuple[str, str, int]]:
+    return {(owner, operator, token_id)
+            for call in trace if call.entrypoint == "update_operators"
+            for _, owner, operator, token_id in call.params}
+
+
+def final_checks(world: World, trace: List[Call]) -> List[str]:
+    lines = []
+    fa2, minter, market, register = (world.fa2, world.minter, world.market,
+                                     world.register)
+    holders = sorted(set(world.accounts) | {"market"})
+
+    lines.append(verify("fa2.data.administrator == %s" % address(fa2.administrator)))
+    lines.append(verify("fa2.data.paused == %r" % fa2.paused))
+    lines.append(verify("fa2.data.all_tokens == %d" % fa2.all_tokens))
+    for token_id in range(fa2.all_tokens):
+        lines.append(verify("fa2.data.total_supply[%d] == %d"
+                            % (token_id, fa2.total_supply[token_id])))
+        for holder in holders:
+            key = "sp.pair(%s, %d)" % (address(holder), token_id)
+            if (holder, token_id) in fa2.ledger:
+                lines.append(verify("fa2.data.ledger[%s].balance == %d"
+                                    % (key, fa2.ledger[(holder, token_id)])))
+            else:
+                lines.append(verify("~fa2.data.ledger.contains(%s)" % key))
+    for owner, operator, token_id in sorted(operator_keys(trace)):
+        key = record(owner=address(owner), operator=address(operator),
+                     token_id=token_id)
+        present = (owner, operator, token_id) in fa2.operators
+        lines.append(verify("%sfa2.data.operators.contains(%s)"
+                            % ("" if present else "~", key)))
+
+    lines.append(verify("minter.data.objkt_id == %d" % minter.objkt_id))
+    lines.append(verify("minter.data.royal == %d" % minter.royal))
+    lines.append(verify("minter.data.mint_paused == %r" % minter.mint_paused))
+    for token_id, (issuer, royalties) in sorted(minter.royalties.items()):
+        lines.append(verify("minter.data.royalties[%d].issuer == %s"
+                            % (token_id, address(issuer))))
+        lines.append(verify("minter.data.royalties[%d].royalties == %d"
+                            % (token_id, royalties)))
+
+    for name in ("counter", "fee", "royalties"):
+        lines.append(verify("market.data.%s == %d" % (name, getattr(market, name))))
+    for name in ("swaps_paused", "collects_paused"):
+        lines.append(verify("market.data.%s == %r" % (name, getattr(market, name))))
+    for swap_id in range(market.counter):
+        swap = market.swaps.get(swap_id)
+        if swap is None:
+            lines.append(verify("~market.data.swaps.contains(%d)" % swap_id))
+            continue
+        lines.append(verify("market.data.swaps[%d].issuer == %s"
+                            % (swap_id, address(swap.issuer))))
+        lines.append(verify("market.data.swaps[%d].creator == %s"
+                            % (swap_id, address(swap.creator))))
+        lines.append(verify("market.data.swaps[%d].xtz_per_objkt == sp.mutez(%d)"
+                            % (swap_id, swap.xtz_per_objkt)))
+        for name in ("objkt_id", "objkt_amount", "royalties"):
+            if getattr(swap, name) is not None:
+                lines.append(verify("market.data.swaps[%d].%s == %d"
+                                    % (swap_id, name, getattr(swap, name))))
+
+    for user in world.accounts:
+        if user in register.userlist:
+            lines.append(verify("register.data.userlist[%s].name == %s"
+                                % (address(user), nbytes(register.userlist[user]))))
+        else:
+            lines.append(verify("~register.data.userlist.contains(%s)" % address(user)))
+    for name in sorted({c.params["name"] for c in trace if c.entrypoint == "register"}):
+        lines.append(verify("%sregister.data.name_check.contains(%s)"
+                            % ("" if name in register.name_check else "~",
+                               nbytes(name))))
+
+    for name in CONTRACTS:
+        lines.append(verify("%s.balance == sp.mutez(%d)"
+                            % (name, world.chain.contracts[name].balance)))
+    return lines
+
+
+HEADER = '''import smartpy as sp
+
+FA2 = sp.io.import_script_from_url("file:{root}/contracts/fa2_v1.py")
+Minter = sp.io.import_script_from_url("file:{root}/contracts/minter_v1.py")
+Market = sp.io.import_script_from_url("file:{root}/contracts/market_v1.py")
+Register = sp.io.import_script_from_url("file:{root}/contracts/register_v1.py")
+
+METADATA = sp.utils.metadata_of_url("ipfs://differential")
+
+@sp.add_test(name = "{name}")
+def test():
+    scenario = sp.test_scenario()
+    accounts = {{name: sp.test_account(name) for name in {accounts!r}}}
+    admin = accounts["{admin}"].address
+    fa2 = FA2.FA2(config = FA2.FA2_config(add_mutez_transfer = False, lean_storage = {lean_storage},
+                                        track_total_supply = True),
+                  admin = admin, meta = METADATA)
+    scenario += fa2
+    minter = Minter.TypedMinter(objkt = fa2.address, manager = admin,
+                                metadata = METADATA, royal = {royalties})
+    scenario += minter
+    market = Market.TypedMarket(manager = admin, metadata = METADATA,
+                                allowed_fa2s = sp.big_map({{fa2.address: sp.unit}}),
+                                fee = {fee}, royalties = {royalties},
+                                config = Market.Market_config(live_royalties = {live_royalties}, escrow = {escrow}))
+    scenario += market
+    register = Register.TypedRegister()
+    scenario += register
+'''
+
+
+def scenario(name: str, ops: int, seed: int, lean_storage: bool = False,
+             escrow: bool = True, live_royalties: bool = False) -> str:
+    """The SmartPy test script of the trace of ``seed``."""
+    result = fuzz.run(ops, seed=seed, check_every=0, lean_storage=lean_storage,
+                      escrow=escrow, keep_trace=True,
+                      live_royalties=live_royalties)
+    if result.violations:
+        raise AssertionError("model invariants violated: %s" % result.violations[0])
+    world = result.world
+    lines = [HEADER.format(root=ROOT, name=name, accounts=world.accounts,
+                           admin=fuzz.ADMIN, lean_storage=lean_storage,
+                           live_royalties=live_royalties, escrow=escrow, fee=fuzz.FEE, royalties=fuzz.ROYALTIES)]
+    lines += [run_line(call, outcome)
+              for call, outcome in zip(result.trace, result.outcomes)]
+    lines += final_checks(world, result.trace)
+    return "\n".join(lines) + "\n"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m model.differential",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--ops", type=int, default=300,
+                        help="operations per sampled trace")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the first sample")
+    parser.add_argument("--lean-storage", action="store_true")
+    parser.add_argument("--live-royalties", action="store_true")
+    parser.add_argument("--no-escrow", dest="escrow", action="store_false")
+    parser.add_argument("--output", default="differential")
+    parser.add_argument("--run", action="store_true",
+                        help="run the scenarios with SmartPy.sh test")
+    parser.add_argument("--smartpy", default=DEFAULT_CLI)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    for seed in range(args.seed, args.seed + args.samples):
+        name = "differential_%d" % seed
+        path = os.path.join(args.output, name + ".py")
+        with open(path, "w") as f:
+            f.write(scenario(name, args.ops, seed, lean_storage=args.lean_storage,
+                             escrow=args.escrow,
+                             live_royalties=args.live_royalties))
+        if not args.run:
+            print(path)
+            continue
+        try:
+            run_test(path, os.path.join(args.output, name), cli=args.smartpy)
+            print("%s: ok" % path)
+        except ScenarioFailed as e:
+            failed += 1
+            print("%s: DIVERGED\n%s" % (path, e), file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
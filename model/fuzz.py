@@ -0,0 +1,345 @@
+"""Random operations against the models, with invariant checks.
+
+Usage::
+
+    python -m model.fuzz --ops 1000000 --seed 1
+    python -m model.fuzz --ops 100000 --lean-storage --live-royalties --no-escrow
+
+Most generated operations are meant to succeed (they pick existing swaps,
+owned tokens, the right amounts); the others exercise the failure paths.
+The invariants of :mod:`model.properties` are checked every
+``--check-every`` operations and the fee formula after every collect.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import multiprocessing
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Iterator, List, NamedTuple, Optional
+
+from . import properties
+from .chain import Chain, Failed
+from .contracts import PAYOUT, FA2, TypedMarket, TypedMinter, TypedRegister
+
+ADMIN = "admin"
+USERS = ["alice", "bob", "carol", "dave", "eve"]
+
+FEE = 50
+ROYALTIES = 100
+PRICES = [0, 1, 7, 1000, 1000000, 2500000]
+
+
+class Call(NamedTuple):
+    sender: str
+    destination: str
+    entrypoint: str
+    params: Any = None
+    amount: int = 0
+
+
+class World:
+    """The four contracts wired as deployed: the minter administers FA2
+    and the market accepts its tokens."""
+
+    def __init__(self, lean_storage: bool = False, escrow: bool = True,
+                 users: List[str] = USERS, live_royalties: bool = False):
+        self.chain = Chain()
+        self.fa2 = FA2(self.chain, "fa2", ADMIN, lean_storage=lean_storage)
+        self.minter = TypedMinter(self.chain, "minter", objkt="fa2",
+                                  manager=ADMIN, royal=ROYALTIES)
+        self.market = TypedMarket(self.chain, "market", manager=ADMIN,
+                                  allowed_fa2s=["fa2"], fee=FEE,
+                                  royalties=ROYALTIES,
+                                  live_royalties=live_royalties, escrow=escrow)
+        self.register = TypedRegister(self.chain, "register")
+        self.users = list(users)
+        self.accounts = [ADMIN] + self.users
+
+    def setup(self) -> List[Call]:
+        return [Call(ADMIN, "fa2", "set_administrator", "minter")]
+
+    def apply(self, call: Call):
+        """Run ``call``; raises :class:`~model.chain.Failed` if it fails."""
+        self.chain.call(call.sender, call.destination, call.entrypoint,
+                        call.params, call.amount)
+
+
+class Generator:
+    def __init__(self, world: World, rng: random.Random):
+        self.world = world
+        self.rng = rng
+        self.names = [b"name%d" % i for i in range(12)]
+        # Calls preparing the next one, e.g. the operator a swap needs.
+        self.pending: List[Call] = []
+        self.ops = [
+            (20, self.transfer), (4, self.burn), (8, self.update_operators),
+            (10, self.mint), (3, self.mint_batch), (12, self.swap),
+            (12, self.collect), (6, self.collect_editions),
+            (5, self.collect_batch), (5, self.cancel_swap),
+            (2, self.cancel_swaps), (3, self.update_price), (4, self.register),
+            (1, self.manage), (1, self.payout),
+        ]
+        self.cumulative = list(itertools.accumulate(w for w, _ in self.ops))
+
+    def below(self, n: int) -> int:
+        """``randrange(n)``, without its argument checks."""
+        return int(self.rng.random() * n)
+
+    def user(self) -> str:
+        users = self.world.users
+        return users[self.below(len(users))]
+
+    def holding(self):
+        """(owner, token_id, balance), mostly with a positive balance among
+        the recent tokens."""
+        fa2 = self.world.fa2
+        accounts = self.world.accounts
+        low = max(0, fa2.all_tokens - 64)
+        for _ in range(8):
+            owner = accounts[self.below(len(accounts))]
+            token_id = low + self.below(fa2.all_tokens + 1 - low)
+            balance = fa2.ledger.get((owner, token_id), 0)
+            if balance:
+                break
+        return owner, token_id, balance
+
+    def swap_id(self) -> int:
+        """Mostly an open swap among the recent ones."""
+        market = self.world.market
+        low = max(0, market.counter - 64)
+        for _ in range(8):
+            swap_id = low + self.below(market.counter + 1 - low)
+            if swap_id in market.swaps:
+                break
+        return swap_id
+
+    def transfer(self) -> Call:
+        owner, token_id, balance = self.holding()
+        txs = [(self.rng.choice(self.world.accounts), token_id,
+                self.below(balance + 2))
+               for _ in range(self.rng.randint(1, 3))]
+        sender = owner if self.rng.random() < 0.9 else self.user()
+        return Call(sender, "fa2", "transfer", [(owner, txs)])
+
+    def burn(self) -> Call:
+        owner, token_id, balance = self.holding()
+        return Call(owner, "fa2", "burn", dict(
+            address=owner, token_id=token_id,
+            amount=self.below(balance + 2)))
+
+    def update_operators(self) -> Call:
+        owner, token_id, _ = self.holding()
+        kind = "add_operator" if self.rng.random() < 0.8 else "remove_operator"
+        operator = "market" if self.rng.random() < 0.8 else self.user()
+        sender = owner if self.rng.random() < 0.95 else self.user()
+        return Call(sender, "fa2", "update_operators",
+                    [(kind, owner, operator, token_id)])
+
+    def mint(self) -> Call:
+        amount = self.rng.choice([1, 1, 5, 10, 100, 0, 10000])
+        return Call(self.user(), "minter", "mint_TYPED",
+                    dict(amount=amount, metadata=b"ipfs://%d" % self.below(99)))
+
+    def mint_batch(self) -> Call:
+        items = [dict(amount=self.rng.choice([1, 3, 10]), metadata=b"ipfs://b")
+                 for _ in range(self.rng.randint(0, 4))]
+        return Call(self.user(), "minter", "mint_TYPED_batch", items)
+
+    def swap(self) -> Call:
+        owner, token_id, balance = self.holding()
+        operator_key = (owner, "market", token_id)
+        if (self.world.market.escrow and balance
+                and operator_key not in self.world.fa2.operators
+                and self.rng.random() < 0.8):
+            self.pending.append(Call(owner, "fa2", "update_operators",
+                                     [("add_operator",) + operator_key]))
+        return Call(owner, "market", "swap", dict(
+            fa2="fa2", objkt_id=token_id,
+            objkt_amount=self.below(balance + 1) if balance else 1,
+            xtz_per_objkt=self.rng.choice(PRICES), royalties=ROYALTIES,
+            creator=self.rng.choice(self.world.accounts)))
+
+    def _price(self, swap_id: int, quantity: int) -> int:
+        swap = self.world.market.swaps.get(swap_id)
+        price = swap.xtz_per_objkt * quantity if swap else 0
+        return price if self.rng.random() < 0.95 else price + 1
+
+    def collect(self) -> Call:
+        swap_id = self.swap_id()
+        return Call(self.user(), "market", "collect", swap_id,
+                    self._price(swap_id, 1))
+
+    def collect_editions(self) -> Call:
+        swap_id = self.swap_id()
+        quantity = self.rng.randint(0, 3)
+        return Call(self.user(), "market", "collect_editions",
+                    dict(swap_id=swap_id, quantity=quantity),
+                    self._price(swap_id, quantity))
+
+    def collect_batch(self) -> Call:
+        swap_ids = [self.swap_id() for _ in range(self.rng.randint(1, 4))]
+        amount = sum(self._price(swap_id, 1) for swap_id in swap_ids)
+        return Call(self.user(), "market", "collect_batch", swap_ids, amount)
+
+    def cancel_swap(self) -> Call:
+        swap_id = self.swap_id()
+        swap = self.world.market.swaps.get(swap_id)
+        sender = swap.issuer if swap and self.rng.random() < 0.9 else self.user()
+        return Call(sender, "market", "cancel_swap", swap_id)
+
+    def cancel_swaps(self) -> Call:
+        swap_ids = [self.swap_id() for _ in range(self.rng.randint(0, 4))]
+        issuers = [self.world.market.swaps[swap_id].issuer for swap_id in swap_ids
+                   if swap_id in self.world.market.swaps]
+        sender = issuers[0] if issuers and self.rng.random() < 0.9 else self.user()
+        return Call(sender, "market", "cancel_swaps", swap_ids)
+
+    def update_price(self) -> Call:
+        swap_id = self.swap_id()
+        swap = self.world.market.swaps.get(swap_id)
+        sender = swap.issuer if swap and self.rng.random() < 0.9 else self.user()
+        return Call(sender, "market", "update_price", dict(
+            swap_id=swap_id, xtz_per_objkt=self.rng.choice(PRICES)))
+
+    def register(self) -> Call:
+        return Call(self.user(), "register", "register",
+                    dict(name=self.rng.choice(self.names)))
+
+    def manage(self) -> Call:
+        sender = ADMIN if self.rng.random() < 0.8 else self.user()
+        return self.rng.choice([
+            Call(sender, "market", "update_fee", self.rng.choice([0, 25, 50, 250, 251])),
+            Call(sender, "market", "update_royalties", self.rng.choice([0, 100, 250, 300])),
+            Call(sender, "minter", "update_royalties", self.rng.choice([0, 100, 251])),
+            Call(sender, "market", "set_pause_swaps", self.rng.random() < 0.1),
+            Call(sender, "market", "set_pause_collects", self.rng.random() < 0.1),
+            Call(sender, "minter", "set_pause_mint", self.rng.random() < 0.1),
+        ])
+
+    def payout(self) -> Call:
+        return self.rng.choice([
+            Call(PAYOUT, "fa2", "payout_balance"),
+            Call(ADMIN, "market", "payout_balance"),
+            Call(ADMIN, "minter", "payout_balance"),
+            Call(self.user(), "register", "payout_balance"),
+        ])
+
+    def __iter__(self) -> Iterator[Call]:
+        while True:
+            pick = self.rng.random() * self.cumulative[-1]
+            call = self.ops[bisect.bisect(self.cumulative, pick)][1]()
+            while self.pending:
+                yield self.pending.pop()
+            yield call
+
+
+class Result(NamedTuple):
+    world: World
+    trace: List[Call]
+    outcomes: List[Optional[str]]
+    failures: Counter
+    violations: List[str]
+
+
+OK = "ok"
+
+
+def run(ops: int, seed: int = 0, check_every: int = 10000,
+        lean_storage: bool = False, escrow: bool = True,
+        keep_trace: bool = False, live_royalties: bool = False) -> Result:
+    """Apply ``ops`` random operations. The outcome of an operation is
+    :data:`OK` or its failure message."""
+    world = World(lean_storage=lean_storage, escrow=escrow,
+                  live_royalties=live_royalties)
+    generator = Generator(world, random.Random(seed))
+    market, balances = world.market, world.chain.balances
+    trace: List[Call] = []
+    outcomes: List[Optional[str]] = []
+    failures: Counter = Counter()
+    violations: List[str] = []
+    calls = iter(generator)
+    setup = world.setup()
+    for i in range(len(setup) + ops):
+        call = setup[i] if i < len(setup) else next(calls)
+        collected = None
+        if call.destination == "market" and call.entrypoint in ("collect", "collect_editions"):
+            swap_id = call.params if call.entrypoint == "collect" else call.params["swap_id"]
+            quantity = 1 if call.entrypoint == "collect" else call.params["quantity"]
+            collected = market.swaps.get(swap_id), quantity
+            before = dict(balances)
+        try:
+            world.apply(call)
+            outcome = OK
+            if collected is not None:
+                deltas = {a: balances.get(a, 0) - before.get(a, 0)
+                          for a in set(balances) | set(before)}
+                deltas = {a: d for a, d in deltas.items() if d}
+                violations += ["op %d: %s" % (i, e) for e in properties.collect_payouts(
+                    market, call.sender, collected[0], collected[1], deltas)]
+        except Failed as e:
+            outcome = e.message
+        failures[outcome] += 1
+        if keep_trace:
+            trace.append(call)
+            outcomes.append(outcome)
+        if check_every and (i + 1) % check_every == 0:
+            violations += ["op %d: %s" % (i, e) for e in properties.check_all(world.chain)]
+    violations += ["end: %s" % e for e in properties.check_all(world.chain)]
+    return Result(world, trace, outcomes, failures, violations)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m model.fuzz",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check-every", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="independent traces run in parallel, with "
+                             "seeds --seed, --seed + 1...; --ops each")
+    parser.add_argument("--lean-storage", action="store_true")
+    parser.add_argument("--live-royalties", action="store_true")
+    parser.add_argument("--no-escrow", dest="escrow", action="store_false")
+    return parser.parse_args(argv)
+
+
+def _run_seed(args_seed):
+    args, seed = args_seed
+    result = run(args.ops, seed=seed, check_every=args.check_every,
+                 lean_storage=args.lean_storage, escrow=args.escrow,
+                 live_royalties=args.live_royalties)
+    return result.failures, ["seed %d %s" % (seed, v) for v in result.violations]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    seeds = [(args, seed) for seed in range(args.seed, args.seed + args.jobs)]
+    start = time.perf_counter()
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            results = pool.map(_run_seed, seeds)
+    else:
+        results = [_run_seed(seeds[0])]
+    elapsed = time.perf_counter() - start
+    failures: Counter = Counter()
+    violations: List[str] = []
+    for seed_failures, seed_violations in results:
+        failures.update(seed_failures)
+        violations += seed_violations
+    total = args.ops * args.jobs
+    print("%d operations in %.1fs (%.0f ops/s)" % (total, elapsed, total / elapsed))
+    for outcome, count in failures.most_common():
+        print("%8d  %s" % (count, outcome))
+    for violation in violations[:50]:
+        print("VIOLATION " + violation, file=sys.stderr)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Invariants of the modelled contracts.
+
+Each check returns a list of violations, empty when the invariant holds.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from .chain import Chain
+from .contracts import FA2, TypedMarket, TypedMinter, TypedRegister, split_tokens
+
+
+def supply_conservation(fa2: FA2) -> List[str]:
+    """The balances of a token add up to its total supply, none negative."""
+    sums: Dict[int, int] = defaultdict(int)
+    errors = []
+    for (owner, token_id), balance in fa2.ledger.items():
+        if balance < 0:
+            errors.append("negative balance %d of %s for token %d"
+                          % (balance, owner, token_id))
+        sums[token_id] += balance
+    for token_id in set(sums) | set(fa2.total_supply):
+        if sums[token_id] != fa2.total_supply.get(token_id, 0):
+            errors.append("token %d: balances add up to %d, total_supply is %d"
+                          % (token_id, sums[token_id],
+                             fa2.total_supply.get(token_id, 0)))
+    if any(token_id >= fa2.all_tokens for token_id in fa2.token_metadata):
+        errors.append("token_metadata beyond all_tokens %d" % fa2.all_tokens)
+    return errors
+
+
+def tez_conservation(chain: Chain) -> List[str]:
+    total = sum(chain.balances.values())
+    return [] if total == 0 else ["%d mutez created" % total]
+
+
+def market_accounting(market: TypedMarket) -> List[str]:
+    """Swap ids come from the counter, open swaps have editions left, the
+    market keeps no tez and, with escrow, holds every listed edition."""
+    errors = []
+    listed: Dict[Tuple[str, int], int] = defaultdict(int)
+    for swap_id, swap in market.swaps.items():
+        if swap_id >= market.counter:
+            errors.append("swap %d beyond counter %d" % (swap_id, market.counter))
+        if swap.objkt_amount <= 0:
+            errors.append("swap %d is open with %d editions"
+                          % (swap_id, swap.objkt_amount))
+        listed[(swap.fa2, swap.objkt_id)] += swap.objkt_amount
+    if market.balance != 0:
+        errors.append("market holds %d mutez" % market.balance)
+    if market.escrow:
+        for (fa2, token_id), amount in listed.items():
+            held = market.chain.contracts[fa2].ledger.get(
+                (market.address, token_id), 0)
+            if held < amount:
+                errors.append("token %d: %d editions listed, market holds %d"
+                              % (token_id, amount, held))
+    return errors
+
+
+def collect_payouts(market: TypedMarket, buyer: str, swap, quantity: int,
+                    deltas: Dict[str, int]) -> List[str]:
+    """The balance changes of a successful collect of ``quantity`` editions
+    of ``swap`` against the royalties and fee formula."""
+    total = swap.xtz_per_objkt * quantity
+    royalties = split_tokens(total, market.swap_royalties(swap), 1000)
+    fee = split_tokens(total, market.fee, 1000)
+    expected: Dict[str, int] = defaultdict(int)
+    expected[buyer] -= total
+    expected[swap.creator] += royalties
+    expected[market.fee_recipient] += fee
+    expected[swap.issuer] += total - royalties - fee
+    errors = []
+    for address in set(expected) | set(deltas):
+        if expected[address] != deltas.get(address, 0):
+            errors.append("collect of swap by %s: %s balance changed by %d, "
+                          "expected %d" % (buyer, address,
+                                           deltas.get(address, 0),
+                                           expected[address]))
+    return errors
+
+
+def minter_accounting(minter: TypedMinter, fa2: FA2) -> List[str]:
+    errors = []
+    if len(minter.royalties) != minter.objkt_id:
+        errors.append("%d royalties for objkt_id %d"
+                      % (len(minter.royalties), minter.objkt_id))
+    if fa2.administrator == minter.address and fa2.all_tokens != minter.objkt_id:
+        errors.append("FA2 all_tokens %d, minter objkt_id %d"
+                      % (fa2.all_tokens, minter.objkt_id))
+    return errors
+
+
+def register_consistency(register: TypedRegister) -> List[str]:
+    """``userlist`` and ``name_check`` describe the same names."""
+    errors = []
+    names = set(register.userlist.values())
+    if len(names) != len(register.userlist):
+        errors.append("a name is registered twice")
+    if names != set(register.name_check):
+        errors.append("userlist and name_check differ")
+    return errors
+
+
+def check_all(chain: Chain) -> List[str]:
+    errors = tez_conservation(chain)
+    for contract in chain.contracts.values():
+        if isinstance(contract, FA2):
+            errors += supply_conservation(contract)
+        elif isinstance(contract, TypedMarket):
+            errors += market_accounting(contract)
+        elif isinstance(contract, TypedMinter):
+            errors += minter_accounting(contract, chain.contracts[contract.objkt])
+        elif isinstance(contract, TypedRegister):
+            errors += register_consistency(contract)
+    return errors
@@ -0,0 +1,181 @@
+"""Index a short synthetic operation stream and check the store."""
+
+import pytest
+
+from indexer import DecodeError, Indexer, Store
+from indexer import layouts, micheline
+
+FA2 = "KT1FA2"
+MARKET = "KT1Market"
+REGISTER = "KT1Register"
+ALICE = "tz1KqTpEZ7Yob7QbPE4Hy4Wo8fHG8LhKxZSx"
+BOB = "tz1Bob"
+
+CONFIG = {"contracts": {
+    FA2: {"kind": "fa2", "big_maps": {"ledger": 1, "operators": 2}},
+    MARKET: {"kind": "market", "big_maps": {"swaps": 3, "bundles": 4}},
+    REGISTER: {"kind": "register", "big_maps": {"userlist": 5,
+                                                "name_check": 6}},
+}}
+
+
+def s(value):
+    return {"string": value}
+
+
+def i(value):
+    return {"int": str(value)}
+
+
+def pair(*args):
+    return {"prim": "Pair", "args": list(args)}
+
+
+def update(big_map, key, value):
+    return {"big_map": big_map, "action": "update", "key": key, "value": value}
+
+
+def remove(big_map, key):
+    return {"big_map": big_map, "action": "remove", "key": key}
+
+
+def swap(issuer, token_id, amount, price):
+    return pair(s(issuer), s(FA2), i(token_id), i(amount), i(price), i(100),
+                s(issuer))
+
+
+def bundle(issuer, items, price):
+    return pair(s(issuer), s(FA2),
+                [pair(i(token_id), i(amount)) for token_id, amount in items],
+                i(price), i(100), s(issuer))
+
+
+def stream():
+    """Mint to Alice (her address in binary form), transfer to Bob, list
+    a swap and two bundles, collect one bundle, name Alice then Bob."""
+    return [
+        {"id": 1, "level": 10, "target": FA2, "entrypoint": "mint",
+         "big_map_diffs": [
+             update(1, pair({"bytes": "000002298c03ed7d454a101eb7022bc95f7e5f41ac78"},
+                            i(0)), i(10)),
+             update(1, pair(s(ALICE), i(1)), i(1))]},
+        {"id": 2, "level": 11, "target": FA2, "entrypoint": "transfer",
+         "parameter": [pair(s(ALICE), [pair(s(BOB), i(0), i(4))])],
+         "big_map_diffs": [update(1, pair(s(ALICE), i(0)), i(6)),
+                           update(1, pair(s(BOB), i(0)), i(4)),
+                           update(2, pair(s(ALICE), s(MARKET), i(0)),
+                                  {"prim": "Unit"})]},
+        {"id": 3, "level": 11, "target": FA2, "entrypoint": "transfer",
+         "status": "failed",
+         "parameter": [pair(s(BOB), [pair(s(ALICE), i(0), i(99))])],
+         "big_map_diffs": [update(1, pair(s(BOB), i(0)), i(0))]},
+        {"id": 4, "level": 12, "target": MARKET, "entrypoint": "swap",
+         "big_map_diffs": [update(3, i(0), swap(ALICE, 0, 2, 5000))]},
+        {"id": 5, "level": 12, "target": MARKET, "entrypoint": "swap_bundle",
+         "big_map_diffs": [update(4, i(0), bundle(ALICE, [(0, 1), (1, 1)],
+                                                   9000))]},
+        {"id": 6, "level": 13, "target": MARKET, "entrypoint": "swap_bundle",
+         "big_map_diffs": [update(4, i(1), bundle(BOB, [(0, 2)], 7000))]},
+        {"id": 7, "level": 13, "target": MARKET,
+         "entrypoint": "collect_bundle",
+         "big_map_diffs": [remove(4, i(1))]},
+        {"id": 8, "level": 14, "target": REGISTER, "entrypoint": "register",
+         "big_map_diffs": [update(5, s(ALICE), {"bytes": "616c696365"}),
+                           update(6, {"bytes": "616c696365"}, s(ALICE))]},
+        {"id": 9, "level": 15, "target": REGISTER, "entrypoint": "register",
+         "big_map_diffs": [remove(5, s(ALICE)),
+                           update(5, s(BOB), {"bytes": "616c696365"})]},
+    ]
+
+
+def check_state(store):
+    assert store.balance(FA2, ALICE, 0) == 6
+    assert store.balance(FA2, BOB, 0) == 4
+    assert store.tokens_of(ALICE) == [(FA2, 0, 6), (FA2, 1, 1)]
+    assert store.is_operator(FA2, ALICE, MARKET, 0)
+    assert not store.is_operator(FA2, ALICE, MARKET, 1)
+    swaps = store.open_swaps(FA2, 0)
+    assert [(sw["swap_id"], sw["objkt_amount"], sw["xtz_per_objkt"])
+            for sw in swaps] == [(0, 2, 5000)]
+    bundles = store.open_bundles(FA2, 0)
+    assert [(b["bundle_id"], b["issuer"], sorted(b["items"]))
+            for b in bundles] == [(0, ALICE, [(0, 1), (1, 1)])]
+    assert store.open_bundles(FA2, 1)[0]["bundle_id"] == 0
+    assert store.resolve(REGISTER, b"alice") == BOB
+    assert store.name_of(REGISTER, ALICE) is None
+    counts = store.counts()
+    assert counts["transfers"] == 1
+    assert counts["bundle_items"] == 2
+
+
+def test_micheline_decoders():
+    assert micheline.address_of_bytes(bytes.fromhex(
+        "000002298c03ed7d454a101eb7022bc95f7e5f41ac78")) == ALICE
+    leaves = [i(1), i(2), i(3)]
+    assert micheline.flatten(pair(i(1), pair(i(2), i(3)))) == leaves
+    assert micheline.flatten(pair(*leaves)) == leaves
+    assert micheline.flatten(leaves) == leaves
+    assert micheline.pair(pair(*leaves)) == [i(1), pair(i(2), i(3))]
+    with pytest.raises(DecodeError):
+        micheline.as_int(s("1"))
+    with pytest.raises(DecodeError):
+        micheline.address_of_bytes(b"\x00\x01")
+
+
+def test_layouts():
+    assert layouts.fa2_ledger_key(pair(s(ALICE), i(3))) == (ALICE, 3)
+    assert layouts.fa2_ledger_key(s(ALICE)) == (ALICE, 0)
+    with pytest.raises(DecodeError):
+        layouts.fa2_ledger_key({"bytes": "0507070a"})
+    assert layouts.market_swap(swap(ALICE, 3, 2, 5000))["royalties"] == 100
+    live = pair(s(ALICE), s(FA2), i(3), i(2), i(5000), s(ALICE))
+    assert layouts.market_swap(live)["royalties"] is None
+    assert layouts.market_bundle(bundle(BOB, [(0, 2)], 7000))["items"] == [(0, 2)]
+
+
+def test_stream():
+    store = Store()
+    indexer = Indexer(store, CONFIG, batch_size=4)
+    indexer.run(stream())
+    check_state(store)
+    assert indexer.applied == 9
+    assert store.checkpoint() == 9
+
+
+def test_bundles_big_map_required():
+    config = {"contracts": dict(CONFIG["contracts"],
+                                **{MARKET: {"kind": "market",
+                                            "big_maps": {"swaps": 3}}})}
+    indexer = Indexer(Store(), config)
+    ops = stream()
+    for op in ops[:4]:
+        indexer.apply(op)
+    with pytest.raises(ValueError):
+        indexer.apply(ops[4])
+    # Diffs naming the bundles big_map by path are indexed.
+    op = dict(ops[4], big_map_diffs=[dict(d, contract=MARKET, path="bundles")
+                                     for d in ops[4]["big_map_diffs"]])
+    for diff in op["big_map_diffs"]:
+        del diff["big_map"]
+    indexer.apply(op)
+    assert indexer.store.open_bundles(FA2, 1)[0]["bundle_id"] == 0
+
+
+def test_resume_from_checkpoint(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    ops = stream()
+    store = Store(path)
+    indexer = Indexer(store, CONFIG, batch_size=2)
+    for op in ops[:5]:
+        indexer.apply(op)
+    # Operation 5 is not committed yet: it is lost with the connection.
+    store.close()
+
+    store = Store(path)
+    assert store.checkpoint() == 4
+    indexer = Indexer(store, CONFIG, batch_size=2)
+    indexer.run(ops)
+    assert indexer.skipped == 4
+    assert indexer.applied == 5
+    check_state(store)
+    store.close()